@@ -1,28 +1,33 @@
 import os
 import io
-import urllib.parse
-import urllib.request
-import urllib.error
 from langchain_openai import ChatOpenAI
 from typing import TypedDict, Annotated, List, Dict, Any
 import json
-from operator import add as list_add
 from langgraph.graph import add_messages, StateGraph, END, START
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langgraph.types import Command, interrupt
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.runnables.utils import accepts_config
+from langchain_core.callbacks import get_usage_metadata_callback
 import uuid
 
 # Miscallenous variables and setup
 
-from huggingface_hub import InferenceClient
 from PIL import Image
 import gradio as gr
 import time
 import copy
 import sys
+import threading
+import asyncio
+import zlib
+import re
+import random
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 # Windows consoles can default to cp1252, which may crash on certain Unicode
 # characters from model outputs. Make printing resilient.
@@ -33,17 +38,88 @@ try:
         sys.stderr.reconfigure(encoding="utf-8", errors="replace")
 except Exception:
     pass
+from blob_store import BlobStore, is_blob_hash
+from image_cache import ImageCache
+from image_providers import ProviderHTTPError, hf_client, pollinations_image
+from image_router import ImageRouter
+from scene_archive import SceneArchive
+from state_snapshots import StateSnapshots
+from story_tree import StoryTree
+from turn_journal import TurnJournal
+from image_scheduler import PRIORITY_CADENCE, PRIORITY_KEY, ImageScheduler, parse_rate_limits
+from llm_cache import LLMCache
+from prompt_budget import (
+    PromptCompiler,
+    Section,
+    count_sentences,
+    cut_after_sentences,
+    estimate_tokens,
+    output_cap,
+    sentence_limit,
+)
+from session_registry import SessionRegistry
+from intro_pool import NAME_PLACEHOLDER, IntroPool, fill_name
 from file_of_prompts import (
     INTEMEDIARY_PROMPT,  # No longer in use but kept for reference
     INTRO_PROMPT_TEMPLATE,
     STORYTELLER_PROMPT_TEMPLATE,
+    STORYTELLER_PREFIX_TEMPLATE,
+    STORYTELLER_TURN_TEMPLATE,
     ADJUDICATION_PROMPT_TEMPLATE,
+    BOOKKEEPING_PROMPT_TEMPLATE,
     IMAGE_PROMPT_BY_SYSTEM,
 )
 CONTINUE_KEY = "__CONTINUE__"
 REWIND_KEY = "__REWIND__"
+# Go forward again onto the branch the last rewind left (no regeneration).
+REDO_KEY = "__REDO__"
+# "__REWIND_TO__:3" jumps back to right after turn 3 (0: the opening) in one step.
+REWIND_TO_KEY = "__REWIND_TO__:"
 MENU_KEY = "__MENU__"
-THREAD_META: Dict[str, Dict[str, Any]] = {}
+# Tag on the storyteller's scene call so streaming can tell it apart from llm2 bookkeeping calls.
+SCENE_STREAM_TAG = "fable_scene"
+# Added to a storyteller retry (see STORYTELLER_RETRY_MAX_TOKENS) so the stream restarts the scene.
+SCENE_RETRY_TAG = "fable_scene_retry"
+# Stream storyteller/intro tokens into the Chatbot (set STREAM_TOKENS=0 to wait for the full scene).
+STREAM_TOKENS = (os.environ.get("STREAM_TOKENS") or "1").strip().lower() not in ("0", "false", "no")
+# Generate images in a background job instead of in front of the user interrupt
+# (set ASYNC_IMAGES=0 to keep the image node on the turn's critical path).
+ASYNC_IMAGES = (os.environ.get("ASYNC_IMAGES") or "1").strip().lower() not in ("0", "false", "no")
+# Per-thread session meta (starter, inputs, turn_records, interrupt cfgs...). Bounded by
+# count, idle time and measured size (including the thread's journal and scene archive, see
+# _thread_log_bytes); evicting a session also drops its checkpoints, journal and archive.
+SESSIONS = SessionRegistry(
+    shards=int(os.environ.get("SESSION_SHARDS") or "16"),
+    max_entries=int(os.environ.get("SESSION_MAX_ENTRIES") or "1000"),
+    max_bytes=int(float(os.environ.get("SESSION_MAX_MB") or "256") * 1024 * 1024),
+    ttl_s=float(os.environ.get("SESSION_TTL_H") or "6") * 3600,
+)
+# Image bytes live here once; state, checkpoints and meta only hold their content hash.
+# IMAGE_BLOB_DIR adds an on-disk tier for blobs the memory LRU has evicted.
+IMAGE_BLOBS = BlobStore(
+    max_memory_bytes=int(float(os.environ.get("IMAGE_BLOB_MEMORY_MB") or "64") * 1024 * 1024),
+    disk_dir=(os.environ.get("IMAGE_BLOB_DIR") or "").strip() or None,
+)
+# Provider responses, keyed by canonical prompt + model/size/seed, so the same picture is
+# never requested twice (rewinds, retries, replays). IMAGE_CACHE_MAX_FILES=0 turns it off.
+IMAGE_CACHE = ImageCache(
+    cache_dir=(os.environ.get("IMAGE_CACHE_DIR") or os.path.join("frontend", "image_cache")).strip(),
+    max_files=int(os.environ.get("IMAGE_CACHE_MAX_FILES") or "300"),
+    max_bytes=int(float(os.environ.get("IMAGE_CACHE_MAX_MB") or "200") * 1024 * 1024),
+)
+# Chat copies of images, named by content hash, that Gradio serves from disk
+# (RUNTIME_IMAGES_MAX_FILES bounds how many are kept).
+RUNTIME_IMAGES_DIR = (os.environ.get("RUNTIME_IMAGES_DIR") or os.path.join("frontend", "runtime_images")).strip()
+# Every image job (inline node or background job) runs on this shared pool: IMAGE_WORKERS
+# at a time, intro/milestone images first, at most IMAGE_QUEUE_MAX waiting (IMAGE_QUEUE_DROP
+# decides what gets dropped when full), and provider requests paced by IMAGE_RATE_LIMITS.
+IMAGE_SCHEDULER = ImageScheduler(
+    workers=int(os.environ.get("IMAGE_WORKERS") or "4"),
+    max_queue=int(os.environ.get("IMAGE_QUEUE_MAX") or "32"),
+    drop_policy=(os.environ.get("IMAGE_QUEUE_DROP") or "oldest").strip().lower(),
+    max_wait_s=float(os.environ.get("IMAGE_QUEUE_MAX_WAIT_S") or "60"),
+    rate_limits=parse_rate_limits(os.environ.get("IMAGE_RATE_LIMITS") or "pollinations=2"),
+)
 # Marker used for one-turn grace period after retrying from GAME OVER.
 # This is intentionally stripped from what the storyteller sees.
 GRACE_PERIOD_INVISIBLE_TELLER = "grace_period:"
@@ -160,18 +236,44 @@ def _append_ui_test_image_message(history: list[dict]) -> None:
     history.append({"role": "assistant", "content": {"path": path}})
 
 
-def _persist_chat_image_bytes(*, image_bytes: bytes, thread_id: str) -> str | None:
-    """Persist PNG bytes under frontend/ so Gradio can serve it; return relative file path."""
+def _resolve_image_bytes(image: Any) -> bytes | None:
+    """Return PNG bytes for an image reference (blob hash) or raw bytes."""
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    if is_blob_hash(image):
+        data = IMAGE_BLOBS.get(image)
+        if data is None:
+            # The chat copy under runtime_images doubles as a last-resort disk tier.
+            try:
+                with open(os.path.join(RUNTIME_IMAGES_DIR, f"{image}.png"), "rb") as f:
+                    data = f.read()
+            except OSError:
+                return None
+        return data
+    return None
+
+
+def _persist_chat_image_bytes(*, image_bytes: Any, thread_id: str) -> str | None:
+    """Persist an image (blob hash or PNG bytes) under RUNTIME_IMAGES_DIR so Gradio can serve it; return its file path.
+
+    Files are named by content hash, so re-showing an image (rewind, replay) reuses the file.
+    """
     if not image_bytes:
         return None
     try:
-        os.makedirs(os.path.join("frontend", "runtime_images"), exist_ok=True)
-        stamp = int(time.time() * 1000)
-        safe_thread = (thread_id or "thread").replace("/", "_").replace("\\", "_")
-        filename = f"{safe_thread}_{stamp}.png"
-        rel_path = os.path.join("frontend", "runtime_images", filename)
+        os.makedirs(RUNTIME_IMAGES_DIR, exist_ok=True)
+        key = image_bytes if is_blob_hash(image_bytes) else IMAGE_BLOBS.put(bytes(image_bytes))
+        rel_path = os.path.join(RUNTIME_IMAGES_DIR, f"{key}.png")
+        if os.path.exists(rel_path):
+            # Refresh mtime so cleanup treats it as recently used.
+            os.utime(rel_path, None)
+            return rel_path
+        data = _resolve_image_bytes(key)
+        if not data:
+            print(f"[chat_image] image {key[:12]} is no longer available (thread {thread_id})")
+            return None
         with open(rel_path, "wb") as f:
-            f.write(image_bytes)
+            f.write(data)
         _cleanup_runtime_images()
         return rel_path
     except Exception as e:
@@ -180,7 +282,7 @@ def _persist_chat_image_bytes(*, image_bytes: bytes, thread_id: str) -> str | No
 
 
 def _cleanup_runtime_images() -> None:
-    """Best-effort cleanup so frontend/runtime_images doesn't grow unbounded."""
+    """Best-effort cleanup so RUNTIME_IMAGES_DIR doesn't grow unbounded."""
     try:
         max_files = int(os.environ.get("RUNTIME_IMAGES_MAX_FILES") or "200")
     except Exception:
@@ -190,7 +292,7 @@ def _cleanup_runtime_images() -> None:
         return
 
     try:
-        dir_path = os.path.join("frontend", "runtime_images")
+        dir_path = RUNTIME_IMAGES_DIR
         if not os.path.isdir(dir_path):
             return
         entries: list[tuple[float, str]] = []
@@ -215,10 +317,10 @@ def _cleanup_runtime_images() -> None:
 
 
 def _append_real_image_message(history: list[dict], *, image_bytes: Any, thread_id: str) -> None:
-    """Append a real generated image to chat history."""
-    if not isinstance(image_bytes, (bytes, bytearray)):
+    """Append a real generated image (blob hash or bytes) to chat history."""
+    if not isinstance(image_bytes, (bytes, bytearray)) and not is_blob_hash(image_bytes):
         return
-    path = _persist_chat_image_bytes(image_bytes=bytes(image_bytes), thread_id=thread_id)
+    path = _persist_chat_image_bytes(image_bytes=image_bytes, thread_id=thread_id)
     if not path:
         return
     history.append({"role": "assistant", "content": {"path": path}})
@@ -238,11 +340,15 @@ def _find_last_assistant_text_index(history: list[dict]) -> int | None:
 
 
 def _image_payload_to_pil(image_payload: Any) -> Any:
-    """Convert a msgpack-serializable image payload (PNG bytes) into a PIL Image for Gradio."""
+    """Convert a msgpack-serializable image payload (blob hash or PNG bytes) into a PIL Image for Gradio."""
     if image_payload is None:
         return None
     if isinstance(image_payload, Image.Image):
         return image_payload
+    if is_blob_hash(image_payload):
+        image_payload = _resolve_image_bytes(image_payload)
+        if image_payload is None:
+            return None
     if isinstance(image_payload, (bytes, bytearray)):
         try:
             return Image.open(io.BytesIO(image_payload))
@@ -272,6 +378,42 @@ try:
     llm = ChatGroq(model="openai/gpt-oss-120b", temperature=0.7, max_tokens=2500)
 except TypeError:
     pass
+
+# Exact-match cache for the small llm2 calls that repeat byte-for-byte (image style rules,
+# image prompts, adjudication of replayed inputs; live turns are never adjudicated from it). Call sites opt in via LLM_CACHE.invoke;
+# LLM_CACHE_SQLITE adds a persistent tier, LLM_CACHE_MAX_ENTRIES=0 turns it off.
+LLM_CACHE = LLMCache(
+    max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES") or "1000"),
+    sqlite_path=(os.environ.get("LLM_CACHE_SQLITE") or "").strip() or None,
+)
+# Per-call input budgets (estimated tokens): the intro, running summary and recent scenes
+# are trimmed to fit, lowest priority first. Output caps come from each call's length rule;
+# the storyteller also gets PROMPT_REASONING_TOKENS because gpt-oss spends output tokens on
+# reasoning before it writes. PROMPTS.stats() has per-call token counts.
+PROMPTS = PromptCompiler(
+    budgets={
+        "storyteller": int(os.environ.get("STORYTELLER_INPUT_BUDGET") or "2000"),
+        "adjudication": int(os.environ.get("JUDGE_INPUT_BUDGET") or "1500"),
+    }
+)
+PROMPT_REASONING_TOKENS = int(os.environ.get("PROMPT_REASONING_TOKENS") or "1024")
+# Reasoning shares that cap, so a scene can still come back empty or cut off
+# (finish_reason "length"); the storyteller then asks once more with the old flat cap.
+STORYTELLER_RETRY_MAX_TOKENS = int(os.environ.get("STORYTELLER_RETRY_MAX_TOKENS") or "2500")
+# Stop conditions for the scene: the provider stops where the model starts writing the
+# player's part, and the stream is closed once a scene runs to SCENE_SENTENCE_STOP times the
+# sentences its length rule asks for (0: never).
+STORY_STOP_SEQUENCES = ["\nPlayer:", "\nUser:", "\nYou:"]
+SCENE_SENTENCE_STOP = float(os.environ.get("SCENE_SENTENCE_STOP") or "2")
+# "stable_prefix" (default): the storyteller gets a per-thread constant SystemMessage
+# (rules, name, theme, role, intro) followed by the per-turn part, so providers that cache
+# prompt prefixes can reuse it turn after turn. "legacy": the original single prompt.
+PROMPT_LAYOUT = (os.environ.get("PROMPT_LAYOUT") or "stable_prefix").strip().lower()
+JUDGE_MAX_TOKENS = 300
+SUMMARY_MAX_TOKENS = 400
+# Scenes are folded into story_summary once, when their unsummarized text reaches this
+# many (estimated) tokens or a milestone comes up, instead of re-summarizing every turn.
+SUMMARY_TRIGGER_TOKENS = int(os.environ.get("SUMMARY_TRIGGER_TOKENS") or "600")
 prompt = ChatPromptTemplate.from_messages([
     ("system", "You are a storyteller guiding an interactive adventure. Keep responses immersive and avoid numbered/bulleted choice menus unless explicitly requested."),
     ("human", "{text}")
@@ -282,34 +424,65 @@ def _make_thread_id():
     return str(uuid.uuid4())
 
 
-def _replay_thread(*, starter: dict, inputs: List[str]) -> tuple[list, str, Any, list[Any]]:
-    """Rebuild a thread by replaying inputs from the same starter into a new thread_id."""
+def _replay_thread(
+    *, starter: dict, inputs: List[str], journal: TurnJournal | None = None
+) -> tuple[list, str, Any, list[Any]]:
+    """Rebuild a thread by replaying inputs from the same starter into a new thread_id.
+
+    With a journal (e.g. TURN_JOURNALS[old_thread_id], whose player inputs are
+    journal.actions("judger_improver")) the nodes return its recorded outputs instead of
+    calling models, as long as the inputs match; turns past it run live.
+    """
     new_thread_id = _make_thread_id()
     cfg = {"configurable": {"thread_id": new_thread_id}}
+    REPLAY_THREADS.add(new_thread_id)
+    if journal is not None:
+        REPLAY_JOURNALS[new_thread_id] = journal
 
-    history: list[dict] = []
-    opening, opening_image = run_until_interrupt(app, starter, config=cfg)
-    history.append({"role": "assistant", "content": opening})
-    if opening_image is not None:
-        _append_real_image_message(history, image_bytes=opening_image, thread_id=new_thread_id)
-    last_image = opening_image
-    images: list[Any] = []
-    if opening_image is not None:
-        images.append(opening_image)
+    def _journaled_background_image() -> Any:
+        # Background images (ASYNC_IMAGES) were written back outside the graph run; do the same.
+        if journal is None or not ASYNC_IMAGES:
+            return None
+        snapshot = app.get_state(cfg)
+        update = journal.replay(*_journal_position(snapshot.values), "image")
+        if not update or update.get("last_image") not in IMAGE_BLOBS:
+            return None
+        if getattr(snapshot, "interrupts", None) and _write_back_to_interrupt(snapshot.config, update):
+            _journal_record(new_thread_id, snapshot.values, "image", update)
+            return update["last_image"]
+        return None
 
-    for msg in inputs:
-        next_scene, new_image = run_until_interrupt(app, Command(resume=msg), config=cfg)
-        if new_image is not None:
-            last_image = new_image
-            images.append(new_image)
-        history.extend(
-            [
-                {"role": "user", "content": "(Continue the story)" if msg == CONTINUE_KEY else msg},
-                {"role": "assistant", "content": next_scene},
-            ]
-        )
-        if new_image is not None:
-            _append_real_image_message(history, image_bytes=new_image, thread_id=new_thread_id)
+    try:
+        history: list[dict] = []
+        opening, opening_image = run_until_interrupt(app, starter, config=cfg)
+        if opening_image is None:
+            opening_image = _journaled_background_image()
+        history.append({"role": "assistant", "content": opening})
+        if opening_image is not None:
+            _append_real_image_message(history, image_bytes=opening_image, thread_id=new_thread_id)
+        last_image = opening_image
+        images: list[Any] = []
+        if opening_image is not None:
+            images.append(opening_image)
+
+        for msg in inputs:
+            next_scene, new_image = run_until_interrupt(app, Command(resume=msg), config=cfg)
+            if new_image is None:
+                new_image = _journaled_background_image()
+            if new_image is not None:
+                last_image = new_image
+                images.append(new_image)
+            history.extend(
+                [
+                    {"role": "user", "content": "(Continue the story)" if msg == CONTINUE_KEY else msg},
+                    {"role": "assistant", "content": next_scene},
+                ]
+            )
+            if new_image is not None:
+                _append_real_image_message(history, image_bytes=new_image, thread_id=new_thread_id)
+    finally:
+        REPLAY_JOURNALS.pop(new_thread_id, None)
+        REPLAY_THREADS.discard(new_thread_id)
 
     return history, new_thread_id, last_image, images
 
@@ -375,7 +548,105 @@ def _clear_pending_writes_for_cfg(cfg: dict) -> None:
         return
 
 
-def _revert_history_by_record(history: list[dict], record: dict) -> list[dict]:
+def _checkpoint_id(cfg: Any) -> str | None:
+    configurable = (cfg or {}).get("configurable") or {} if isinstance(cfg, dict) else {}
+    checkpoint_id = configurable.get("checkpoint_id")
+    return str(checkpoint_id) if checkpoint_id else None
+
+
+def _prune_checkpoints(thread_id: str, meta: dict) -> int:
+    """Delete checkpoints no rewind can reach any more. Call with the thread lock held.
+
+    Keeps the interrupt checkpoints referenced by the last CHECKPOINT_REWIND_DEPTH turn
+    records, the story tree's branches, the pinned cfg, and the newest checkpoint (what
+    get_state(thread) reads).
+    Everything else - the per-node checkpoints between interrupts and older turns -
+    is removed along with its pending writes and the channel blobs only it used.
+    Returns how many checkpoints were deleted.
+    """
+    if CHECKPOINT_REWIND_DEPTH <= 0 or not isinstance(meta, dict):
+        return 0
+    records = list(meta.get("turn_records") or [])
+    if len(records) > CHECKPOINT_REWIND_DEPTH:
+        # Older turns can no longer be rewound to, so their records go too.
+        records = records[-CHECKPOINT_REWIND_DEPTH:]
+        meta["turn_records"] = records
+    keep = {_checkpoint_id(r.get("cfg_before")) for r in records if isinstance(r, dict)}
+    keep |= {_checkpoint_id(meta.get(k)) for k in ("cfg", "last_interrupt_cfg")}
+    keep.add(_checkpoint_id((meta.get("speculation") or {}).get("cfg")))
+    tree = meta.get("story_tree")
+    if tree is not None:
+        # Branches a player can still switch to.
+        keep |= {_checkpoint_id(cfg) for cfg in tree.checkpoint_configs()}
+    keep.discard(None)
+
+    deleted = 0
+    for checkpoint_ns, saved in list((memory.storage.get(thread_id) or {}).items()):
+        if not saved:
+            continue
+        newest = max(saved)
+        drop = [cid for cid in saved if cid not in keep and cid != newest]
+        if not drop:
+            continue
+        kept_versions: set[tuple[str, Any]] = set()
+        dropped_versions: set[tuple[str, Any]] = set()
+        for cid, entry in list(saved.items()):
+            try:
+                versions = (memory.serde.loads_typed(entry[0]).get("channel_versions") or {}).items()
+            except Exception:
+                versions = ()
+            (dropped_versions if cid in drop else kept_versions).update(versions)
+        for cid in drop:
+            saved.pop(cid, None)
+            memory.writes.pop((thread_id, checkpoint_ns, cid), None)
+        for channel, version in dropped_versions - kept_versions:
+            memory.blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+        deleted += len(drop)
+    if deleted:
+        print(f"[checkpoints] pruned {deleted} checkpoints of {thread_id}")
+        ids = meta.get("interrupt_ids") or {}
+        for cid in [cid for cid in ids if cid not in keep]:
+            ids.pop(cid, None)
+    return deleted
+
+
+def _pin_interrupt(meta: dict, snapshot: Any) -> None:
+    """Pin a snapshot that is at the user interrupt as the checkpoint the next turn resumes from."""
+    meta["cfg"] = snapshot.config
+    meta["last_interrupt_cfg"] = snapshot.config
+    # Remember its interrupt id so resuming (now or after a rewind) needn't read the state again.
+    checkpoint_id = _checkpoint_id(snapshot.config)
+    if checkpoint_id and snapshot.interrupts:
+        meta.setdefault("interrupt_ids", {})[checkpoint_id] = snapshot.interrupts[0].id
+
+
+def _resume_command(meta: dict, interrupt_cfg: dict, value: Any, states: StateSnapshots) -> Command:
+    """Resume by interrupt id, so a stale/queued resume value can't land on the wrong interrupt."""
+    interrupt_id = (meta.get("interrupt_ids") or {}).get(_checkpoint_id(interrupt_cfg)) if STATE_SNAPSHOT_CACHE else None
+    if interrupt_id is None:
+        try:
+            interrupts = list(getattr(states.get(interrupt_cfg), "interrupts", None) or [])
+            interrupt_id = interrupts[0].id if interrupts else None
+        except Exception:
+            interrupt_id = None
+    return Command(resume={interrupt_id: value}) if interrupt_id is not None else Command(resume=value)
+
+
+def _chat_texts(history: list[dict]) -> list[str]:
+    """The text messages of a chat history (images left out)."""
+    return [str(m["content"]) for m in history or [] if isinstance(m, dict) and isinstance(m.get("content"), str)]
+
+
+def _history_image_path(item: Any) -> str | None:
+    if isinstance(item, dict) and isinstance(item.get("content"), dict):
+        path = item["content"].get("path")
+        return path if isinstance(path, str) else None
+    return None
+
+
+def _revert_history_by_record(history: list[dict], record: dict, keep_paths: set[str] | None = None) -> list[dict]:
+    """Undo one turn record. keep_paths are images of still-live turns that arrived late
+    (background images) and must survive the truncation."""
     history = list(history or [])
     rtype = record.get("type")
 
@@ -383,7 +654,8 @@ def _revert_history_by_record(history: list[dict], record: dict) -> list[dict]:
         before_len = int(record.get("history_len_before") or 0)
         if before_len < 0:
             before_len = 0
-        return history[:before_len]
+        late_images = [item for item in history[before_len:] if _history_image_path(item) in (keep_paths or set())]
+        return history[:before_len] + late_images
 
     if rtype == "continue":
         idx = record.get("assistant_text_index")
@@ -391,9 +663,16 @@ def _revert_history_by_record(history: list[dict], record: dict) -> list[dict]:
         if isinstance(idx, int) and 0 <= idx < len(history) and isinstance(history[idx], dict):
             history[idx]["content"] = prior_text
         # Remove any appended image message.
+        if record.get("image_path"):
+            # Content-addressed paths can repeat (identical images); drop only the newest copy.
+            for pos in range(len(history) - 1, -1, -1):
+                if _history_image_path(history[pos]) == record.get("image_path"):
+                    del history[pos]
+                    break
+            return history
         if record.get("image_added"):
             # Usually the image is the last message.
-            if history and isinstance(history[-1], dict) and isinstance(history[-1].get("content"), dict) and "path" in history[-1].get("content", {}):
+            if history and _history_image_path(history[-1]):
                 history.pop()
         return history
 
@@ -420,11 +699,71 @@ def _safe_parse_json_object(text: str) -> Dict[str, Any]:
         return {}
 
 
+MAX_NAMED_ENTITIES = 12
+
+
+def _merge_names(left: List[str] | None, right: List[str] | None) -> List[str]:
+    """Reducer for named_entities: ordered union (capped), so parallel branches can both add names."""
+    merged = list(left or [])
+    for name in right or []:
+        if name and name not in merged and len(merged) < MAX_NAMED_ENTITIES:
+            merged.append(name)
+    return merged
+
+
+# Names spotted in recent scenes (bookkeeping) live apart from the judge's named_entities:
+# a newer mention moves a name to the end and the oldest ones drop out, so the capped list
+# of established names never fills up with stray capitalised words.
+MAX_SCENE_NAMES = int(os.environ.get("MAX_SCENE_NAMES") or "12")
+
+
+def _rotate_names(left: List[str] | None, right: List[str] | None) -> List[str]:
+    """Reducer for scene_names: move (or add) each name to the end, keep the newest MAX_SCENE_NAMES."""
+    merged = [name for name in left or [] if name not in (right or [])]
+    merged.extend(name for name in dict.fromkeys(right or []) if name)
+    return merged[-MAX_SCENE_NAMES:] if MAX_SCENE_NAMES > 0 else []
+
+
+# Scenes / actions the situation / your_action channels keep (0: everything), so checkpoints
+# don't grow with the story. Older scenes live on in story_summary and the thread's scene
+# archive (SCENE_ARCHIVES); scene_total / action_total keep counting past the window.
+SITUATION_WINDOW = int(os.environ.get("SITUATION_WINDOW") or "8")
+ACTION_WINDOW = int(os.environ.get("ACTION_WINDOW") or "16")
+
+
+def _window_scenes(left: List[AIMessage] | None, right: Any) -> List[AIMessage]:
+    """Reducer for situation: add_messages, then only the last SITUATION_WINDOW scenes."""
+    merged = add_messages(left or [], right or [])
+    return merged[-SITUATION_WINDOW:] if SITUATION_WINDOW > 0 else merged
+
+
+def _window_actions(left: List[str] | None, right: List[str] | None) -> List[str]:
+    """Reducer for your_action: append, then only the last ACTION_WINDOW actions."""
+    merged = list(left or []) + list(right or [])
+    return merged[-ACTION_WINDOW:] if ACTION_WINDOW > 0 else merged
+
+
+def _add_count(left: int | None, right: int | None) -> int:
+    return int(left or 0) + int(right or 0)
+
+
+def _scene(text: str) -> dict:
+    """Channel update that adds one scene."""
+    return {"situation": [AIMessage(content=text)], "scene_total": 1}
+
+
+def _action(text: str) -> dict:
+    """Channel update that adds one action."""
+    return {"your_action": [text], "action_total": 1}
+
+
 class Story(TypedDict): 
     intro_text: str
     story_summary: str
-    situation: Annotated[List[AIMessage], add_messages]
-    your_action: Annotated[List[str], list_add]
+    situation: Annotated[List[AIMessage], _window_scenes]
+    your_action: Annotated[List[str], _window_actions]
+    scene_total: Annotated[int, _add_count]  # scenes told so far, including those out of the window
+    action_total: Annotated[int, _add_count]  # likewise for your_action
     theme: str
     char_name: str
     role: str
@@ -434,7 +773,8 @@ class Story(TypedDict):
     inventory: List[str]
     turn_count: int
     tension: int
-    named_entities: List[str]
+    named_entities: Annotated[List[str], _merge_names]
+    scene_names: Annotated[List[str], _rotate_names]  # names recent scenes used, newest last
 
     last_action_raw: str
     last_action: str
@@ -443,11 +783,38 @@ class Story(TypedDict):
 
     img_generation_rules: str
     last_image_prompt: str
-    last_image: Any
+    last_image: Any  # content hash in IMAGE_BLOBS, never raw bytes
+    summarized_scenes: int  # how many scenes (counting from the first) are folded into story_summary
+    image_seed: int  # fixed per story so the provider draws consistently (and cache keys repeat)
 
 
-def storyteller(state: Story): 
-    print("at storyteller node")
+# Node outputs computed ahead of time (speculative Continue), keyed by thread_id then node name.
+# A node that finds its entry here returns it instead of calling a model; entries are one-shot.
+PRECOMPUTED_NODE_OUTPUTS: Dict[str, Dict[str, Any]] = {}
+
+
+def _config_thread_id(config: RunnableConfig | None) -> str:
+    return str(((config or {}).get("configurable") or {}).get("thread_id") or "")
+
+
+def _take_precomputed(config: RunnableConfig | None, node: str) -> Any:
+    outputs = PRECOMPUTED_NODE_OUTPUTS.get(_config_thread_id(config))
+    if not outputs:
+        return None
+    return outputs.pop(node, None)
+
+
+def _config_speculation(config: RunnableConfig | None) -> dict | None:
+    """The speculation (see _speculate_continue) a node is running for, if any."""
+    return ((config or {}).get("configurable") or {}).get("speculation")
+
+
+def _storyteller_shortcut(state: Story, config: RunnableConfig | None) -> dict | None:
+    """Output that needs no model call (precomputed scene or the opening intro), else None."""
+    precomputed = _take_precomputed(config, "storyteller")
+    if precomputed is not None:
+        print("[storyteller_node] Using precomputed scene.")
+        return precomputed
 
     # On the very first step of a new adventure, emit the pre-generated long intro
     # so the user actually sees it. No new state variables required.
@@ -456,29 +823,80 @@ def storyteller(state: Story):
         if intro:
             turn_count = int(state.get("turn_count") or 0)
             return {
-                "situation": [AIMessage(content=intro)],
+                **_scene(intro),
                 "turn_count": turn_count + 1,
                 # Intro is a key scene for generating the first image.
                 "is_key_event": True,
             }
-    ai_messages = [m for m in state["situation"] if isinstance(m, AIMessage)]
+    return None
+
+
+def _summary_chain():
+    summarize_prompt = PromptTemplate.from_template(
+        "Summarize/Paraphrase the following storyline into a concise but complete paragraph.\n\n{storyline}"
+    )
+    output_parser = StrOutputParser()
+    return summarize_prompt | llm2.bind(max_tokens=SUMMARY_MAX_TOKENS) | output_parser
+
+
+def _scene_total(state: Story) -> int:
+    scenes = [m for m in state["situation"] if isinstance(m, AIMessage)]
+    return max(int(state.get("scene_total") or 0), len(scenes))
+
+
+def _unsummarized_scenes(state: Story) -> tuple[list[AIMessage], int]:
+    """(scenes not yet folded into story_summary, number of scenes so far)."""
+    scenes = [m for m in state["situation"] if isinstance(m, AIMessage)]
+    total = _scene_total(state)
+    done = state.get("summarized_scenes")
+    if not isinstance(done, int):
+        # Threads from before the counter: their summary covered the last five scenes.
+        done = max(1, total - 5)
+    # situation holds the last len(scenes) of `total` scenes.
+    return scenes[max(0, done - (total - len(scenes))):], total
+
+
+def _pending_scenes(state: Story) -> tuple[str, int]:
+    """(text of the scenes not yet folded into story_summary, number of scenes so far)."""
+    scenes, total = _unsummarized_scenes(state)
+    return "\n\n".join(str(m.content) for m in scenes), total
+
+
+def _summary_due(state: Story, pending: str) -> bool:
+    """Fold scenes in once enough text has piled up, before/after a milestone scene, or
+    before the next scene would push an unsummarized one out of the situation window."""
+    if not pending.strip():
+        return False
+    if int(state.get("progress") or 0) >= 100 or state.get("is_key_event"):
+        return True
+    if SITUATION_WINDOW > 0 and len(_unsummarized_scenes(state)[0]) >= SITUATION_WINDOW - 1:
+        return True
+    return estimate_tokens(pending) >= SUMMARY_TRIGGER_TOKENS
+
+
+def _latest_scenes(state: Story) -> str:
+    """Scenes the storyteller sees verbatim: the unsummarized ones, at least the last scene."""
+    pending, _count = _pending_scenes(state)
+    if pending.strip():
+        return pending
+    scenes = [m for m in state["situation"] if isinstance(m, AIMessage)]
+    return str(scenes[-1].content) if scenes else "(none yet)"
+
+
+def _summarizer_input(state: Story) -> tuple[str, int] | None:
+    """(summary chain input, scene count it covers), or None when no summary is due."""
+    pending, count = _pending_scenes(state)
+    if not _summary_due(state, pending):
+        return None
+    return (
+        f"Current running summary:\n{state['story_summary']}\n\n"
+        f"New scenes to fold in (keep everything important from the summary):\n{pending}",
+        count,
+    )
 
-    if ai_messages:
-        summarize_prompt = PromptTemplate.from_template(
-            "Summarize/Paraphrase the following storyline into a concise but complete paragraph.\n\n{storyline}"
-        )
-        output_parser = StrOutputParser()
-        what_happened = summarize_prompt | llm2 | output_parser
-
-        recent = ai_messages[-5:]
-        recent_text = "\n\n".join(m.content for m in recent)
-        summarizer_input = (
-            f"Foundational intro (do not rewrite, but keep continuity):\n{state.get('intro_text','')}\n\n"
-            f"Current running summary:\n{state['story_summary']}\n\n"
-            f"Recent scenes to incorporate:\n{recent_text}"
-        )
-        state["story_summary"] = what_happened.invoke({"storyline": summarizer_input})
 
+def _storyteller_prompt(state: Story, record: bool = True) -> tuple[list, bool, int, int, str]:
+    """Return (scene prompt messages, is_key_event, turn_count, max_tokens, length_rule) for the next scene."""
     char_name = (state["char_name"] or "Unknown Hero").strip()
     role = (state.get("role") or "Adventurer").strip()
 
@@ -493,7 +911,8 @@ def storyteller(state: Story):
 
     phase = "early" if progress < 34 else ("mid" if progress < 67 else ("late" if progress < 100 else "milestone"))
 
-    named_entities = state.get("named_entities") or []
+    named_entities = list(state.get("named_entities") or [])
+    named_entities += [n for n in state.get("scene_names") or [] if n not in named_entities]
     existing_names = ", ".join(named_entities) if named_entities else "(none yet)"
     turn_count = int(state.get("turn_count")) or 0
     # every 3 turns (but milestones always end with a hook)
@@ -501,43 +920,197 @@ def storyteller(state: Story):
     # every other turn (but milestones may introduce a major new thread)
     allow_new_proper_noun = True if is_key_event else ((turn_count % 2) == 0)
 
-    prompt = STORYTELLER_PROMPT_TEMPLATE.format(
+    max_tokens = output_cap(length_rule, reserve=PROMPT_REASONING_TOKENS)
+    intro = Section("intro_text", state.get("intro_text", ""), priority=0, min_tokens=150, keep="head")
+    summary = Section("story_summary", state["story_summary"], priority=1, min_tokens=250, keep="tail")
+    scenes = Section("recent_scenes", _latest_scenes(state), priority=2, min_tokens=300, keep="tail")
+    turn_fields = dict(
         length_rule=length_rule,
-        char_name=char_name,
-        theme=state["theme"],
-        role=role,
         phase=phase,
         should_ask_question=should_ask_question,
         allow_new_proper_noun=allow_new_proper_noun,
         existing_names=existing_names,
-        intro_text=state.get("intro_text", ""),
-        story_summary=state["story_summary"],
         last_action=last_action if last_action else "(starting the adventure)",
         last_action_raw=last_action_raw if last_action_raw else "(none)",
     )
 
-    continuation = llm.invoke([SystemMessage(content=prompt)]).content
-
+    if PROMPT_LAYOUT == "legacy":
+        prompt = PROMPTS.compile(
+            "storyteller",
+            STORYTELLER_PROMPT_TEMPLATE,
+            # The summary carries continuity; the intro is background and goes first.
+            [intro, summary, scenes],
+            char_name=char_name,
+            theme=state["theme"],
+            role=role,
+            record=record,
+            **turn_fields,
+        )
+        return [SystemMessage(content=prompt)], is_key_event, turn_count, max_tokens, length_rule
+
+    # The prefix may only depend on per-thread values, so the intro's share of the budget is
+    # fixed: what is left after a constant allowance for the turn part and a minimal summary.
+    budget = PROMPTS.budgets.get("storyteller", 0)
+    turn_floor = estimate_tokens(STORYTELLER_TURN_TEMPLATE) + 100 + summary.min_tokens + scenes.min_tokens
+    prefix = PROMPTS.compile(
+        "storyteller_prefix",
+        STORYTELLER_PREFIX_TEMPLATE,
+        [intro],
+        budget=max(1, budget - turn_floor) if budget > 0 else 0,
+        record=record,
+        char_name=char_name,
+        theme=state["theme"],
+        role=role,
+    )
+    turn = PROMPTS.compile(
+        "storyteller",
+        STORYTELLER_TURN_TEMPLATE,
+        [summary, scenes],
+        budget=max(1, budget - estimate_tokens(prefix)) if budget > 0 else 0,
+        record=record,
+        **turn_fields,
+    )
+    return [SystemMessage(content=prefix), HumanMessage(content=turn)], is_key_event, turn_count, max_tokens, length_rule
+
+
+def _scene_attempts(max_tokens: int, length_rule: str, speculation: dict | None = None) -> list[dict]:
+    """One storyteller call per entry: the capped one, then the retry with the old cap."""
+    stop_after = int(sentence_limit(length_rule) * SCENE_SENTENCE_STOP)
+    attempts = [{"max_tokens": max_tokens, "tags": [SCENE_STREAM_TAG]}]
+    if STORYTELLER_RETRY_MAX_TOKENS > max_tokens:
+        attempts.append({"max_tokens": STORYTELLER_RETRY_MAX_TOKENS, "tags": [SCENE_STREAM_TAG, SCENE_RETRY_TAG]})
+    for attempt in attempts:
+        attempt.update(text="", finish_reason=None, stop_after=stop_after, speculation=speculation)
+    return attempts
+
+
+def _absorb_scene_chunk(attempt: dict, chunk: Any) -> bool:
+    """Add one streamed chunk to the attempt; False when a stop condition ends it early."""
+    speculation = attempt["speculation"]
+    if speculation is not None and speculation.get("cancelled"):
+        # future.cancel() can't stop a speculation that is already running; this does.
+        raise CancelledError("speculation discarded")
+    attempt["text"] += str(chunk.content or "")
+    if speculation is None:
+        PROMPTS.record_usage("storyteller", getattr(chunk, "usage_metadata", None))
+    finish_reason = (getattr(chunk, "response_metadata", None) or {}).get("finish_reason")
+    if finish_reason:
+        attempt["finish_reason"] = finish_reason
+    if attempt["stop_after"] > 0 and count_sentences(attempt["text"]) >= attempt["stop_after"]:
+        attempt["text"] = cut_after_sentences(attempt["text"], attempt["stop_after"])
+        attempt["finish_reason"] = "sentences"
+        print(f"[storyteller_node] scene stopped after {attempt['stop_after']} sentences")
+        return False
+    return True
+
+
+def _scene_finished(attempt: dict) -> bool:
+    """Record the attempt's output; False when it came back empty or cut off by max_tokens."""
+    if attempt["speculation"] is None:
+        PROMPTS.record_output("storyteller", attempt["text"], attempt["max_tokens"])
+    if attempt["text"].strip() and attempt["finish_reason"] != "length":
+        return True
+    problem = "cut off" if attempt["text"].strip() else "empty"
+    print(f"[storyteller_node] scene {problem} at max_tokens={attempt['max_tokens']}")
+    return False
+
+
+def _storyteller_update(state: Story, continuation: str, is_key_event: bool, turn_count: int) -> dict:
+    # Without a bookkeeping node (see BOOKKEEPING_NODE) the scene's names are recorded here.
+    names = _scene_names_update(state, continuation) if PARALLEL_BOOKKEEPING and not BOOKKEEPING_NODE else {}
     if is_key_event:
         print("[storyteller_node] Milestone scene generated. Resetting progress.")
         return {
-            "situation": [AIMessage(content=continuation)],
+            **_scene(continuation),
             "turn_count": turn_count + 1,
             "progress": 0,
             # Preserve milestone info for the image node (progress is reset here).
             "is_key_event": True,
+            **names,
         }
 
     print(f"[storyteller_node] Generated situation:\n{continuation}\n")
     return {
-       "situation": [AIMessage(content=continuation)],
+       **_scene(continuation),
        "turn_count": turn_count + 1,
          "is_key_event": False,
+       **names,
     }
 
 
-def judger_improver(state: Story):
+def storyteller(state: Story, config: RunnableConfig | None = None): 
+    print("at storyteller node")
+    shortcut = _storyteller_shortcut(state, config)
+    if shortcut is not None:
+        return shortcut
+
+    summary_update: dict = {}
+    summarizer_input = _summarizer_input(state)
+    if summarizer_input is not None:
+        # Only reached when judger_improver didn't fold the scenes in (fast path, unfused
+        # mode, milestone, or a reply without a summary).
+        storyline, scene_count = summarizer_input
+        summary = _summary_chain().invoke({"storyline": storyline})
+        summary_update = {"story_summary": summary, "summarized_scenes": scene_count}
+        state = {**state, **summary_update}
+
+    speculation = _config_speculation(config)
+    messages, is_key_event, turn_count, max_tokens, length_rule = _storyteller_prompt(state, record=speculation is None)
+    # Stream the scene so run_until_interrupt can forward tokens to the UI as they arrive.
+    for attempt in _scene_attempts(max_tokens, length_rule, speculation):
+        stream = llm.stream(
+            messages, config={"tags": attempt["tags"]}, max_tokens=attempt["max_tokens"], stop=STORY_STOP_SEQUENCES
+        )
+        try:
+            for chunk in stream:
+                if not _absorb_scene_chunk(attempt, chunk):
+                    break
+        finally:
+            # Closing the generator closes the llm.stream response, stopping generation.
+            stream.close()
+        if _scene_finished(attempt):
+            break
+    continuation = attempt["text"]
+    return {**_storyteller_update(state, continuation, is_key_event, turn_count), **summary_update}
+
+
+async def astoryteller(state: Story, config: RunnableConfig | None = None):
+    """Async storyteller for app.astream (ASYNC_GRAPH): same steps, awaiting the model calls."""
+    print("at storyteller node")
+    shortcut = _storyteller_shortcut(state, config)
+    if shortcut is not None:
+        return shortcut
+
+    summary_update: dict = {}
+    summarizer_input = _summarizer_input(state)
+    if summarizer_input is not None:
+        # Only reached when judger_improver didn't fold the scenes in (fast path, unfused
+        # mode, milestone, or a reply without a summary).
+        storyline, scene_count = summarizer_input
+        summary = await _summary_chain().ainvoke({"storyline": storyline})
+        summary_update = {"story_summary": summary, "summarized_scenes": scene_count}
+        state = {**state, **summary_update}
+
+    speculation = _config_speculation(config)
+    messages, is_key_event, turn_count, max_tokens, length_rule = _storyteller_prompt(state, record=speculation is None)
+    for attempt in _scene_attempts(max_tokens, length_rule, speculation):
+        stream = llm.astream(
+            messages, config={"tags": attempt["tags"]}, max_tokens=attempt["max_tokens"], stop=STORY_STOP_SEQUENCES
+        )
+        try:
+            async for chunk in stream:
+                if not _absorb_scene_chunk(attempt, chunk):
+                    break
+        finally:
+            await stream.aclose()
+        if _scene_finished(attempt):
+            break
+    continuation = attempt["text"]
+    return {**_storyteller_update(state, continuation, is_key_event, turn_count), **summary_update}
+
 
+def _adjudication_action(state: Story) -> tuple[str, bool]:
+    """(raw action to judge, grace_turn), without building the prompt."""
     raw_action = (state.get("last_action_raw") or "(no raw action)")
     grace_turn = False
     if isinstance(raw_action, str) and raw_action.startswith(GRACE_PERIOD_INVISIBLE_TELLER):
@@ -548,7 +1121,16 @@ def judger_improver(state: Story):
     # If user said nothing, it is a continue
     if not raw_action:
         raw_action = CONTINUE_KEY
+    return raw_action, grace_turn
+
+
+def _adjudication_prompt(state: Story, record: bool = True) -> tuple[str, str, bool, int]:
+    """Return (adjudication prompt, raw action, grace_turn, max_tokens).
 
+    With FUSED_BOOKKEEPING, on turns where a summary is due, the prompt also asks for the
+    updated story_summary, which _apply_verdict hands on so storyteller can skip its own call.
+    """
+    raw_action, grace_turn = _adjudication_action(state)
     tension = int(state.get("tension") or 3)
     progress = int(state.get("progress") or 0)
     turn_count = int(state.get("turn_count") or 0)
@@ -556,18 +1138,43 @@ def judger_improver(state: Story):
     theme = state.get("theme") or "fantasy"
     char_name = (state.get("char_name") or "Unknown Hero").strip()
 
-    adjudication_prompt = ADJUDICATION_PROMPT_TEMPLATE.format(
+    fields = dict(
         char_name=char_name,
         theme=theme,
         tension=tension,
         progress=progress,
         turn_count=turn_count,
         allow_new_proper_noun=allow_new_proper_noun,
-        story_summary=state.get("story_summary", ""),
         raw_action=raw_action,
     )
+    summary = Section("story_summary", state.get("story_summary", ""), priority=1, min_tokens=200, keep="tail")
+    pending, _count = _pending_scenes(state)
+    scenes = Section("recent_scenes", pending or "(none)", priority=2, min_tokens=300, keep="tail")
+    if FUSED_BOOKKEEPING and _summary_due(state, pending):
+        adjudication_prompt = PROMPTS.compile(
+            "adjudication",
+            BOOKKEEPING_PROMPT_TEMPLATE,
+            [
+                Section("intro_text", state.get("intro_text", ""), priority=0, min_tokens=100, keep="head"),
+                summary,
+                scenes,
+            ],
+            record=record,
+            **fields,
+        )
+        return adjudication_prompt, raw_action, grace_turn, JUDGE_MAX_TOKENS + SUMMARY_MAX_TOKENS
+
+    adjudication_prompt = PROMPTS.compile(
+        "adjudication", ADJUDICATION_PROMPT_TEMPLATE, [summary, scenes], record=record, **fields
+    )
+    return adjudication_prompt, raw_action, grace_turn, JUDGE_MAX_TOKENS
+
 
-    raw = llm2.invoke([SystemMessage(content=adjudication_prompt)]).content
+def _apply_verdict(state: Story, raw: str, raw_action: str, grace_turn: bool) -> Command:
+    tension = int(state.get("tension") or 3)
+    progress = int(state.get("progress") or 0)
+    turn_count = int(state.get("turn_count") or 0)
+    allow_new_proper_noun = ((turn_count % 2) == 0)
     obj = _safe_parse_json_object(raw)
 
     verdict = str(obj.get("verdict") or "ok").strip().lower()
@@ -606,12 +1213,19 @@ def judger_improver(state: Story):
     named_entities = list(state.get("named_entities") or [])
     if not allow_new_proper_noun:
         new_name = ""
-    if new_name and (new_name not in named_entities) and (len(named_entities) < 12):
+    if new_name and (new_name not in named_entities) and (len(named_entities) < MAX_NAMED_ENTITIES):
         named_entities.append(new_name)
 
     if resolved_action.upper() == "CONTINUE" or resolved_action == CONTINUE_KEY:
         resolved_action = CONTINUE_KEY
 
+    # Fused bookkeeping reply: pass the summary on so storyteller doesn't make its own call.
+    summary_update: dict = {}
+    story_summary = obj.get("story_summary")
+    if isinstance(story_summary, str) and story_summary.strip():
+        _pending, scene_count = _pending_scenes(state)
+        summary_update = {"story_summary": story_summary.strip(), "summarized_scenes": scene_count}
+
     # Get consequence blurb that the storyteller must incorporate.
     consequence_blurb = ("" if not consequence else f"Immediate consequence: {consequence}")
 
@@ -622,12 +1236,13 @@ def judger_improver(state: Story):
         )
         return Command(
             update={
-                "situation": [AIMessage(content=game_over_text)],
-                "your_action": [resolved_action],
+                **_scene(game_over_text),
+                **_action(resolved_action),
                 "last_action": resolved_action,
                 "tension": new_tension,
                 "progress": new_progress,
                 "named_entities": named_entities,
+                **summary_update,
             },
             goto="end",
         )
@@ -642,16 +1257,188 @@ def judger_improver(state: Story):
     print("DEBUG: progreess is ", new_progress)
     return Command(
         update={
-            "your_action": [resolved_action],
+            **_action(resolved_action),
             "last_action": resolved_action,
             "tension": new_tension,
             "progress": new_progress,
             "named_entities": named_entities,
+            **summary_update,
         },
         goto="storyteller",
     )
 
 
+# One llm2 call per turn returns the verdict and the updated summary together (see
+# BOOKKEEPING_PROMPT_TEMPLATE) instead of a separate summary call inside storyteller.
+# FUSED_BOOKKEEPING=0 goes back to the two calls.
+FUSED_BOOKKEEPING = (os.environ.get("FUSED_BOOKKEEPING") or "1").strip().lower() in ("1", "true", "yes")
+
+
+# Fast path: Continue, empty input and short harmless actions ("look around", "ask the
+# guard about the ship") are adjudicated locally instead of by llm2. JUDGER_FAST_PATH:
+#   off    - always ask the model
+#   shadow - ask the model, but log whether the local verdict would have agreed (default)
+#   on     - use the local verdict and skip the model call
+# The default never skips the model: switch to "on" once fast_path_stats() shows the shadow
+# verdicts agree often enough.
+JUDGER_FAST_PATH = (os.environ.get("JUDGER_FAST_PATH") or "shadow").strip().lower()
+FAST_PATH_MAX_WORDS = 8
+_FAST_PATH_VERBS = frozenset({
+    "look", "search", "examine", "inspect", "check", "study", "read", "listen", "watch", "observe",
+    "wait", "rest", "sit", "think", "remember", "ask", "talk", "speak", "say", "greet", "call",
+    "walk", "go", "head", "follow", "approach", "enter", "continue", "explore", "knock", "hide",
+    "sneak", "pray",
+})
+# Handling things is only harmless in a harmless place: these verbs take the fast path when
+# neither the action nor the current scene mentions a hazard ("open the airlock" does not).
+_FAST_PATH_HANDLING_VERBS = frozenset({"open", "pick", "take", "grab", "put", "light", "eat", "drink"})
+_FAST_PATH_HAZARDS = frozenset({
+    "airlock", "hatch", "vacuum", "trap", "trapped", "poison", "poisoned", "toxic", "acid", "fire",
+    "flame", "flames", "smoke", "gas", "fuel", "explosive", "bomb", "alarm", "guard", "guards",
+    "enemy", "enemies", "monster", "beast", "creature", "danger", "dangerous", "curse", "cursed",
+    "collapse", "collapsing", "crumbling", "pressure", "radiation", "lava", "bait", "warning",
+    "hostile", "venom", "venomous", "sealed", "forbidden",
+})
+_FAST_PATH_RISKY = frozenset({
+    "attack", "kill", "stab", "shoot", "fire", "fight", "punch", "kick", "slash", "strike", "murder",
+    "jump", "leap", "dive", "fall", "climb", "cliff", "edge", "ledge", "abyss", "lava", "explode",
+    "bomb", "burn", "poison", "die", "death", "suicide", "myself", "throat", "steal", "rob", "betray",
+    "blood", "weapon", "gun", "sword", "knife", "detonate", "drown", "naked", "everyone", "god",
+    "invincible", "teleport", "win", "end", "ending", "dragon", "boss", "king", "queen",
+})
+FAST_PATH_STATS: Dict[str, int] = {"fast": 0, "llm": 0, "shadow_compared": 0, "shadow_agreed": 0}
+_FAST_PATH_LOCK = threading.Lock()
+
+
+def fast_path_stats() -> Dict[str, Any]:
+    """Counters for JUDGER_FAST_PATH (agreement = shadow_agreed / shadow_compared)."""
+    with _FAST_PATH_LOCK:
+        stats: Dict[str, Any] = dict(FAST_PATH_STATS)
+    compared = stats["shadow_compared"]
+    stats["agreement"] = (stats["shadow_agreed"] / compared) if compared else 0.0
+    return stats
+
+
+def _bump_fast_path_stat(key: str) -> None:
+    with _FAST_PATH_LOCK:
+        FAST_PATH_STATS[key] = FAST_PATH_STATS.get(key, 0) + 1
+
+
+def _fast_verdict(raw_action: str, scene: str = "") -> str | None:
+    """Verdict JSON (same shape as llm2's) for turns that need no judgement, else None.
+
+    scene is the latest scene text, checked for hazards before a handling verb is let through.
+    """
+    if raw_action == CONTINUE_KEY:
+        # Same progress a Continue gets from the model path (see _apply_verdict).
+        return json.dumps({
+            "verdict": "ok", "resolved_action": CONTINUE_KEY, "consequence": "",
+            "tension_change": 0, "progress_change": 4, "new_name": "",
+        })
+    tokens = raw_action.split()
+    if not tokens or len(tokens) > FAST_PATH_MAX_WORDS or any(ch.isdigit() for ch in raw_action):
+        return None
+    # A capitalised word past the first may be a new proper noun; leave that to the model.
+    if any(t[:1].isupper() and t != "I" for t in tokens[1:]):
+        return None
+    words = re.findall(r"[a-z]+", raw_action.lower())
+    if words[:1] == ["i"]:
+        words = words[1:]
+    if not words or any(w in _FAST_PATH_RISKY or w in _FAST_PATH_HAZARDS for w in words):
+        return None
+    if words[0] in _FAST_PATH_HANDLING_VERBS:
+        if any(w in _FAST_PATH_HAZARDS for w in re.findall(r"[a-z]+", (scene or "").lower())):
+            return None
+    elif words[0] not in _FAST_PATH_VERBS:
+        return None
+    return json.dumps({
+        "verdict": "ok", "resolved_action": raw_action, "consequence": "",
+        "tension_change": 0, "progress_change": 3, "new_name": "",
+    })
+
+
+def _shadow_compare(fast: str, raw: str, raw_action: str) -> None:
+    local, remote = _safe_parse_json_object(fast), _safe_parse_json_object(raw)
+    local_verdict = str(local.get("verdict") or "ok").strip().lower()
+    remote_verdict = str(remote.get("verdict") or "ok").strip().lower()
+    agreed = local_verdict == remote_verdict
+    _bump_fast_path_stat("shadow_compared")
+    if agreed:
+        _bump_fast_path_stat("shadow_agreed")
+    print(
+        f"[judger_fast_path] shadow {'agree' if agreed else 'DISAGREE'}: {raw_action[:60]!r} "
+        f"local={local_verdict}/+{local.get('progress_change')} llm={remote_verdict}/+{remote.get('progress_change')}"
+    )
+
+
+def _local_adjudication(raw_action: str, state: Story, record: bool = True) -> tuple[str | None, str | None]:
+    """(verdict to use instead of the model, verdict to shadow-compare against it).
+
+    record=False (speculative calls) leaves FAST_PATH_STATS alone and skips the shadow check.
+    """
+    if JUDGER_FAST_PATH not in ("on", "shadow"):
+        return None, None
+    scenes = [m for m in state.get("situation") or [] if isinstance(m, AIMessage)]
+    fast = _fast_verdict(raw_action, str(scenes[-1].content) if scenes else "")
+    if fast is not None and JUDGER_FAST_PATH == "on":
+        if record:
+            _bump_fast_path_stat("fast")
+        return fast, None
+    return None, (fast if record else None)
+
+
+def judger_improver(state: Story, config: RunnableConfig | None = None):
+    precomputed = _take_precomputed(config, "judger_improver")
+    if precomputed is not None:
+        return precomputed
+    # The prompt is only compiled (and counted in PROMPTS.stats) when the model is called.
+    raw_action, grace_turn = _adjudication_action(state)
+    # A speculative Continue may be thrown away, so it stays out of the stats.
+    record = _config_speculation(config) is None
+    local, shadow = _local_adjudication(raw_action, state, record)
+    if local is not None:
+        return _apply_verdict(state, local, raw_action, grace_turn)
+    adjudication_prompt, raw_action, grace_turn, max_tokens = _adjudication_prompt(state, record)
+    if record:
+        _bump_fast_path_stat("llm")
+    messages = [SystemMessage(content=adjudication_prompt)]
+    if _config_thread_id(config) in REPLAY_THREADS:
+        raw = LLM_CACHE.invoke(llm2, messages, site="adjudication", max_tokens=max_tokens).content
+    else:
+        raw = llm2.invoke(messages, max_tokens=max_tokens).content
+    if record:
+        PROMPTS.record_output("adjudication", raw, max_tokens)
+    if shadow is not None:
+        _shadow_compare(shadow, raw, raw_action)
+    return _apply_verdict(state, raw, raw_action, grace_turn)
+
+
+async def ajudger_improver(state: Story, config: RunnableConfig | None = None):
+    precomputed = _take_precomputed(config, "judger_improver")
+    if precomputed is not None:
+        return precomputed
+    # The prompt is only compiled (and counted in PROMPTS.stats) when the model is called.
+    raw_action, grace_turn = _adjudication_action(state)
+    # A speculative Continue may be thrown away, so it stays out of the stats.
+    record = _config_speculation(config) is None
+    local, shadow = _local_adjudication(raw_action, state, record)
+    if local is not None:
+        return _apply_verdict(state, local, raw_action, grace_turn)
+    adjudication_prompt, raw_action, grace_turn, max_tokens = _adjudication_prompt(state, record)
+    if record:
+        _bump_fast_path_stat("llm")
+    messages = [SystemMessage(content=adjudication_prompt)]
+    if _config_thread_id(config) in REPLAY_THREADS:
+        raw = (await LLM_CACHE.ainvoke(llm2, messages, site="adjudication", max_tokens=max_tokens)).content
+    else:
+        raw = (await llm2.ainvoke(messages, max_tokens=max_tokens)).content
+    if record:
+        PROMPTS.record_output("adjudication", raw, max_tokens)
+    if shadow is not None:
+        _shadow_compare(shadow, raw, raw_action)
+    return _apply_verdict(state, raw, raw_action, grace_turn)
+
+
 def user(state: Story): 
     
     situation = state["situation"]
@@ -669,30 +1456,102 @@ def user(state: Story):
         your_action_interrupt = CONTINUE_KEY
 
     if your_action_interrupt.lower() in ["done", "bye", "quit"]:
-        return Command(update={"your_action": ["Story done"], "last_action_raw": "done", "last_action": "done"}, goto="end")
+        return Command(update={**_action("Story done"), "last_action_raw": "done", "last_action": "done"}, goto="end")
 
     return Command(
         update={
-            "your_action": [your_action_interrupt],
+            **_action(your_action_interrupt),
             "last_action_raw": your_action_interrupt,
         },
         goto="judger_improver",
     )
 
 
-def get_image(state: Story):
+def _should_generate_image(state: Story) -> bool:
+    turn = int(state.get("turn_count") or 0)
+    # Cadence: intro/milestone scenes always generate; otherwise generate every 3 turns.
+    # (turn_count is incremented in storyteller, so intro is typically turn==1.)
+    return bool(state.get("is_key_event")) or ((turn % 3) == 1)
+
+
+def _image_seed(state: Story) -> int:
+    seed = state.get("image_seed")
+    if isinstance(seed, int) and seed > 0:
+        return seed
+    # Stories started before image_seed existed: derive one from the opening so it stays put.
+    return zlib.crc32(str(state.get("intro_text") or "").encode("utf-8")) & 0x7FFFFFFF
+
+
+# Image providers, in order of preference (IMAGE_PROVIDERS). IMAGE_ROUTER hedges a slow
+# request with the next provider and skips a failing one for a cool-down window; see
+# image_router.py. HF is off unless listed, since it costs money per image.
+POLLINATIONS_MODEL = "turbo"
+HF_IMAGE_MODEL = "black-forest-labs/FLUX.1-schnell"
+
+
+def _pollinations_provider(prompt: str, *, width: int, height: int, seed: int | None) -> bytes:
+    # Shared keep-alive client with timeouts and retries (see image_providers.py).
+    IMAGE_SCHEDULER.throttle("pollinations")
+    try:
+        data, _content_type = pollinations_image(
+            prompt,
+            model=POLLINATIONS_MODEL,
+            width=width,
+            height=height,
+            api_key=os.environ.get("POLLINATIONS_API_KEY") or "",
+            seed=seed,
+            # Keep defaults conservative; can be tuned later.
+            safe=True,
+        )
+    except ProviderHTTPError as e:
+        raise RuntimeError(f"Pollinations {e}")
+    return data
 
-    print("[image_node] At image node")
 
+def _hf_provider(prompt: str, *, width: int, height: int, seed: int | None) -> bytes:
     hf_token = os.environ.get("HF_TOKEN")
-    client = InferenceClient(provider="nebius", api_key=hf_token) if hf_token else None
+    if not hf_token:
+        raise RuntimeError("HF_TOKEN not set")
+    IMAGE_SCHEDULER.throttle("hf")
+    image = hf_client(hf_token).text_to_image(
+        prompt,
+        model=HF_IMAGE_MODEL,
+        width=width,
+        height=height,
+        seed=seed,
+    )
+    # IMPORTANT: Do NOT store a PIL Image in LangGraph state.
+    # MemorySaver checkpoints serialize state via msgpack and PIL objects are not serializable.
+    buf = io.BytesIO()
+    try:
+        image.convert("RGB").save(buf, format="PNG", optimize=True)
+    except Exception:
+        image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+IMAGE_PROVIDERS = {"pollinations": _pollinations_provider, "hf": _hf_provider}
+# What each provider's images are cached under, so one provider's picture is never served
+# as another's.
+IMAGE_PROVIDER_MODELS = {"pollinations": f"pollinations/{POLLINATIONS_MODEL}", "hf": f"hf/{HF_IMAGE_MODEL}"}
+IMAGE_ROUTER = ImageRouter(
+    hedge_percentile=float(os.environ.get("IMAGE_HEDGE_PERCENTILE") or "90"),
+    hedge_default_s=float(os.environ.get("IMAGE_HEDGE_DEFAULT_S") or "10"),
+    breaker_failures=int(os.environ.get("IMAGE_BREAKER_FAILURES") or "3"),
+    breaker_cooldown_s=float(os.environ.get("IMAGE_BREAKER_COOLDOWN_S") or "60"),
+)
+for _name in (os.environ.get("IMAGE_PROVIDERS") or "pollinations").split(","):
+    if _name.strip() in IMAGE_PROVIDERS:
+        IMAGE_ROUTER.add_provider(_name.strip(), IMAGE_PROVIDERS[_name.strip()])
+    elif _name.strip():
+        print(f"[image_router] unknown image provider {_name.strip()!r} in IMAGE_PROVIDERS")
 
-    turn = int(state.get("turn_count")) or 0
-    # Cadence: intro/milestone scenes always generate; otherwise generate every 3 turns.
-    # (turn_count is incremented in storyteller, so intro is typically turn==1.)
-    should_generate_image = bool(state.get("is_key_event")) or ((turn % 3) == 1)
 
-    if should_generate_image:
+def get_image(state: Story):
+
+    print("[image_node] At image node")
+
+    if _should_generate_image(state):
         scene_text = ""
         try:
             scene_text = str(state.get("situation")[-1].content)
@@ -741,7 +1600,7 @@ def get_image(state: Story):
                 + "Intro (for vibe only; do not copy names/phrases):\n"
                 + f"{_clamp_line((state.get('intro_text') or '').strip(), 500)}"
             )
-            img_generation_rules = llm2.invoke([SystemMessage(content=rule_prompt)]).content
+            img_generation_rules = LLM_CACHE.invoke(llm2, [SystemMessage(content=rule_prompt)], site="image_rules").content
 
         img_generation_rules = _clamp_rules(img_generation_rules)
 
@@ -774,8 +1633,10 @@ def get_image(state: Story):
             "Now output ONLY the prompt line."
         )
 
-        image_prompt = llm2.invoke(
-            [SystemMessage(content=IMAGE_PROMPT_BY_SYSTEM), HumanMessage(content=image_prompt_human)]
+        image_prompt = LLM_CACHE.invoke(
+            llm2,
+            [SystemMessage(content=IMAGE_PROMPT_BY_SYSTEM), HumanMessage(content=image_prompt_human)],
+            site="image_prompt",
         ).content.strip()
 
         # Ensure the user-selected style preset is always included.
@@ -802,77 +1663,31 @@ def get_image(state: Story):
             except Exception:
                 return raw
 
-        def _pollinations_text_to_image_bytes(prompt_text: str) -> bytes:
-            api_key = (os.environ.get("POLLINATIONS_API_KEY") or "").strip()
-            base = "https://gen.pollinations.ai/image/"
-            encoded_prompt = urllib.parse.quote((prompt_text or "").strip(), safe="")
-            params: dict[str, str] = {
-                "model": "turbo",
-                "width": str(int(os.environ.get("POLLINATIONS_WIDTH") or "768")),
-                "height": str(int(os.environ.get("POLLINATIONS_HEIGHT") or "768")),
-                # Keep defaults conservative; can be tuned later.
-                "safe": "true",
-            }
-            headers: dict[str, str] = {
-                "User-Agent": "FableFriend/1.0",
-            }
-            if api_key:
-                if api_key.startswith("sk_"):
-                    headers["Authorization"] = f"Bearer {api_key}"
-                elif api_key.startswith("pk_"):
-                    params["key"] = api_key
-
-            url = base + encoded_prompt + "?" + urllib.parse.urlencode(params)
-            req = urllib.request.Request(url, headers=headers, method="GET")
-            try:
-                with urllib.request.urlopen(req, timeout=60) as resp:
-                    data = resp.read()
-            except urllib.error.HTTPError as e:
-                body = ""
-                try:
-                    body = e.read().decode("utf-8", errors="ignore")
-                except Exception:
-                    pass
-                raise RuntimeError(f"Pollinations HTTP {getattr(e, 'code', '?')}: {body[:300]}")
-            return _ensure_png_bytes(data)
-
-        image_bytes: bytes | None = None
-        hf_error: Exception | None = None
-
-        # Primary: Hugging Face inference
-        if client is None:
-            print("[image_node] HF_TOKEN not set; will try Pollinations fallback")
-        elif False:  # Disable HF for now due to cost
-            try:
-                image = client.text_to_image(
-                    image_prompt,
-                    model="black-forest-labs/FLUX.1-schnell",
-                )
+        width = int(os.environ.get("POLLINATIONS_WIDTH") or "768")
+        height = int(os.environ.get("POLLINATIONS_HEIGHT") or "768")
+        seed = _image_seed(state)
 
-                # IMPORTANT: Do NOT store a PIL Image in LangGraph state.
-                # MemorySaver checkpoints serialize state via msgpack and PIL objects are not serializable.
-                buf = io.BytesIO()
-                try:
-                    image.convert("RGB").save(buf, format="PNG", optimize=True)
-                except Exception:
-                    image.save(buf, format="PNG")
-                image_bytes = buf.getvalue()
-            except Exception as e:
-                hf_error = e
-                print(f"[image_node] HF image generation failed; falling back to Pollinations: {e}")
+        def _cache_key(provider: str) -> str:
+            model = IMAGE_PROVIDER_MODELS.get(provider, provider)
+            return IMAGE_CACHE.key(image_prompt, model=model, width=width, height=height, seed=seed)
 
-        # Fallback: Pollinations with the SAME prompt
-        if not image_bytes or True:
+        # One key per routed provider, in the router's order of preference.
+        cache_key, image_bytes = IMAGE_CACHE.get_first([_cache_key(name) for name in IMAGE_ROUTER.provider_names()])
+        if image_bytes:
+            stats = IMAGE_CACHE.stats()
+            print(f"[image_cache] hit {cache_key[:12]} (hit rate {stats['hit_rate']:.0%}, {stats['files']} files)")
+        else:
             try:
-                image_bytes = _pollinations_text_to_image_bytes(image_prompt)
+                image_bytes, provider = IMAGE_ROUTER.generate(image_prompt, width=width, height=height, seed=seed)
             except Exception as e:
-                print(f"[image_node] Pollinations fallback failed: {e}")
-                if hf_error:
-                    print(f"[image_node] Original HF error: {hf_error}")
+                print(f"[image_node] image generation failed: {e}")
                 return {}
+            print(f"[image_node] image from {provider}")
+            image_bytes = _ensure_png_bytes(image_bytes)
+            IMAGE_CACHE.put(_cache_key(provider), image_bytes)
 
         return {
-            "last_image": image_bytes,
+            "last_image": IMAGE_BLOBS.put(image_bytes),
             "last_image_prompt": image_prompt,
             "img_generation_rules": img_generation_rules,
             # Reset key-scene flag
@@ -883,31 +1698,262 @@ def get_image(state: Story):
         return {}
 
 
+def _image_priority(state: Story) -> int:
+    return PRIORITY_KEY if state.get("is_key_event") else PRIORITY_CADENCE
+
+
+def image_node(state: Story):
+    """get_image on the shared image pool; the graph's "image" node when images are inline."""
+    if not _should_generate_image(state):
+        return get_image(state)
+    try:
+        return IMAGE_SCHEDULER.submit(get_image, state, priority=_image_priority(state)).result()
+    except CancelledError:
+        print("[image_node] image job dropped by the scheduler; no image this turn")
+        return {}
+
+
+async def aimage_node(state: Story):
+    # The image providers are still blocking HTTP; the pool keeps them off the event loop.
+    if not _should_generate_image(state):
+        return get_image(state)
+    try:
+        return await asyncio.wrap_future(IMAGE_SCHEDULER.submit(get_image, state, priority=_image_priority(state)))
+    except CancelledError:
+        print("[image_node] image job dropped by the scheduler; no image this turn")
+        return {}
+
+
+# Post-scene bookkeeping runs as its own branch next to the image node (both join before
+# "user"): it records names the new scene used (scene_names) and, when a summary is due on a
+# turn whose image is generated inline, folds the scenes in while the image is being made.
+# Otherwise the summary is left to the next judger_improver call (FUSED_BOOKKEEPING), which
+# costs no extra round trip. Under ASYNC_IMAGES there is no inline image to run next to, so
+# a node would only be one more serial step: the storyteller records the names itself.
+# PARALLEL_BOOKKEEPING=0 restores the plain chain (and records no scene names).
+PARALLEL_BOOKKEEPING = (os.environ.get("PARALLEL_BOOKKEEPING") or "1").strip().lower() not in ("0", "false", "no")
+BOOKKEEPING_NODE = PARALLEL_BOOKKEEPING and not ASYNC_IMAGES
+_ENTITY_STOPWORDS = frozenset({
+    "I", "You", "Your", "He", "She", "They", "We", "It", "His", "Her", "Their", "The", "A", "An",
+    "What", "Who", "Where", "When", "Why", "How", "But", "And", "Or", "If", "As", "In", "On", "At",
+    "With", "From", "To", "Of", "For", "By", "Then", "Now", "There", "Here", "This", "That", "These",
+    "Those", "Somewhere", "Something", "Someone", "Nothing", "Everything", "Yes", "No", "Not", "Mr",
+    "Mrs", "Ms", "Dr", "Sir", "Lady", "Lord", "Captain", "Do", "Does",
+})
+
+
+def _scene_entities(text: str, char_name: str) -> List[str]:
+    """Capitalised names used mid-sentence in a scene (sentence-initial words are skipped)."""
+    hero = set((char_name or "").split())
+    names: List[str] = []
+    for sentence in re.split(r"(?<=[.!?…])[\"')\]]*\s+|\n+", text or ""):
+        run: List[str] = []
+        for word in re.findall(r"[A-Za-z][\w'-]*", sentence)[1:] + [""]:
+            word = re.sub(r"'s$", "", word)
+            if word[:1].isupper() and word not in _ENTITY_STOPWORDS and word not in hero and len(word) > 2:
+                run.append(word)
+                continue
+            if run and " ".join(run) not in names:
+                names.append(" ".join(run))
+            run = []
+    return names
+
+
+def _bookkeeping_summary_input(state: Story) -> tuple[str, int] | None:
+    if ASYNC_IMAGES or not _should_generate_image(state):
+        return None  # nothing to hide it behind; the next judge call folds it in for free
+    return _summarizer_input(state)
+
+
+def _scene_names_update(state: Story, text: str) -> dict:
+    """scene_names update for the names a scene used that the judge hasn't established."""
+    known = state.get("named_entities") or []
+    found = [n for n in _scene_entities(text, str(state.get("char_name") or "")) if n not in known]
+    return {"scene_names": found} if found else {}
+
+
+def _bookkeeping_update(state: Story, summary: tuple[str, int] | None) -> dict:
+    scenes = [m for m in state["situation"] if isinstance(m, AIMessage)]
+    update: dict = {}
+    if scenes:
+        update.update(_scene_names_update(state, str(scenes[-1].content)))
+    if summary is not None:
+        update["story_summary"], update["summarized_scenes"] = summary
+    return update
+
+
+def bookkeeping(state: Story):
+    summary = None
+    summarizer_input = _bookkeeping_summary_input(state)
+    if summarizer_input is not None:
+        storyline, scene_count = summarizer_input
+        summary = (_summary_chain().invoke({"storyline": storyline}), scene_count)
+    return _bookkeeping_update(state, summary)
+
+
+async def abookkeeping(state: Story):
+    summary = None
+    summarizer_input = _bookkeeping_summary_input(state)
+    if summarizer_input is not None:
+        storyline, scene_count = summarizer_input
+        summary = (await _summary_chain().ainvoke({"storyline": storyline}), scene_count)
+    return _bookkeeping_update(state, summary)
+
+
 def end(state: Story):
     print("\n\n\nThe end of your adventure!")  # just for reference even though unreachable
 
 
+# Turn journal: what every model-calling node returned, per thread and step (see
+# turn_journal.py). _replay_thread feeds a journal back through the graph of a new thread
+# instead of calling the models again. TURN_JOURNAL=0 stops recording.
+TURN_JOURNAL = (os.environ.get("TURN_JOURNAL") or "1").strip().lower() not in ("0", "false", "no")
+TURN_JOURNALS: Dict[str, TurnJournal] = {}
+# Journals being replayed, keyed by the thread that is being rebuilt from them.
+REPLAY_JOURNALS: Dict[str, TurnJournal] = {}
+# Threads _replay_thread is rebuilding (with or without a journal). Only these send
+# adjudication through LLM_CACHE: a live retry after a rewind must get a fresh roll.
+REPLAY_THREADS: set[str] = set()
+_TURN_JOURNALS_LOCK = threading.Lock()
+
+
+def _journal_position(state: Story) -> tuple[int, str | None]:
+    """(step, last action): the journal key of whatever node runs on this state."""
+    actions = list(state.get("your_action") or [])
+    step = max(int(state.get("action_total") or 0), len(actions))
+    return step, (str(actions[-1]) if actions else None)
+
+
+def _journal_record(thread_id: str, state: Story, node: str, output: Any) -> None:
+    if not TURN_JOURNAL or not thread_id:
+        return
+    with _TURN_JOURNALS_LOCK:
+        journal = TURN_JOURNALS.get(thread_id)
+        if journal is None:
+            journal = TURN_JOURNALS[thread_id] = TurnJournal()
+    step, action = _journal_position(state)
+    journal.record(step, action, node, output)
+
+
+# Scene archive (scene_archive.py): every scene a node adds, in full, per thread, since
+# situation only keeps the last SITUATION_WINDOW; a milestone scene closes a chapter.
+# SCENE_ARCHIVE=0 stops archiving.
+SCENE_ARCHIVE = (os.environ.get("SCENE_ARCHIVE") or "1").strip().lower() not in ("0", "false", "no")
+SCENE_ARCHIVES: Dict[str, SceneArchive] = {}
+_SCENE_ARCHIVES_LOCK = threading.Lock()
+
+
+def _thread_log_bytes(thread_id: str) -> int:
+    """Memory a thread's turn journal and scene archive hold; both are dropped with its session."""
+    with _TURN_JOURNALS_LOCK:
+        journal = TURN_JOURNALS.get(thread_id)
+    with _SCENE_ARCHIVES_LOCK:
+        archive = SCENE_ARCHIVES.get(thread_id)
+    return (journal.nbytes() if journal is not None else 0) + (archive.nbytes() if archive is not None else 0)
+
+
+SESSIONS.attached_size = _thread_log_bytes
+
+
+def _archive_scenes(thread_id: str, state: Story, output: Any) -> None:
+    update = output.update if isinstance(output, Command) else output
+    if not SCENE_ARCHIVE or not thread_id or not isinstance(update, dict) or not update.get("situation"):
+        return
+    with _SCENE_ARCHIVES_LOCK:
+        archive = SCENE_ARCHIVES.get(thread_id)
+        if archive is None:
+            archive = SCENE_ARCHIVES[thread_id] = SceneArchive()
+    number = _scene_total(state)
+    for message in update["situation"]:
+        number += 1
+        archive.append(number, str(getattr(message, "content", message)))
+    if update.get("is_key_event"):
+        archive.close_chapter(summary=str(update.get("story_summary") or state.get("story_summary") or ""))
+
+
+def _replayed_output(thread_id: str, state: Story, node: str) -> Any:
+    journal = REPLAY_JOURNALS.get(thread_id)
+    if journal is None:
+        return None
+    step, action = _journal_position(state)
+    output = journal.replay(step, action, node)
+    if output is None:
+        return None
+    image = output.get("last_image") if isinstance(output, dict) else None
+    if is_blob_hash(image) and image not in IMAGE_BLOBS:
+        return None  # the picture itself is gone; make a new one
+    print(f"[replay] {node} step {step} from the journal")
+    return output
+
+
+def _journaled(node: str, func, afunc) -> RunnableLambda:
+    """Node runnable that replays a journaled output when there is one and records (and
+    archives the scenes of) what it returns."""
+    takes_config = accepts_config(func)
+
+    def run(state: Story, config: RunnableConfig | None = None):
+        thread_id = _config_thread_id(config)
+        output = _replayed_output(thread_id, state, node)
+        if output is None:
+            output = func(state, config) if takes_config else func(state)
+        _journal_record(thread_id, state, node, output)
+        _archive_scenes(thread_id, state, output)
+        return output
+
+    async def arun(state: Story, config: RunnableConfig | None = None):
+        thread_id = _config_thread_id(config)
+        output = _replayed_output(thread_id, state, node)
+        if output is None:
+            output = await (afunc(state, config) if takes_config else afunc(state))
+        _journal_record(thread_id, state, node, output)
+        _archive_scenes(thread_id, state, output)
+        return output
+
+    return RunnableLambda(run, afunc=arun, name=node)
+
+
 graph = StateGraph(Story)
 
-graph.add_node("storyteller", storyteller)
+# Each model-calling node has a sync and an async body: app.stream runs the first,
+# app.astream (ASYNC_GRAPH) the second.
+graph.add_node("storyteller", _journaled("storyteller", storyteller, astoryteller))
 graph.add_node("user", user)
-graph.add_node("judger_improver", judger_improver)
-graph.add_node("image", get_image)
+graph.add_node("judger_improver", _journaled("judger_improver", judger_improver, ajudger_improver))
+graph.add_node("image", _journaled("image", image_node, aimage_node))
+graph.add_node("bookkeeping", _journaled("bookkeeping", bookkeeping, abookkeeping))
 graph.add_node("end", end)
 
 graph.set_entry_point("storyteller")
 
 graph.add_edge(START, "storyteller")
-# Run image generation BEFORE the interrupting user node so the image update
-# isn't skipped/canceled when the graph hits interrupt().
-graph.add_edge("storyteller", "image")
-graph.add_edge("image", "user")
+if ASYNC_IMAGES:
+    # The scene goes straight to the user; images come from a background job that
+    # writes its result back as an "image" update (see _write_back_to_interrupt).
+    graph.add_edge("storyteller", "user")
+    graph.add_edge("image", "user")
+elif PARALLEL_BOOKKEEPING:
+    # Fan out: image and bookkeeping both start from the fresh scene and join before the
+    # interrupt (the user node waits for both; they write disjoint keys).
+    graph.add_edge("storyteller", "image")
+    graph.add_edge("storyteller", "bookkeeping")
+    graph.add_edge(["image", "bookkeeping"], "user")
+else:
+    # Run image generation BEFORE the interrupting user node so the image update
+    # isn't skipped/canceled when the graph hits interrupt().
+    graph.add_edge("storyteller", "image")
+    graph.add_edge("image", "user")
 # user -> adjudicator -> storyteller
 graph.add_edge("user", "judger_improver")
 
 graph.set_finish_point("end")  # even though you will never reach this
 
 memory = MemorySaver()
+# Turns a player can rewind; checkpoints only older turns could reach are pruned (0 keeps everything).
+CHECKPOINT_REWIND_DEPTH = int(os.environ.get("CHECKPOINT_REWIND_DEPTH") or "50")
+# Turns kept per thread in its branch tree (meta["story_tree"]), rewound-away branches included.
+STORY_TREE_MAX_NODES = int(os.environ.get("STORY_TREE_MAX_NODES") or "200")
+# Reuse state snapshots within one chat request instead of re-reading them (state_snapshots.py).
+STATE_SNAPSHOT_CACHE = (os.environ.get("STATE_SNAPSHOT_CACHE") or "1").strip().lower() not in ("0", "false", "off", "no")
 app = graph.compile(checkpointer=memory)
 # print("DEBUG: Graph structure:\n", app.get_graph().draw_ascii())
 
@@ -933,6 +1979,7 @@ initial_state = {
     "turn_count": 0,
     "tension": 3,
     "named_entities": [],
+    "scene_names": [],
     "last_action_raw": "",
     "last_action": "",
     "progress": 0,
@@ -940,58 +1987,918 @@ initial_state = {
     "img_generation_rules": "",
     "last_image_prompt": "",
     "last_image": None,
+    "image_seed": 0,
 }
 
 
 # Everything after this is gradio and app management integration
 
 
-def run_until_interrupt(app, starter, config):
-    latest_message = "Nothing for now"
-    latest_image = None
-
-    for chunk in app.stream(starter, config=config):
-        for node_id, value in chunk.items():
-            if isinstance(value, dict) and value.get("situation"):
-                latest_message = getattr(value["situation"][-1],
-                                          "content", str(value["situation"][-1]))
-
-            if isinstance(value, dict) and ("last_image" in value):
-                if value.get("last_image") is not None:
-                    latest_image = value.get("last_image")
-                
-        if "__interrupt__" in chunk:
+def _absorb_stream_item(mode: str, chunk: Any, run: dict) -> bool:
+    """Fold one (mode, chunk) item of app.stream/astream into run; True if scene text grew."""
+    if mode == "messages":
+        try:
+            message_chunk, metadata = chunk
+            tags = metadata.get("tags") or []
+            if SCENE_STREAM_TAG not in tags:
+                return False
+            token = message_chunk.content
+        except Exception:
+            return False
+        if SCENE_RETRY_TAG in tags and not run.get("retry"):
+            # The storyteller is writing the scene again; drop what the first try streamed.
+            run["retry"] = True
+            run["partial"] = ""
+        if isinstance(token, str) and token:
+            run["partial"] += token
+            return True
+        return False
+
+    for node_id, value in chunk.items():
+        if isinstance(value, dict) and value.get("situation"):
+            run["message"] = getattr(value["situation"][-1],
+                                     "content", str(value["situation"][-1]))
+
+        if isinstance(value, dict) and ("last_image" in value):
+            if value.get("last_image") is not None:
+                run["image"] = value.get("last_image")
+
+    if "__interrupt__" in chunk:
+        run["interrupted"] = True
+    return False
+
+
+def _new_stream_run() -> dict:
+    return {"message": "Nothing for now", "image": None, "partial": "", "interrupted": False}
+
+
+def stream_until_interrupt(app, starter, config):
+    """Run the graph until the next interrupt, yielding progress as it happens.
+
+    Yields ("token", scene_text_so_far) while the storyteller is generating, then
+    exactly one ("done", (latest_message, latest_image)) at the end.
+    """
+    run = _new_stream_run()
+    for mode, chunk in app.stream(starter, config=config, stream_mode=["updates", "messages"]):
+        if _absorb_stream_item(mode, chunk, run):
+            yield "token", run["partial"]
+        if run["interrupted"]:
             break
-                
-    return latest_message, latest_image
 
+    yield "done", (run["message"], run["image"])
 
-def on_app_start():
-    history = []
-    thread_id = ""
-    return history, thread_id
 
+async def astream_until_interrupt(app, starter, config):
+    """stream_until_interrupt on app.astream: the async nodes run on the event loop."""
+    run = _new_stream_run()
+    async for mode, chunk in app.astream(starter, config=config, stream_mode=["updates", "messages"]):
+        if _absorb_stream_item(mode, chunk, run):
+            yield "token", run["partial"]
+        if run["interrupted"]:
+            break
 
-def on_user_message(user_message, history, thread_id):
-    msg = (user_message or "").strip()
-    # Make this log line unmissable when debugging Gradio/queue issues.
-    try:
-        print(f"[ui] on_user_message thread_id={thread_id!r} msg={msg!r}", flush=True)
-        sys.stderr.write(f"[ui] on_user_message thread_id={thread_id!r} msg={msg!r}\n")
-        sys.stderr.flush()
-    except Exception:
+    yield "done", (run["message"], run["image"])
+
+
+def run_until_interrupt(app, starter, config):
+    result = ("Nothing for now", None)
+    for kind, payload in stream_until_interrupt(app, starter, config):
+        if kind == "done":
+            result = payload
+    return result
+
+
+def _last_event(events):
+    """Drain a handler's event generator and return its final output."""
+    out = None
+    for out in events:
         pass
-    if not msg:
-        meta = THREAD_META.get(thread_id or "") or {}
-        return gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+    return out
 
-    def _ended_text() -> str:
-        return "Is this the end of your fable? Change the past or begin a new legend." # unreachable but kept just in case.
 
-    def _try_read_last_situation_text() -> str | None:
-        try:
-            st = app.get_state({"configurable": {"thread_id": thread_id}})
-            values = getattr(st, "values", None)
+# Handler "programs" are plain generators holding the turn logic once. Besides UI outputs
+# they yield requests that the driver fulfils: _Stream (send me the next event of a
+# stream, None when it ends), _Acquire (take this thread lock), _Await (send me this
+# future's result), _Sleep and _Offload (run this blocking call and send me its result).
+# _drive_sync runs them on a Gradio worker thread with app.stream; _drive_async
+# (ASYNC_GRAPH) on the event loop with app.astream, so a player waiting on the model - or
+# on anything else - doesn't pin a thread or stall the loop.
+ASYNC_GRAPH = (os.environ.get("ASYNC_GRAPH") or "1").strip().lower() not in ("0", "false", "no")
+# Blocking work the async driver hands off (live intro streams, _Offload) runs here rather
+# than on asyncio's default executor, which only has min(32, cpus + 4) threads: with many
+# players starting at once, intros queued behind it and async ended up slower than sync.
+# Sized like Gradio's default worker limit.
+ASYNC_OFFLOAD_THREADS = max(1, int(os.environ.get("ASYNC_OFFLOAD_THREADS") or "40"))
+ASYNC_OFFLOAD_EXECUTOR = ThreadPoolExecutor(max_workers=ASYNC_OFFLOAD_THREADS, thread_name_prefix="async-offload")
+
+
+class _Stream:
+    def __init__(self, sync_events, async_events):
+        # Zero-argument factories; the driver creates the iterator on first use.
+        self.sync_events = sync_events
+        self.async_events = async_events
+        self.iterator: Any = None
+
+
+class _Acquire:
+    def __init__(self, lock: threading.Lock):
+        self.lock = lock
+
+
+class _Await:
+    def __init__(self, future: Any, timeout_s: float | None = None):
+        # A concurrent.futures.Future; waiting past timeout_s raises TimeoutError into the program.
+        self.future = future
+        self.timeout_s = timeout_s
+
+
+class _Sleep:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+
+class _Offload:
+    def __init__(self, fn, *args):
+        # Inline under _drive_sync; on a worker thread under _drive_async.
+        self.fn = fn
+        self.args = args
+
+
+def _graph_events(starter, config) -> _Stream:
+    return _Stream(
+        lambda: stream_until_interrupt(app, starter, config),
+        lambda: astream_until_interrupt(app, starter, config),
+    )
+
+
+async def _aiter_in_thread(make_events):
+    """Async iterator over a blocking generator that runs on a worker thread."""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def _pump():
+        events = make_events()
+        try:
+            for item in events:
+                if stop.is_set():
+                    events.close()
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (done, e))
+            return
+        loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+
+    pump = loop.run_in_executor(ASYNC_OFFLOAD_EXECUTOR, _pump)
+    try:
+        while True:
+            item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+        await asyncio.shield(pump)
+
+
+def _drive_sync(program):
+    """Run a handler program on the calling thread, yielding its UI outputs."""
+    opened: list[Any] = []
+    value, error = None, None
+    try:
+        while True:
+            try:
+                out = program.throw(error) if error is not None else program.send(value)
+            except StopIteration:
+                return
+            value, error = None, None
+            if isinstance(out, _Stream):
+                if out.iterator is None:
+                    out.iterator = out.sync_events()
+                    opened.append(out.iterator)
+                try:
+                    value = next(out.iterator, None)
+                except Exception as e:
+                    error = e
+            elif isinstance(out, _Acquire):
+                out.lock.acquire()
+            elif isinstance(out, _Await):
+                try:
+                    value = out.future.result(timeout=out.timeout_s)
+                except Exception as e:
+                    error = e
+            elif isinstance(out, _Sleep):
+                time.sleep(out.seconds)
+            elif isinstance(out, _Offload):
+                try:
+                    value = out.fn(*out.args)
+                except Exception as e:
+                    error = e
+            else:
+                yield out
+    finally:
+        program.close()
+        for events in opened:
+            try:
+                events.close()
+            except Exception:
+                pass
+
+
+async def _drive_async(program, stream: bool = True):
+    """Run a handler program on the event loop; with stream=False only the final output is yielded."""
+    opened: list[Any] = []
+    value, error = None, None
+    last: Any = None
+    try:
+        while True:
+            try:
+                out = program.throw(error) if error is not None else program.send(value)
+            except StopIteration:
+                break
+            value, error = None, None
+            if isinstance(out, _Stream):
+                if out.iterator is None:
+                    out.iterator = out.async_events()
+                    opened.append(out.iterator)
+                try:
+                    value = await anext(out.iterator, None)
+                except Exception as e:
+                    error = e
+            elif isinstance(out, _Acquire):
+                # The lock may be held for a whole turn; poll instead of blocking the loop.
+                while not out.lock.acquire(blocking=False):
+                    await asyncio.sleep(0.05)
+            elif isinstance(out, _Await):
+                # asyncio.wait doesn't cancel the future on timeout (wait_for would).
+                waiter = asyncio.wrap_future(out.future)
+                done, _ = await asyncio.wait({waiter}, timeout=out.timeout_s)
+                if done:
+                    if waiter.cancelled():
+                        error = CancelledError()
+                    elif waiter.exception() is not None:
+                        error = waiter.exception()
+                    else:
+                        value = waiter.result()
+                else:
+                    error = FutureTimeoutError()
+            elif isinstance(out, _Sleep):
+                await asyncio.sleep(out.seconds)
+            elif isinstance(out, _Offload):
+                try:
+                    value = await asyncio.get_running_loop().run_in_executor(ASYNC_OFFLOAD_EXECUTOR, out.fn, *out.args)
+                except Exception as e:
+                    error = e
+            elif stream:
+                yield out
+            else:
+                last = out
+    finally:
+        program.close()
+        for events in opened:
+            try:
+                await events.aclose()
+            except Exception:
+                pass
+    if not stream and last is not None:
+        yield last
+
+
+# Background image jobs (ASYNC_IMAGES): the scene is returned as soon as the storyteller
+# finishes; get_image runs on IMAGE_SCHEDULER and its result is delivered into the chat afterwards.
+IMAGE_FOLLOWUP_TIMEOUT_S = float(os.environ.get("IMAGE_FOLLOWUP_TIMEOUT_S") or "90")
+_THREAD_LOCKS: Dict[str, threading.Lock] = {}
+_THREAD_LOCKS_GUARD = threading.Lock()
+
+
+def _store_session(thread_id: str, meta: dict) -> None:
+    """End-of-turn bookkeeping: prune old checkpoints and put meta back so the registry
+    re-measures it. Both walk whole structures, so programs run this through _Offload."""
+    _prune_checkpoints(thread_id, meta)
+    SESSIONS.put(thread_id, meta)
+
+
+def _thread_lock(thread_id: str) -> threading.Lock:
+    """Per-thread lock that serializes graph runs, rewinds and image write-backs.
+
+    A plain Lock rather than an RLock: Gradio may resume a generator handler on a
+    different worker thread than the one that acquired it.
+    """
+    with _THREAD_LOCKS_GUARD:
+        lock = _THREAD_LOCKS.get(thread_id or "")
+        if lock is None:
+            lock = _THREAD_LOCKS[thread_id or ""] = threading.Lock()
+        return lock
+
+
+def _live_thread_lock(thread_id: str) -> "threading.Lock | None":
+    """_thread_lock for work that may outlive the session (image jobs, follow-ups).
+
+    Returns None instead of creating a lock once the thread has been evicted, since
+    _drop_evicted_thread has already removed (or is about to remove) its entry.
+    """
+    with _THREAD_LOCKS_GUARD:
+        lock = _THREAD_LOCKS.get(thread_id or "")
+        if lock is None and (thread_id or "") in SESSIONS:
+            lock = _THREAD_LOCKS[thread_id or ""] = threading.Lock()
+        return lock
+
+
+def _same_checkpoint(a: Any, b: Any) -> bool:
+    ca = (a or {}).get("configurable") or {} if isinstance(a, dict) else {}
+    cb = (b or {}).get("configurable") or {} if isinstance(b, dict) else {}
+    return bool(ca.get("checkpoint_id")) and (
+        ca.get("checkpoint_id") == cb.get("checkpoint_id") and str(ca.get("thread_id")) == str(cb.get("thread_id"))
+    )
+
+
+def _write_back_to_interrupt(cfg: dict, values: dict) -> Any:
+    """Apply values to an interrupt checkpoint; return the snapshot of the re-raised interrupt.
+
+    The update is recorded as the "image" node, whose only edge leads to "user", so
+    running on from it re-raises the same interrupt without any model calls.
+    """
+    try:
+        new_cfg = app.update_state(cfg, values, as_node="image")
+        for chunk in app.stream(None, config=new_cfg):
+            if "__interrupt__" in chunk:
+                break
+        st = app.get_state({"configurable": {"thread_id": cfg["configurable"]["thread_id"]}})
+        if getattr(st, "interrupts", None):
+            return st
+    except Exception as e:
+        print(f"[image_job] write-back failed: {e}")
+    return None
+
+
+def _image_job_owner(meta: dict, job_id: str) -> Any:
+    """Return the live turn record (or "opening") that a job belongs to, or None if rewound away."""
+    if not job_id:
+        return None
+    if meta.get("opening_image_job") == job_id:
+        return "opening"
+    for record in meta.get("turn_records") or []:
+        if isinstance(record, dict) and record.get("image_job") == job_id:
+            return record
+    return None
+
+
+def _live_image_paths(meta: dict) -> set[str]:
+    paths = {r.get("image_path") for r in (meta.get("turn_records") or []) if isinstance(r, dict)}
+    paths.add(meta.get("opening_image_path"))
+    return {p for p in paths if p}
+
+
+def _start_image_job(thread_id: str, meta: dict, snapshot: Any) -> str | None:
+    """Queue get_image for the scene at snapshot (an interrupt state); return the job id."""
+    if not ASYNC_IMAGES:
+        return None
+    values = dict(getattr(snapshot, "values", None) or {})
+    if not values or not _should_generate_image(values):
+        return None
+    # Rules/prompt from a job that finished after the player had already moved on.
+    carry = meta.get("image_carry") or {}
+    for key in ("img_generation_rules", "last_image_prompt"):
+        if not values.get(key) and carry.get(key):
+            values[key] = carry[key]
+    job_id = uuid.uuid4().hex
+    future = IMAGE_SCHEDULER.submit(
+        _run_image_job, thread_id, job_id, copy.deepcopy(snapshot.config), values, priority=_image_priority(values)
+    )
+    meta.setdefault("image_jobs", {})[job_id] = future
+    return job_id
+
+
+def _run_image_job(thread_id: str, job_id: str, cfg: dict, values: dict) -> dict:
+    try:
+        update = get_image(values) or {}
+    except Exception as e:
+        print(f"[image_job] get_image failed: {e}")
+        return {}
+    if not update:
+        return {}
+
+    # A turn holds the thread lock while it streams; a scheduler worker must never wait
+    # for it. If it is busy, park the write-back for whoever takes the lock next.
+    lock = _live_thread_lock(thread_id)
+    if lock is None:
+        return update
+    if not lock.acquire(blocking=False):
+        meta = SESSIONS.get(thread_id)
+        if meta:
+            with _IMAGE_WRITEBACKS_GUARD:
+                meta.setdefault("image_writebacks", []).append((job_id, cfg, values, update))
+        return update
+    try:
+        meta = SESSIONS.get(thread_id)
+        if meta:
+            _write_back_image(thread_id, meta, job_id, cfg, values, update)
+    finally:
+        lock.release()
+    return update
+
+
+# Guards meta["image_writebacks"], which image jobs append to without the thread lock.
+_IMAGE_WRITEBACKS_GUARD = threading.Lock()
+
+
+def _apply_image_writebacks(thread_id: str, meta: dict) -> None:
+    """Apply write-backs image jobs parked while the thread was busy. Call with the thread lock held."""
+    with _IMAGE_WRITEBACKS_GUARD:
+        parked = meta.pop("image_writebacks", None) or []
+    for job_id, cfg, values, update in parked:
+        _write_back_image(thread_id, meta, job_id, cfg, values, update)
+
+
+def _write_back_image(thread_id: str, meta: dict, job_id: str, cfg: dict, values: dict, update: dict) -> None:
+    """Put a finished job's image fields into the graph state. Call with the thread lock held."""
+    if _image_job_owner(meta, job_id) is None:
+        print(f"[image_job] {job_id} finished for a turn that was rewound away; discarding")
+        return
+    moved = meta.get("carried_to")
+    if moved and _same_checkpoint(moved[0], cfg):
+        # A carry write-back (below) replaced this job's checkpoint with the same interrupt.
+        cfg = moved[1]
+    if _same_checkpoint(meta.get("cfg"), cfg):
+        moved_to = _write_back_to_interrupt(cfg, update)
+        if moved_to is not None:
+            _journal_record(thread_id, values, "image", update)
+            _move_interrupt(meta, cfg, moved_to)
+            meta.pop("image_carry", None)
+            return
+    # The player already moved on from this checkpoint: carry the rules/prompt over.
+    meta["image_carry"] = {
+        "img_generation_rules": update.get("img_generation_rules") or "",
+        "last_image_prompt": update.get("last_image_prompt") or "",
+    }
+    _carry_image_fields(meta)
+
+
+def _move_interrupt(meta: dict, old_cfg: dict, snapshot: Any) -> None:
+    """Pin snapshot, the interrupt old_cfg was re-raised as after an "image" write-back."""
+    # Pinned with its interrupt id, so the next resume needn't read the state for it.
+    _pin_interrupt(meta, snapshot)
+    new_cfg = snapshot.config
+    # The story tree resumes from its nodes' cfgs (switching, rewinding to a turn), and
+    # pruning only keeps what they and the records reference, so repin those too.
+    tree = meta.get("story_tree")
+    nodes = list(tree.nodes.values()) if tree is not None else []
+    for node in nodes:
+        if _same_checkpoint(node.cfg, old_cfg):
+            node.cfg = new_cfg
+    for record in list(meta.get("turn_records") or []) + [node.record for node in nodes]:
+        if isinstance(record, dict) and _same_checkpoint(record.get("cfg_before"), old_cfg):
+            record["cfg_before"] = new_cfg
+    # Image fields don't feed judger/storyteller, so a speculation stays valid.
+    spec = meta.get("speculation")
+    if spec and _same_checkpoint(spec.get("cfg"), old_cfg):
+        spec["cfg"] = copy.deepcopy(new_cfg)
+
+
+def _carry_image_fields(meta: dict) -> None:
+    """Write meta["image_carry"] into the pinned interrupt, where the graph state keeps it.
+
+    Only fields the newer checkpoint doesn't have yet are written. Call with the thread
+    lock held. Until this succeeds the carry stays in meta for the next image job.
+    """
+    cfg, carry = meta.get("cfg"), meta.get("image_carry") or {}
+    if not cfg or meta.get("ended"):
+        return
+    try:
+        st = app.get_state(cfg)
+    except Exception:
+        return
+    if not getattr(st, "interrupts", None):
+        return
+    values = getattr(st, "values", None) or {}
+    fields = {key: text for key, text in carry.items() if text and not values.get(key)}
+    if not fields:
+        meta.pop("image_carry", None)
+        return
+    moved_to = _write_back_to_interrupt(cfg, fields)
+    if moved_to is not None:
+        _move_interrupt(meta, cfg, moved_to)
+        meta["carried_to"] = (copy.deepcopy(cfg), moved_to.config)
+        meta.pop("image_carry", None)
+
+
+def _cancel_image_jobs(meta: Any) -> None:
+    if not isinstance(meta, dict):
+        return
+    for future in (meta.get("image_jobs") or {}).values():
+        try:
+            future.cancel()
+        except Exception:
+            continue
+
+
+def _deliver_ready_images(history: list[dict], thread_id: str, meta: dict) -> tuple[list[dict], bool]:
+    """Attach finished background images of live turns to history. Call with the thread lock held.
+
+    Write-backs the jobs had to park are applied first, so the pinned interrupt has them
+    before the thread moves on.
+    """
+    _apply_image_writebacks(thread_id, meta)
+    history = list(history or [])
+    changed = False
+    jobs = meta.get("image_jobs") or {}
+    for job_id, future in list(jobs.items()):
+        if not future.done():
+            continue
+        jobs.pop(job_id, None)
+        owner = _image_job_owner(meta, job_id)
+        if owner is None:
+            continue
+        if owner == "opening":
+            meta["opening_image_job"] = None
+        else:
+            owner["image_job"] = None
+        try:
+            update = future.result() or {}
+        except Exception:
+            update = {}
+        image = update.get("last_image")
+        if image is None:
+            continue
+        path = _persist_chat_image_bytes(image_bytes=image, thread_id=thread_id)
+        if not path:
+            continue
+        meta["last_image"] = image
+        meta.setdefault("images", []).append(image)
+        tree = meta.get("story_tree")
+        node = tree.find(None if owner == "opening" else owner) if tree is not None else None
+        if node is not None:
+            node.image = image
+        if owner == "opening":
+            meta["opening_image_path"] = path
+        else:
+            owner["image_added"] = True
+            owner["image_path"] = path
+        history.append({"role": "assistant", "content": {"path": path}})
+        changed = True
+
+    # An overlapping UI update may have dropped an already-delivered image; put it back.
+    present = {_history_image_path(item) for item in history}
+    for path in sorted(_live_image_paths(meta) - present):
+        history.append({"role": "assistant", "content": {"path": path}})
+        changed = True
+    return history, changed
+
+
+# Branch tree (story_tree.py): every turn becomes a node under the one it was played from,
+# so a rewind keeps the turns it undid and REDO_KEY / on_switch_branch can go back onto
+# them by moving a pointer, without regenerating anything.
+def _advance_story_tree(meta: dict, record: dict, action: str, image: Any, history: list[dict]) -> None:
+    tree = meta.get("story_tree")
+    if tree is not None:
+        tree.advance(
+            record=record, action=action, image=image, cfg=meta.get("cfg"), ended=bool(meta.get("ended")), history=history
+        )
+
+
+def _remember_story_history(meta: dict, history: list[dict]) -> None:
+    tree = meta.get("story_tree")
+    if tree is not None:
+        tree.remember_history(history)
+
+
+def _switch_branch_locked(thread_id: str, meta: dict, node_id: str, history: list[dict]) -> list[dict] | None:
+    """Move the thread onto another node of its story tree; return the chat history to show.
+
+    Call with the thread lock held. Only meta and the pinned checkpoint change.
+    """
+    tree = meta.get("story_tree")
+    if tree is None or node_id not in tree.nodes:
+        return None
+    _discard_speculation(meta)
+    tree.remember_history(history)
+    node = tree.switch(node_id)
+    path = tree.path()
+    records = [n.record for n in path[1:]]
+    if CHECKPOINT_REWIND_DEPTH > 0:
+        records = records[-CHECKPOINT_REWIND_DEPTH:]
+    meta["turn_records"] = records
+    meta["inputs"] = [n.action for n in path[1:]]
+    meta["images"] = [n.image for n in path if n.image is not None]
+    meta["last_image"] = meta["images"][-1] if meta["images"] else None
+    meta["cfg"] = node.cfg
+    meta["last_interrupt_cfg"] = node.cfg
+    # The node's checkpoint still holds the resume of the branch we came from.
+    _clear_pending_writes_for_cfg(node.cfg)
+    meta["ended"] = node.ended
+    meta["grace_next"] = False
+    new_history, _ = _deliver_ready_images(tree.history(), thread_id, meta)
+    if not node.ended:
+        _start_speculation(thread_id, meta)
+    return new_history
+
+
+def _rewind_to_turn_locked(thread_id: str, meta: dict, turn: int, history: list[dict]) -> list[dict] | None:
+    """Jump back to right after `turn` in one step; same end state as rewinding one turn at a time.
+
+    Call with the thread lock held. Returns None if there is nothing to do (unknown turn, or
+    already there), which also makes a doubled click harmless.
+    """
+    tree = meta.get("story_tree")
+    node = tree.at_turn(turn) if tree is not None else None
+    if node is None or node.id == tree.current:
+        return None
+    undone = (tree.at_turn(turn + 1).record or {})
+    new_history = _switch_branch_locked(thread_id, meta, node.id, history)
+    # Like REWIND_KEY: rewinding re-enables play, with a one-turn grace after an ended turn.
+    meta["grace_next"] = bool(undone.get("was_game_over") or undone.get("ended_after"))
+    if meta.get("ended"):
+        meta["ended"] = False
+        _start_speculation(thread_id, meta)
+    return new_history
+
+
+# Speculative Continue (opt-in): while the player reads the scene, precompute
+# judger_improver -> storyteller for CONTINUE_KEY from the pinned interrupt. If the
+# player presses Continue, those outputs are handed to the nodes and the turn commits
+# without waiting on a model; anything else discards the speculation.
+SPECULATIVE_CONTINUE = (os.environ.get("SPECULATIVE_CONTINUE") or "0").strip().lower() in ("1", "true", "yes")
+SPECULATION_WAIT_S = float(os.environ.get("SPECULATION_WAIT_S") or "60")
+SPECULATION_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("SPECULATION_WORKERS") or "2"),
+    thread_name_prefix="speculate",
+)
+SPECULATION_STATS: Dict[str, int] = {
+    "started": 0,
+    "hits": 0,
+    "misses": 0,  # Continue pressed with no usable speculation
+    "discarded": 0,
+    "used_tokens": 0,
+    "wasted_tokens": 0,
+}
+_SPECULATION_LOCK = threading.Lock()
+
+
+def speculation_stats() -> Dict[str, Any]:
+    """Counters for tuning SPECULATIVE_CONTINUE (hit_rate = hits / (hits + discarded))."""
+    with _SPECULATION_LOCK:
+        stats: Dict[str, Any] = dict(SPECULATION_STATS)
+    resolved = stats["hits"] + stats["discarded"]
+    stats["hit_rate"] = (stats["hits"] / resolved) if resolved else 0.0
+    return stats
+
+
+def _bump_speculation_stat(key: str, amount: int = 1) -> None:
+    with _SPECULATION_LOCK:
+        SPECULATION_STATS[key] = SPECULATION_STATS.get(key, 0) + amount
+
+
+def _apply_update_locally(values: dict, update: dict) -> dict:
+    """Merge a node update into a copy of state values using Story's reducers."""
+    merged = dict(values)
+    for key, val in (update or {}).items():
+        if key == "situation":
+            merged[key] = _window_scenes(list(values.get(key) or []), val)
+        elif key == "your_action":
+            merged[key] = _window_actions(values.get(key), val)
+        elif key in ("scene_total", "action_total"):
+            merged[key] = _add_count(values.get(key), val)
+        elif key == "named_entities":
+            merged[key] = _merge_names(values.get(key), val)
+        elif key == "scene_names":
+            merged[key] = _rotate_names(values.get(key), val)
+        else:
+            merged[key] = val
+    return merged
+
+
+def _speculate_continue(spec: dict, values: dict) -> dict:
+    outputs: Dict[str, Any] = {}
+    # The nodes see the spec through their config: the storyteller checks spec["cancelled"]
+    # while streaming, and neither counts towards PROMPTS / FAST_PATH_STATS.
+    config: RunnableConfig = {"configurable": {"speculation": spec}}
+    with get_usage_metadata_callback() as usage:
+        # Same update the user node makes for a Continue resume.
+        state = _apply_update_locally(values, {**_action(CONTINUE_KEY), "last_action_raw": CONTINUE_KEY})
+        verdict = judger_improver(state, config)
+        outputs["judger_improver"] = verdict
+        if not spec.get("cancelled") and getattr(verdict, "goto", None) == "storyteller":
+            outputs["storyteller"] = storyteller(_apply_update_locally(state, verdict.update), config)
+    tokens = sum(int(u.get("total_tokens") or 0) for u in usage.usage_metadata.values())
+    if not tokens:
+        # Provider didn't report usage (e.g. streamed without usage); estimate the outputs.
+        scene = (outputs.get("storyteller") or {}).get("situation") or []
+        tokens = sum(estimate_tokens(str(getattr(m, "content", m))) for m in scene)
+    spec["tokens"] = tokens
+    return outputs
+
+
+def _settle_speculation(spec: dict) -> None:
+    """Account a finished speculation's tokens as used or wasted (exactly once)."""
+    with _SPECULATION_LOCK:
+        if spec.get("settled") or spec.get("status") == "pending" or not spec["future"].done():
+            return
+        spec["settled"] = True
+        key = "wasted_tokens" if spec.get("status") == "discarded" else "used_tokens"
+        SPECULATION_STATS[key] += int(spec.get("tokens") or 0)
+
+
+def _start_speculation(thread_id: str, meta: dict, states: StateSnapshots | None = None) -> None:
+    """Speculate a Continue from meta["cfg"]. Call with the thread lock held."""
+    if not SPECULATIVE_CONTINUE:
+        return
+    _discard_speculation(meta)
+    if meta.get("ended") or not meta.get("cfg"):
+        return
+    try:
+        st = states.get(meta["cfg"]) if states is not None else app.get_state(meta["cfg"])
+    except Exception:
+        return
+    if not getattr(st, "interrupts", None):
+        return
+    spec: Dict[str, Any] = {"cfg": copy.deepcopy(st.config), "status": "pending", "cancelled": False}
+    spec["future"] = SPECULATION_EXECUTOR.submit(_speculate_continue, spec, dict(st.values))
+    spec["future"].add_done_callback(lambda _f: _settle_speculation(spec))
+    meta["speculation"] = spec
+    _bump_speculation_stat("started")
+
+
+def _discard_speculation(meta: Any) -> None:
+    spec = meta.pop("speculation", None) if isinstance(meta, dict) else None
+    if not spec:
+        return
+    spec["cancelled"] = True
+    spec["status"] = "discarded"
+    spec["future"].cancel()
+    _bump_speculation_stat("discarded")
+    _settle_speculation(spec)
+
+
+def _claim_speculation(thread_id: str, meta: dict, interrupt_cfg: dict):
+    """Hand a matching speculation's outputs to the nodes for this Continue resume.
+
+    A sub-program (use with `yield from`): it waits for the speculation through the driver,
+    so a still-running one doesn't block the event loop. Returns True on a hit.
+    """
+    if not SPECULATIVE_CONTINUE:
+        return False
+    spec = meta.get("speculation")
+    if not spec or not _same_checkpoint(spec.get("cfg"), interrupt_cfg):
+        _discard_speculation(meta)
+        _bump_speculation_stat("misses")
+        return False
+    if spec["future"].cancel():
+        # Still queued behind other threads' speculations on SPECULATION_EXECUTOR: waiting
+        # for a worker would be slower than running the Continue live right away.
+        print("[speculation] speculation had not started; running Continue live")
+        _discard_speculation(meta)
+        _bump_speculation_stat("misses")
+        return False
+    try:
+        outputs = yield _Await(spec["future"], SPECULATION_WAIT_S)
+    except Exception as e:
+        print(f"[speculation] unusable speculation ({e!r}); running Continue live")
+        _discard_speculation(meta)
+        _bump_speculation_stat("misses")
+        return False
+    meta.pop("speculation", None)
+    spec["status"] = "hit"
+    _bump_speculation_stat("hits")
+    _settle_speculation(spec)
+    PRECOMPUTED_NODE_OUTPUTS[thread_id] = dict(outputs)
+    print(f"[speculation] hit: {speculation_stats()}")
+    return True
+
+
+SESSION_CLEANUP_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-cleanup")
+
+
+def _drop_evicted_thread(thread_id: str, meta: Any) -> None:
+    # Waits for any turn or image write-back still running on the thread; a handler that
+    # finished after the eviction may have put the session back, in which case it is alive
+    # again and keeps its jobs.
+    lock = _thread_lock(thread_id)
+    with lock:
+        if thread_id in SESSIONS:
+            return
+        _cancel_image_jobs(meta)
+        _discard_speculation(meta)
+        try:
+            memory.delete_thread(thread_id)
+        except Exception as e:
+            print(f"[sessions] failed to delete checkpoints of {thread_id}: {e}")
+        PRECOMPUTED_NODE_OUTPUTS.pop(thread_id, None)
+        with _TURN_JOURNALS_LOCK:
+            TURN_JOURNALS.pop(thread_id, None)
+        with _SCENE_ARCHIVES_LOCK:
+            SCENE_ARCHIVES.pop(thread_id, None)
+        with _THREAD_LOCKS_GUARD:
+            if _THREAD_LOCKS.get(thread_id) is lock:
+                del _THREAD_LOCKS[thread_id]
+
+
+@SESSIONS.on_evict
+def _on_session_evicted(thread_id: str, meta: Any, reason: str) -> None:
+    print(f"[sessions] dropping {thread_id} ({reason})")
+    # Never block the caller (it may hold another thread's lock); the cleanup takes the
+    # evicted thread's own lock.
+    SESSION_CLEANUP_EXECUTOR.submit(_drop_evicted_thread, thread_id, meta)
+
+
+def on_image_followup(history, thread_id):
+    """Streamed follow-up event: wait for this thread's background images and attach them."""
+    yield from _drive_sync(_image_followup_program(history, thread_id))
+
+
+async def aon_image_followup(history, thread_id):
+    """on_image_followup for ASYNC_GRAPH: waits on the event loop instead of a worker thread."""
+    async for out in _drive_async(_image_followup_program(history, thread_id)):
+        yield out
+
+
+def _image_followup_program(history, thread_id):
+    """Handler program behind on_image_followup / aon_image_followup."""
+    meta = SESSIONS.get(thread_id or "")
+    if not meta:
+        return
+    # The event carries the chat as of the turn it follows. Once the player has moved on
+    # (another turn, a rewind), yielding that copy would overwrite the newer chat, so the
+    # follow-up only runs while its turn is still the current node of the story tree.
+    tree = meta.get("story_tree")
+    node = tree.current if tree is not None else None
+    if tree is not None and _chat_texts(history) != _chat_texts(tree.history()):
+        return
+    deadline = time.time() + IMAGE_FOLLOWUP_TIMEOUT_S
+    while time.time() < deadline:
+        meta = SESSIONS.get(thread_id or "")
+        if not meta:
+            return
+        changed = False
+        lock = _live_thread_lock(thread_id)
+        if lock is None:
+            return
+        # Never block behind a running turn; that turn delivers finished images itself.
+        if lock.acquire(blocking=False):
+            try:
+                if tree is not None and (meta.get("story_tree") is not tree or tree.current != node):
+                    return
+                history, changed = _deliver_ready_images(history, thread_id, meta)
+                if changed and tree is not None:
+                    tree.remember_history(history)
+            finally:
+                lock.release()
+        if changed:
+            yield history
+        if not meta.get("image_jobs"):
+            return
+        yield _Sleep(0.5)
+
+
+def on_app_start():
+    history = []
+    thread_id = ""
+    return history, thread_id
+
+
+def on_user_message(user_message, history, thread_id):
+    return _last_event(on_user_message_stream(user_message, history, thread_id))
+
+
+def on_user_message_stream(user_message, history, thread_id):
+    """Generator version of on_user_message: yields partial scenes while the storyteller streams."""
+    yield from _drive_sync(_user_message_program(user_message, history, thread_id))
+
+
+async def aon_user_message_stream(user_message, history, thread_id):
+    """on_user_message_stream for ASYNC_GRAPH: runs on the event loop."""
+    async for out in _drive_async(_user_message_program(user_message, history, thread_id), stream=STREAM_TOKENS):
+        yield out
+
+
+def _user_message_program(user_message, history, thread_id):
+    """Handler program behind on_user_message_stream / aon_user_message_stream."""
+    msg = (user_message or "").strip()
+    # Make this log line unmissable when debugging Gradio/queue issues.
+    try:
+        print(f"[ui] on_user_message thread_id={thread_id!r} msg={msg!r}", flush=True)
+        sys.stderr.write(f"[ui] on_user_message thread_id={thread_id!r} msg={msg!r}\n")
+        sys.stderr.flush()
+    except Exception:
+        pass
+    if not msg:
+        meta = SESSIONS.get(thread_id or "") or {}
+        yield gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+        return
+
+    def _ended_text() -> str:
+        return "Is this the end of your fable? Change the past or begin a new legend." # unreachable but kept just in case.
+
+    # Snapshots read while handling this message; invalidated once the graph has run.
+    states = StateSnapshots(app, enabled=STATE_SNAPSHOT_CACHE)
+
+    def _try_read_last_situation_text() -> str | None:
+        try:
+            st = states.get({"configurable": {"thread_id": thread_id}})
+            values = getattr(st, "values", None)
             if not isinstance(values, dict):
                 return None
             situation = values.get("situation") or []
@@ -1019,7 +2926,7 @@ def on_user_message(user_message, history, thread_id):
 
         for cfg in candidates:
             try:
-                st = app.get_state(cfg)
+                st = states.get(cfg)
                 if getattr(st, "interrupts", None):
                     return st.config
             except Exception:
@@ -1028,9 +2935,9 @@ def on_user_message(user_message, history, thread_id):
 
     # MENU: return to crystal selection (clears current thread).
     if msg.lower() == "start" or msg == MENU_KEY or msg == "___MENU__":
-        if thread_id and thread_id in THREAD_META:
-            THREAD_META.pop(thread_id, None)
-        return (
+        if thread_id:
+            SESSIONS.discard(thread_id, reason="menu")
+        yield (
             gr.update(value=""),
             [],
             "",
@@ -1038,12 +2945,14 @@ def on_user_message(user_message, history, thread_id):
             gr.update(visible=True),
             gr.update(visible=False),
         )
+        return
 
     # REWIND: drop the last user+assistant pair (fast, no regeneration).
     if msg == REWIND_KEY:
-        meta = THREAD_META.get(thread_id or "") or {}
+        meta = SESSIONS.get(thread_id or "") or {}
         if not meta:
-            return gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+            yield gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+            return
 
         # Gradio can fire control actions twice - make rewind immune to the doubles
         try:
@@ -1051,7 +2960,8 @@ def on_user_message(user_message, history, thread_id):
             last_cmd = meta.get("_last_control_cmd")
             last_ts = float(meta.get("_last_control_cmd_ts") or 0.0)
             if last_cmd == REWIND_KEY and (now - last_ts) < 1.25:
-                return gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+                yield gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+                return
             meta["_last_control_cmd"] = REWIND_KEY
             meta["_last_control_cmd_ts"] = now
         except Exception:
@@ -1059,59 +2969,123 @@ def on_user_message(user_message, history, thread_id):
 
         records = list(meta.get("turn_records") or [])
         if not records:
-            return gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+            yield gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+            return
 
-        record = records.pop()
-        meta["turn_records"] = records
+        lock = _thread_lock(thread_id)
+        yield _Acquire(lock)
+        try:
+            _discard_speculation(meta)
+            # Re-read under the lock: a turn that was still running may have appended its record.
+            records = list(meta.get("turn_records") or records)
+            record = records.pop()
+            meta["turn_records"] = records
+            tree = meta.get("story_tree")
+            if tree is not None:
+                # Keep the undone turn as a branch instead of dropping it.
+                tree.remember_history(history)
+                tree.rewind()
+
+            # Restore the exact interrupt config from before the popped turn.
+            cfg_before = record.get("cfg_before")
+            if isinstance(cfg_before, dict) and cfg_before:
+                meta["cfg"] = cfg_before
+                meta["last_interrupt_cfg"] = cfg_before
+                # Critical: clear any pending writes on that checkpoint so the next resume
+                # doesn't reuse an old interrupt payload.
+                _clear_pending_writes_for_cfg(cfg_before)
+            else:
+                # Fallback: infer from state history.
+                interrupts = _get_latest_interrupt_configs(thread_id)
+                if len(interrupts) >= 2:
+                    meta["cfg"] = interrupts[1].config
+                    meta["last_interrupt_cfg"] = interrupts[1].config
+                    _clear_pending_writes_for_cfg(interrupts[1].config)
+                elif len(interrupts) == 1:
+                    meta["cfg"] = interrupts[0].config
+                    meta["last_interrupt_cfg"] = interrupts[0].config
+                    _clear_pending_writes_for_cfg(interrupts[0].config)
+
+            # If the thread was ended (GAME OVER / finish), rewinding should re-enable play.
+            meta["ended"] = False
+
+            # One-turn grace after rewinding from an ended turn (GAME OVER / finish).
+            if record.get("was_game_over") or record.get("ended_after"):
+                meta["grace_next"] = True
+
+            # Keep meta inputs/images consistent.
+            inputs = list(meta.get("inputs") or [])
+            if inputs:
+                inputs.pop()
+            meta["inputs"] = inputs
+
+            if record.get("image_added") and (meta.get("images") or []):
+                try:
+                    meta["images"].pop()
+                except Exception:
+                    pass
+            meta["last_image"] = (meta.get("images") or [None])[-1] if meta.get("images") else None
+
+            new_history = _revert_history_by_record(history, record, keep_paths=_live_image_paths(meta))
+            _start_speculation(thread_id, meta)
+        finally:
+            lock.release()
+        SESSIONS.put(thread_id, meta)
+        yield gr.update(value=""), new_history, thread_id, gr.update(), gr.update(), gr.update()
+        return
 
-        # Restore the exact interrupt config from before the popped turn.
-        cfg_before = record.get("cfg_before")
-        if isinstance(cfg_before, dict) and cfg_before:
-            meta["cfg"] = cfg_before
-            meta["last_interrupt_cfg"] = cfg_before
-            # Critical: clear any pending writes on that checkpoint so the next resume
-            # doesn't reuse an old interrupt payload.
-            _clear_pending_writes_for_cfg(cfg_before)
-        else:
-            # Fallback: infer from state history.
-            interrupts = _get_latest_interrupt_configs(thread_id)
-            if len(interrupts) >= 2:
-                meta["cfg"] = interrupts[1].config
-                meta["last_interrupt_cfg"] = interrupts[1].config
-                _clear_pending_writes_for_cfg(interrupts[1].config)
-            elif len(interrupts) == 1:
-                meta["cfg"] = interrupts[0].config
-                meta["last_interrupt_cfg"] = interrupts[0].config
-                _clear_pending_writes_for_cfg(interrupts[0].config)
-
-        # If the thread was ended (GAME OVER / finish), rewinding should re-enable play.
-        meta["ended"] = False
+    # REWIND_TO: jump back several turns at once (the story tree indexes the current path).
+    if msg.startswith(REWIND_TO_KEY):
+        meta = SESSIONS.get(thread_id or "") or {}
+        try:
+            turn = int(msg[len(REWIND_TO_KEY):].strip())
+        except ValueError:
+            turn = -1
+        if not meta or turn < 0:
+            yield gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+            return
 
-        # One-turn grace after rewinding from an ended turn (GAME OVER / finish).
-        if record.get("was_game_over") or record.get("ended_after"):
-            meta["grace_next"] = True
+        lock = _thread_lock(thread_id)
+        yield _Acquire(lock)
+        try:
+            new_history = _rewind_to_turn_locked(thread_id, meta, turn, history)
+        finally:
+            lock.release()
+        SESSIONS.put(thread_id, meta)
+        yield gr.update(value=""), new_history or history, thread_id, gr.update(), gr.update(), gr.update()
+        return
 
-        # Keep meta inputs/images consistent.
-        inputs = list(meta.get("inputs") or [])
-        if inputs:
-            inputs.pop()
-        meta["inputs"] = inputs
+    # REDO: step back onto the branch the last rewind left behind (no regeneration).
+    if msg == REDO_KEY:
+        meta = SESSIONS.get(thread_id or "") or {}
+        tree = meta.get("story_tree")
+        if tree is None or not tree.redo_target():
+            yield gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+            return
 
-        if record.get("image_added") and (meta.get("images") or []):
-            try:
-                meta["images"].pop()
-            except Exception:
-                pass
-        meta["last_image"] = (meta.get("images") or [None])[-1] if meta.get("images") else None
+        # Same double-fire guard as rewind: one click, one step.
+        now = time.time()
+        if meta.get("_last_control_cmd") == REDO_KEY and (now - float(meta.get("_last_control_cmd_ts") or 0.0)) < 1.25:
+            yield gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+            return
+        meta["_last_control_cmd"] = REDO_KEY
+        meta["_last_control_cmd_ts"] = now
 
-        new_history = _revert_history_by_record(history, record)
-        THREAD_META[thread_id] = meta
-        return gr.update(value=""), new_history, thread_id, gr.update(), gr.update(), gr.update()
+        lock = _thread_lock(thread_id)
+        yield _Acquire(lock)
+        try:
+            target = tree.redo_target()
+            new_history = _switch_branch_locked(thread_id, meta, target, history) if target else None
+        finally:
+            lock.release()
+        SESSIONS.put(thread_id, meta)
+        yield gr.update(value=""), new_history or history, thread_id, gr.update(), gr.update(), gr.update()
+        return
 
-    meta = THREAD_META.get(thread_id or "")
+    meta = SESSIONS.get(thread_id or "")
     if not meta:
         # If we lost meta (server restart), force the user back to menu.
-        return (
+        yield (
             gr.update(value=""),
             [],
             "",
@@ -1119,6 +3093,7 @@ def on_user_message(user_message, history, thread_id):
             gr.update(visible=True),
             gr.update(visible=False),
         )
+        return
 
     # Best-effort dedupe: Gradio can double-submit the same payload under some
     # reconnect/queue edge cases. This avoids racing two resumes on one checkpoint.
@@ -1127,7 +3102,8 @@ def on_user_message(user_message, history, thread_id):
         last_msg = meta.get("_last_ui_msg")
         last_ts = float(meta.get("_last_ui_msg_ts") or 0.0)
         if msg == last_msg and (now - last_ts) < 0.75:
-            return gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+            yield gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+            return
         meta["_last_ui_msg"] = msg
         meta["_last_ui_msg_ts"] = now
     except Exception:
@@ -1137,91 +3113,112 @@ def on_user_message(user_message, history, thread_id):
     # Keep rewind perfect by leaving rewind path untouched.
     if meta.get("ended"):
         history = list(history or [])
+        _remember_story_history(meta, history)
         record = {"type": "user", "history_len_before": len(history), "image_added": False, "was_game_over": True}
         history = history + [{"role": "user", "content": msg}, {"role": "assistant", "content": _ended_text()}]
         meta.setdefault("turn_records", []).append(record)
-        THREAD_META[thread_id] = meta
-        return gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+        _advance_story_tree(meta, record, msg, None, history)
+        SESSIONS.put(thread_id, meta)
+        yield gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+        return
+
+    def _resume_turn(history):
+        meta.setdefault("inputs", []).append(msg)
+
+        msg_for_graph = msg
+        if meta.get("grace_next"):
+            meta["grace_next"] = False
+            msg_for_graph = GRACE_PERIOD_INVISIBLE_TELLER + msg
+
+        # Always resume from a config that is *currently* waiting at an interrupt.
+        interrupt_cfg = _get_interrupt_cfg(meta)
+        if not interrupt_cfg:
+            # We aren't at an interrupt; treat as ended to avoid poisoning resume queues.
+            meta["ended"] = True
+            history = list(history or [])
+            record = {"type": "user", "history_len_before": len(history), "image_added": False, "was_game_over": True}
+            history = history + [{"role": "user", "content": msg}, {"role": "assistant", "content": _ended_text()}]
+            meta.setdefault("turn_records", []).append(record)
+            _advance_story_tree(meta, record, msg, None, history)
+            SESSIONS.put(thread_id, meta)
+            yield gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+            return
 
-    meta.setdefault("inputs", []).append(msg)
+        cfg_before = copy.deepcopy(interrupt_cfg)
+        try:
+            resume_cmd = _resume_command(meta, interrupt_cfg, msg_for_graph, states)
+
+            next_scene, new_image = "Nothing for now", None
+            partial_base = list(history or []) + [{"role": "user", "content": msg}]
+            events = _graph_events(resume_cmd, interrupt_cfg)
+            while (event := (yield events)) is not None:
+                kind, payload = event
+                if kind == "done":
+                    next_scene, new_image = payload
+                else:
+                    partial = partial_base + [{"role": "assistant", "content": payload}]
+                    yield gr.update(value=""), partial, thread_id, gr.update(), gr.update(), gr.update()
+        except Exception as e:
+            print(f"[chat] resume failed (likely ended thread); forcing ended state: {e}")
+            next_scene, new_image = _ended_text(), None
+            meta["ended"] = True
+        states.invalidate()
+
+        # If the stream ended without emitting a situation update, try to recover from stored state.
+        if next_scene == "Nothing for now":
+            recovered = _try_read_last_situation_text()
+            next_scene = recovered or _ended_text()
+
+        if isinstance(next_scene, str) and next_scene.lstrip().startswith(("GAME OVER", "GAME😩OVER")):
+            meta["ended"] = True
 
-    msg_for_graph = msg
-    if meta.get("grace_next"):
-        meta["grace_next"] = False
-        msg_for_graph = GRACE_PERIOD_INVISIBLE_TELLER + msg
+        if new_image is not None:
+            meta["last_image"] = new_image
+            meta.setdefault("images", []).append(new_image)
 
-    # Always resume from a config that is *currently* waiting at an interrupt.
-    interrupt_cfg = _get_interrupt_cfg(meta)
-    if not interrupt_cfg:
-        # We aren't at an interrupt; treat as ended to avoid poisoning resume queues.
-        meta["ended"] = True
         history = list(history or [])
-        record = {"type": "user", "history_len_before": len(history), "image_added": False, "was_game_over": True}
-        history = history + [{"role": "user", "content": msg}, {"role": "assistant", "content": _ended_text()}]
-        meta.setdefault("turn_records", []).append(record)
-        THREAD_META[thread_id] = meta
-        return gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
-
-    cfg_before = copy.deepcopy(interrupt_cfg)
-    try:
-        # Resume by interrupt id to avoid stale/queued resume values being applied
-        # to the wrong interrupt after rewinds/branching.
-        interrupts = []
+        record = {
+            "type": "user",
+            "history_len_before": len(history),
+            "image_added": bool(new_image is not None),
+            "was_game_over": bool(isinstance(next_scene, str) and next_scene.lstrip().startswith(("GAME OVER", "GAME😩OVER"))),
+            "ended_after": bool(meta.get("ended")),
+            "cfg_before": cfg_before,
+        }
+        history = history + [{"role": "user", "content": msg}, {"role": "assistant", "content": next_scene}]
         try:
-            st_for_resume = app.get_state(interrupt_cfg)
-            interrupts = list(getattr(st_for_resume, "interrupts", None) or [])
+            if new_image is not None:
+                _append_real_image_message(history, image_bytes=new_image, thread_id=thread_id)
         except Exception:
-            interrupts = []
-
-        resume_cmd = Command(resume=msg_for_graph)
-        if interrupts:
-            resume_cmd = Command(resume={interrupts[0].id: msg_for_graph})
-
-        next_scene, new_image = run_until_interrupt(app, resume_cmd, config=interrupt_cfg)
-    except Exception as e:
-        print(f"[chat] resume failed (likely ended thread); forcing ended state: {e}")
-        next_scene, new_image = _ended_text(), None
-        meta["ended"] = True
-
-    # If the stream ended without emitting a situation update, try to recover from stored state.
-    if next_scene == "Nothing for now":
-        recovered = _try_read_last_situation_text()
-        next_scene = recovered or _ended_text()
+            pass
 
-    if isinstance(next_scene, str) and next_scene.lstrip().startswith(("GAME OVER", "GAME😩OVER")):
-        meta["ended"] = True
+        meta.setdefault("turn_records", []).append(record)
+        # Pin the current interrupt checkpoint config for reliable rewinds.
+        # IMPORTANT: do not overwrite cfg after a finished run (END) or rewinds won't have a valid interrupt to resume.
+        try:
+            st = states.get({"configurable": {"thread_id": thread_id}})
+            if getattr(st, "interrupts", None):
+                _pin_interrupt(meta, st)
+                record["image_job"] = _start_image_job(thread_id, meta, st)
+                _start_speculation(thread_id, meta, states)
+        except Exception:
+            pass
+        _advance_story_tree(meta, record, msg, new_image, history)
+        yield _Offload(_store_session, thread_id, meta)
+        yield gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
 
-    if new_image is not None:
-        meta["last_image"] = new_image
-        meta.setdefault("images", []).append(new_image)
 
-    history = list(history or [])
-    record = {
-        "type": "user",
-        "history_len_before": len(history),
-        "image_added": bool(new_image is not None),
-        "was_game_over": bool(isinstance(next_scene, str) and next_scene.lstrip().startswith(("GAME OVER", "GAME😩OVER"))),
-        "ended_after": bool(meta.get("ended")),
-        "cfg_before": cfg_before,
-    }
-    history = history + [{"role": "user", "content": msg}, {"role": "assistant", "content": next_scene}]
+    lock = _thread_lock(thread_id)
+    yield _Acquire(lock)
     try:
-        if new_image is not None:
-            _append_real_image_message(history, image_bytes=new_image, thread_id=thread_id)
-    except Exception:
-        pass
-
-    meta.setdefault("turn_records", []).append(record)
-    # Pin the current interrupt checkpoint config for reliable rewinds.
-    # IMPORTANT: do not overwrite cfg after a finished run (END) or rewinds won't have a valid interrupt to resume.
-    try:
-        st = app.get_state({"configurable": {"thread_id": thread_id}})
-        if getattr(st, "interrupts", None):
-            meta["cfg"] = st.config
-            meta["last_interrupt_cfg"] = st.config
-    except Exception:
-        pass
-    return gr.update(value=""), history, thread_id, gr.update(), gr.update(), gr.update()
+        # Attach any background images that finished since the last turn before it moves on.
+        history, _ = _deliver_ready_images(history, thread_id, meta)
+        _remember_story_history(meta, history)
+        # The player typed an action, so a speculative Continue is no longer useful.
+        _discard_speculation(meta)
+        yield from _resume_turn(history)
+    finally:
+        lock.release()
 
 
 def on_menu_click(history, thread_id):
@@ -1232,7 +3229,75 @@ def on_rewind_click(history, thread_id):
     return on_user_message(REWIND_KEY, history, thread_id)
 
 
+def on_rewind_to_turn(turn, history, thread_id):
+    return on_user_message(f"{REWIND_TO_KEY}{int(turn or 0)}", history, thread_id)
+
+
+def story_branches(thread_id: str) -> list[dict]:
+    """Leaves of the thread's story tree (id, depth, current, action, ended), for on_switch_branch."""
+    meta = SESSIONS.get(thread_id or "") or {}
+    tree = meta.get("story_tree")
+    return tree.branches() if tree is not None else []
+
+
+def on_switch_branch(history, thread_id, node_id):
+    """Show another branch of the story tree; returns (history, thread_id)."""
+    meta = SESSIONS.get(thread_id or "")
+    if not meta:
+        return history, thread_id
+    lock = _live_thread_lock(thread_id)
+    if lock is None:
+        return history, thread_id
+    with lock:
+        new_history = _switch_branch_locked(thread_id, meta, node_id, history)
+    if new_history is None:
+        return history, thread_id
+    SESSIONS.put(thread_id, meta)
+    return new_history, thread_id
+
+
 def initialize_state(char_name, genre, role_id, image_style: str = "") -> dict:
+    starter: dict = {}
+    for kind, payload in initialize_state_stream(char_name, genre, role_id, image_style):
+        if kind == "done":
+            starter = payload
+    return starter
+
+
+INTRO_THEMES: Dict[str, str] = {
+    "fantasy": "High-Fantasy Quest (epic adventure, magic, ancient ruins, heroic tone)",
+    "scifi": "Cyberpunk Heist (neon megacity, megacorps, hackers, chrome augmentations, tense noir energy)",
+    "grimdark": "Grimdark Survival (brutal stakes, scarcity, moral compromise, bleak atmosphere)",
+    "noir": "Noir Detective (rainy streets, shadows, corruption, cynical voice, mystery-driven)",
+    "space_opera": "Cosmic Space Opera (galactic scale, factions, starships, wonder, high drama)",
+}
+
+
+def _write_pool_intro(role_id: str) -> str:
+    """Write one intro for the pool, with NAME_PLACEHOLDER standing in for the hero's name."""
+    genre, role_display = _normalize_genre_for_role(genre=ROLE_TO_GENRE.get(role_id, ""), role_id=role_id)
+    intro_prompt = INTRO_PROMPT_TEMPLATE.format(
+        theme=INTRO_THEMES.get(genre, genre), char_name=NAME_PLACEHOLDER, role=role_display
+    )
+    intro_prompt += f"\nWrite the name exactly as {NAME_PLACEHOLDER} every time it appears; it is filled in later.\n"
+    return str(llm.invoke([SystemMessage(content=intro_prompt)]).content or "")
+
+
+# Intro pool: a few ready-made intros per role (name filled in at begin time), topped up
+# in the background after each use. INTRO_POOL_SIZE=0 turns it off.
+INTRO_POOL = IntroPool(
+    generate=_write_pool_intro,
+    size=int(os.environ.get("INTRO_POOL_SIZE") or "2"),
+    max_age_s=float(os.environ.get("INTRO_POOL_MAX_AGE_H") or "168") * 3600,
+    path=(os.environ.get("INTRO_POOL_PATH") or "runtime_intro_pool.json").strip() or None,
+)
+
+
+def initialize_state_stream(char_name, genre, role_id, image_style: str = ""):
+    """Build the starter state, yielding ("token", intro_so_far) while the intro streams.
+
+    Ends with exactly one ("done", starter_state).
+    """
     print("DEBUG on_begin_story received genre =", genre)
     char_name = (char_name or "Unknown Hero").strip()
     genre = (genre or "fantasy").strip()
@@ -1240,14 +3305,7 @@ def initialize_state(char_name, genre, role_id, image_style: str = "") -> dict:
 
     genre, role_display = _normalize_genre_for_role(genre=genre, role_id=role_id)
     print("genre is ", genre)
-    genres_map = {
-        "fantasy": "High-Fantasy Quest (epic adventure, magic, ancient ruins, heroic tone)",
-        "scifi": "Cyberpunk Heist (neon megacity, megacorps, hackers, chrome augmentations, tense noir energy)",
-        "grimdark": "Grimdark Survival (brutal stakes, scarcity, moral compromise, bleak atmosphere)",
-        "noir": "Noir Detective (rainy streets, shadows, corruption, cynical voice, mystery-driven)",
-        "space_opera": "Cosmic Space Opera (galactic scale, factions, starships, wonder, high drama)",
-    }
-    theme = genres_map.get(genre, genre)
+    theme = INTRO_THEMES.get(genre, genre)
     # old opening
     # opening = (
     #     f"The user is {char_name}, the genre is {genre}. Open with an immersive scene ending with what do you do next?"
@@ -1256,15 +3314,23 @@ def initialize_state(char_name, genre, role_id, image_style: str = "") -> dict:
 
     intro_prompt = INTRO_PROMPT_TEMPLATE.format(theme=theme, char_name=char_name, role=role_display)
 
-
-
-    #  no longer repalcing reall llm call temporarliy to prevent api
-    written_intro = llm.invoke([SystemMessage(content=intro_prompt)]).content
-    # written_intro = 'Just testing'
+    pooled = INTRO_POOL.take(role_id) if role_id in ROLE_TO_GENRE else None
+    if pooled is not None:
+        print(f"[intro_pool] serving pooled intro for {role_id}")
+        written_intro = fill_name(pooled, char_name)
+        yield "token", written_intro
+    else:
+        #  no longer repalcing reall llm call temporarliy to prevent api
+        written_intro = ""
+        for chunk in llm.stream([SystemMessage(content=intro_prompt)]):
+            written_intro += str(chunk.content or "")
+            if written_intro:
+                yield "token", written_intro
+        # written_intro = 'Just testing'
 
 
 
-    return {
+    yield "done", {
         "intro_text": written_intro,
         "story_summary": written_intro,
         "situation": [],
@@ -1278,6 +3344,7 @@ def initialize_state(char_name, genre, role_id, image_style: str = "") -> dict:
         "turn_count": 0,
         "tension": 3,
         "named_entities": [],
+        "scene_names": [],
         "last_action_raw": "",
         "last_action": "",
         "progress": 0,
@@ -1286,12 +3353,158 @@ def initialize_state(char_name, genre, role_id, image_style: str = "") -> dict:
         "img_generation_rules": "",
         "last_image_prompt": "",
         "last_image": None,
+        "image_seed": random.randrange(2**31),
+        # The intro scene is the starting summary.
+        "summarized_scenes": 1,
     }
 
 
-# To make sure button or js does not interfere with genre
-def on_begin_story_checked(char_name, genre, role_id, image_style, history, thread_id):
-    print("on_begin_story received genre ", genre)
+# Intro prefetch: the crystal-ball animation runs ~3.5 s before on_begin_story is even
+# called, so start the (slow) intro as soon as the story details are known and let
+# on_begin_story pick up the in-flight or finished result.
+INTRO_PREFETCH = (os.environ.get("INTRO_PREFETCH") or "1").strip().lower() not in ("0", "false", "no")
+INTRO_PREFETCH_TTL_S = float(os.environ.get("INTRO_PREFETCH_TTL_S") or "180")
+INTRO_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("INTRO_PREFETCH_WORKERS") or "4"),
+    thread_name_prefix="intro-prefetch",
+)
+INTRO_PREFETCHES: Dict[str, Dict[str, Any]] = {}
+_INTRO_PREFETCH_LOCK = threading.Lock()
+
+
+def _intro_prefetch_key(session: str, char_name, genre, role_id) -> str:
+    """Key for an intro: the image style is not part of the intro prompt, so it is applied at claim time.
+
+    `session` is a per-browser-session nonce, so sessions that pick the same details never
+    claim or cancel each other's prefetch.
+    """
+    char_name = (char_name or "Unknown Hero").strip()
+    genre, _ = _normalize_genre_for_role(genre=(genre or "fantasy").strip(), role_id=(role_id or "").strip())
+    return json.dumps([session, char_name, genre, (role_id or "").strip()])
+
+
+def _intro_prefetch_session(key: str) -> str:
+    """The session nonce of a key from _intro_prefetch_key ("" if there is none)."""
+    try:
+        parts = json.loads(key or "")
+    except ValueError:
+        return ""
+    return str(parts[0]) if isinstance(parts, list) and len(parts) == 4 else ""
+
+
+def _run_intro_prefetch(entry: dict, char_name, genre, role_id) -> None:
+    if entry["cancelled"]:
+        # Claimed (and given up) between INTRO_PREFETCHES and the submit.
+        entry["done"].set()
+        return
+    events = initialize_state_stream(char_name, genre, role_id, "")
+    try:
+        for kind, payload in events:
+            if entry["cancelled"]:
+                # Closing the generator closes the llm.stream response, stopping generation.
+                events.close()
+                print(f"[intro_prefetch] cancelled {entry['key']}")
+                return
+            if kind == "done":
+                entry["starter"] = payload
+            else:
+                entry["text"] = payload
+    except Exception as e:
+        entry["error"] = e
+        print(f"[intro_prefetch] failed for {entry['key']}: {e}")
+    finally:
+        entry["done"].set()
+
+
+def _cancel_intro_prefetch(key: str) -> None:
+    with _INTRO_PREFETCH_LOCK:
+        entry = INTRO_PREFETCHES.pop(key, None)
+    if entry:
+        entry["cancelled"] = True
+        entry["future"].cancel()
+
+
+def _expire_intro_prefetches() -> None:
+    now = time.time()
+    with _INTRO_PREFETCH_LOCK:
+        expired = [k for k, e in INTRO_PREFETCHES.items() if now - e["created"] > INTRO_PREFETCH_TTL_S]
+    for key in expired:
+        _cancel_intro_prefetch(key)
+
+
+def on_prefetch_intro(char_name, genre, role_id, image_style, previous_key):
+    """Start a background intro for these story details; return its key (kept in a gr.State).
+
+    A previous prefetch for different details is cancelled, since this session won't use it.
+    """
+    _expire_intro_prefetches()
+    if not INTRO_PREFETCH or not (genre or "").strip() or not (role_id or "").strip() or role_id == "__NEED_PATH__":
+        return previous_key or ""
+    key = _intro_prefetch_key(_intro_prefetch_session(previous_key) or uuid.uuid4().hex, char_name, genre, role_id)
+    if previous_key and previous_key != key:
+        _cancel_intro_prefetch(previous_key)
+    if INTRO_POOL.available((role_id or "").strip()):
+        # on_begin_story will be served from the pool; a prefetch would only burn a pooled intro.
+        return key
+    with _INTRO_PREFETCH_LOCK:
+        if key in INTRO_PREFETCHES:
+            return key
+        entry: Dict[str, Any] = {
+            "key": key,
+            "created": time.time(),
+            "text": "",
+            "starter": None,
+            "error": None,
+            "cancelled": False,
+            "done": threading.Event(),
+        }
+        INTRO_PREFETCHES[key] = entry
+    normalized_genre, _ = _normalize_genre_for_role(genre=(genre or "fantasy"), role_id=(role_id or ""))
+    entry["future"] = INTRO_EXECUTOR.submit(_run_intro_prefetch, entry, char_name, normalized_genre, role_id)
+    print(f"[intro_prefetch] started {key}")
+    return key
+
+
+def _follow_intro_prefetch(entry: dict):
+    """Yield ("token", text) from an in-flight prefetch, then ("done", starter) or nothing on failure."""
+    shown = ""
+    while not entry["done"].wait(timeout=0.05):
+        text = entry["text"]
+        if text and text != shown:
+            shown = text
+            yield "token", text
+    if entry["starter"]:
+        if entry["text"] != shown:
+            yield "token", entry["text"]
+        yield "done", entry["starter"]
+
+
+def _intro_events(char_name, genre, role_id, image_style, prefetch_key=""):
+    """initialize_state_stream, served from this session's prefetch (prefetch_key) when it matches."""
+    _expire_intro_prefetches()
+    entry = None
+    session = _intro_prefetch_session(prefetch_key)
+    if session:
+        with _INTRO_PREFETCH_LOCK:
+            entry = INTRO_PREFETCHES.pop(_intro_prefetch_key(session, char_name, genre, role_id), None)
+    future = entry.get("future") if entry is not None else None
+    if entry is not None and not entry["cancelled"] and (future is None or future.cancel()):
+        # Still queued behind other sessions' prefetches on INTRO_EXECUTOR: waiting for a
+        # worker would be slower than writing the intro live right away.
+        entry["cancelled"] = True
+        print(f"[intro_prefetch] {entry['key']} had not started; writing the intro live")
+    elif entry is not None and not entry["cancelled"]:
+        print(f"[intro_prefetch] using prefetched intro {entry['key']}")
+        for kind, payload in _follow_intro_prefetch(entry):
+            if kind == "done":
+                yield "done", {**payload, "image_style": (image_style or "").strip()}
+                return
+            yield kind, payload
+        print("[intro_prefetch] prefetch failed; writing the intro live")
+    yield from initialize_state_stream(char_name, genre, role_id, image_style)
+
+
+def _checked_begin_inputs(genre, role_id, image_style) -> tuple[str, str, str]:
     # Never hard-fail here: a malicious/buggy client can send None or mismatched
     # values and we should recover gracefully rather than crashing the app.
     if genre is None:
@@ -1300,18 +3513,71 @@ def on_begin_story_checked(char_name, genre, role_id, image_style, history, thre
         role_id = ""
     if image_style is None:
         image_style = ""
-    return on_begin_story(char_name, genre, role_id, image_style, history, thread_id)
+    return genre, role_id, image_style
+
+
+# To make sure button or js does not interfere with genre
+def on_begin_story_checked(char_name, genre, role_id, image_style, history, thread_id, prefetch_key=""):
+    print("on_begin_story received genre ", genre)
+    genre, role_id, image_style = _checked_begin_inputs(genre, role_id, image_style)
+    return on_begin_story(char_name, genre, role_id, image_style, history, thread_id, prefetch_key)
+
+
+def on_begin_story_checked_stream(char_name, genre, role_id, image_style, history, thread_id, prefetch_key=""):
+    print("on_begin_story received genre ", genre)
+    genre, role_id, image_style = _checked_begin_inputs(genre, role_id, image_style)
+    return on_begin_story_stream(char_name, genre, role_id, image_style, history, thread_id, prefetch_key)
+
+
+def on_begin_story(char_name, genre, role_id, image_style, history, thread_id, prefetch_key=""):
+    return _last_event(on_begin_story_stream(char_name, genre, role_id, image_style, history, thread_id, prefetch_key))
+
+
+async def aon_begin_story_checked_stream(char_name, genre, role_id, image_style, history, thread_id, prefetch_key=""):
+    print("on_begin_story received genre ", genre)
+    genre, role_id, image_style = _checked_begin_inputs(genre, role_id, image_style)
+    async for out in aon_begin_story_stream(char_name, genre, role_id, image_style, history, thread_id, prefetch_key):
+        yield out
 
 
-def on_begin_story(char_name, genre, role_id, image_style, history, thread_id):
+def on_begin_story_stream(char_name, genre, role_id, image_style, history, thread_id, prefetch_key=""):
+    """Generator version of on_begin_story: yields the intro while it is being written."""
+    yield from _drive_sync(_begin_story_program(char_name, genre, role_id, image_style, history, thread_id, prefetch_key))
+
+
+async def aon_begin_story_stream(char_name, genre, role_id, image_style, history, thread_id, prefetch_key=""):
+    """on_begin_story_stream for ASYNC_GRAPH: runs on the event loop."""
+    program = _begin_story_program(char_name, genre, role_id, image_style, history, thread_id, prefetch_key)
+    async for out in _drive_async(program, stream=STREAM_TOKENS):
+        yield out
+
+
+def _begin_story_program(char_name, genre, role_id, image_style, history, thread_id, prefetch_key=""):
+    """Handler program behind on_begin_story_stream / aon_begin_story_stream."""
     # standard stuff
     thread_id = _make_thread_id()
     normalized_genre, _role_display = _normalize_genre_for_role(
         genre=(genre or "fantasy"),
         role_id=(role_id or ""),
     )
-    starter = initialize_state(char_name, normalized_genre, role_id, image_style)
-    opening, opening_image = run_until_interrupt(app, starter, config={"configurable": {"thread_id": thread_id}})
+    starter: dict = {}
+    # Intros are usually served by the pool or a prefetch; a live one streams on a worker thread.
+    intro = _Stream(
+        lambda: _intro_events(char_name, normalized_genre, role_id, image_style, prefetch_key),
+        lambda: _aiter_in_thread(lambda: _intro_events(char_name, normalized_genre, role_id, image_style, prefetch_key)),
+    )
+    while (event := (yield intro)) is not None:
+        kind, payload = event
+        if kind == "done":
+            starter = payload
+        else:
+            partial = (history or []) + [{"role": "assistant", "content": payload}]
+            yield partial, thread_id, char_name, normalized_genre
+    opening, opening_image = "Nothing for now", None
+    events = _graph_events(starter, {"configurable": {"thread_id": thread_id}})
+    while (event := (yield events)) is not None:
+        if event[0] == "done":
+            opening, opening_image = event[1]
     history = (history or []) + [{"role": "assistant", "content": opening}]
     try:
         if opening_image is not None:
@@ -1329,140 +3595,216 @@ def on_begin_story(char_name, genre, role_id, image_style, history, thread_id):
         "images": images,
         "turn_records": [],
     }
+    lock = _thread_lock(thread_id)
+    yield _Acquire(lock)
     try:
-        st = app.get_state({"configurable": {"thread_id": thread_id}})
-        if getattr(st, "interrupts", None):
-            meta["cfg"] = st.config
-            meta["last_interrupt_cfg"] = st.config
-    except Exception:
-        pass
-    THREAD_META[thread_id] = meta
+        try:
+            states = StateSnapshots(app, enabled=STATE_SNAPSHOT_CACHE)
+            st = states.get({"configurable": {"thread_id": thread_id}})
+            if getattr(st, "interrupts", None):
+                _pin_interrupt(meta, st)
+                meta["opening_image_job"] = _start_image_job(thread_id, meta, st)
+                _start_speculation(thread_id, meta, states)
+        except Exception:
+            pass
+        meta["story_tree"] = StoryTree(max_nodes=STORY_TREE_MAX_NODES)
+        meta["story_tree"].start(cfg=meta.get("cfg"), image=opening_image, history=history)
+        # Registered only once complete, and before the lock lets the image job write back.
+        SESSIONS.put(thread_id, meta)
+    finally:
+        lock.release()
 
     # return for gradio
-    return (
+    yield (
         history,
         thread_id,
         char_name,
         normalized_genre,
     )
 
+def _with_streamed_continuation(history: list[dict], partial: str) -> list[dict]:
+    """Copy of history with a partial Continue scene appended to the last assistant text."""
+    history = [dict(item) if isinstance(item, dict) else item for item in (history or [])]
+    idx = _find_last_assistant_text_index(history)
+    if idx is None:
+        return history + [{"role": "assistant", "content": partial}]
+    prior = str(history[idx].get("content") or "")
+    history[idx]["content"] = (prior + "\n\n" + partial).strip() if prior else partial
+    return history
+
+
 def continue_story(history, thread_id):
+    return _last_event(continue_story_stream(history, thread_id))
+
+
+def continue_story_stream(history, thread_id):
+    """Generator version of continue_story: yields the growing scene while the storyteller streams."""
+    yield from _drive_sync(_continue_program(history, thread_id))
+
+
+async def acontinue_story_stream(history, thread_id):
+    """continue_story_stream for ASYNC_GRAPH: runs on the event loop."""
+    async for out in _drive_async(_continue_program(history, thread_id), stream=STREAM_TOKENS):
+        yield out
+
+
+def _continue_program(history, thread_id):
+    """Handler program behind continue_story_stream / acontinue_story_stream."""
     if not thread_id:
-        return history, thread_id
+        yield history, thread_id
+        return
 
-    meta = THREAD_META.get(thread_id)
+    meta = SESSIONS.get(thread_id)
     if meta is None:
-        return history, thread_id
+        yield history, thread_id
+        return
 
     if meta.get("ended"):
         history = list(history or [])
         history.append({"role": "assistant", "content": "The story has ended. Type __REWIND__ to rewind, or __MENU__ to return to the menu."})
-        return history, thread_id
-    meta.setdefault("inputs", []).append(CONTINUE_KEY)
+        yield history, thread_id
+        return
+    # Snapshots read while handling this Continue; invalidated once the graph has run.
+    states = StateSnapshots(app, enabled=STATE_SNAPSHOT_CACHE)
 
-    # Continue must also resume only from a live interrupt checkpoint.
-    interrupt_cfg = None
-    for cand in (meta.get("cfg"), meta.get("last_interrupt_cfg"), {"configurable": {"thread_id": thread_id}}):
-        if not isinstance(cand, dict) or not cand:
-            continue
-        try:
-            st = app.get_state(cand)
-            if getattr(st, "interrupts", None):
-                interrupt_cfg = st.config
-                break
-        except Exception:
-            continue
-    if not interrupt_cfg:
-        meta["ended"] = True
-        history = list(history or [])
-        history.append({"role": "assistant", "content": "The story has ended. Type __REWIND__ to rewind, or __MENU__ to return to the menu."})
-        return history, thread_id
+    def _resume_continue(history):
+        meta.setdefault("inputs", []).append(CONTINUE_KEY)
 
-    cfg_before = copy.deepcopy(interrupt_cfg)
-    try:
-        interrupts = []
+        # Continue must also resume only from a live interrupt checkpoint.
+        interrupt_cfg = None
+        for cand in (meta.get("cfg"), meta.get("last_interrupt_cfg"), {"configurable": {"thread_id": thread_id}}):
+            if not isinstance(cand, dict) or not cand:
+                continue
+            try:
+                st = states.get(cand)
+                if getattr(st, "interrupts", None):
+                    interrupt_cfg = st.config
+                    break
+            except Exception:
+                continue
+        if not interrupt_cfg:
+            meta["ended"] = True
+            history = list(history or [])
+            history.append({"role": "assistant", "content": "The story has ended. Type __REWIND__ to rewind, or __MENU__ to return to the menu."})
+            yield history, thread_id
+            return
+
+        cfg_before = copy.deepcopy(interrupt_cfg)
         try:
-            st_for_resume = app.get_state(interrupt_cfg)
-            interrupts = list(getattr(st_for_resume, "interrupts", None) or [])
-        except Exception:
-            interrupts = []
+            resume_cmd = _resume_command(meta, interrupt_cfg, CONTINUE_KEY, states)
 
-        resume_cmd = Command(resume=CONTINUE_KEY)
-        if interrupts:
-            resume_cmd = Command(resume={interrupts[0].id: CONTINUE_KEY})
+            yield from _claim_speculation(thread_id, meta, interrupt_cfg)
+            next_scene, new_image = "Nothing for now", None
+            try:
+                events = _graph_events(resume_cmd, interrupt_cfg)
+                while (event := (yield events)) is not None:
+                    kind, payload = event
+                    if kind == "done":
+                        next_scene, new_image = payload
+                    else:
+                        yield _with_streamed_continuation(history, payload), thread_id
+            finally:
+                PRECOMPUTED_NODE_OUTPUTS.pop(thread_id, None)
+        except Exception as e:
+            print(f"[chat] continue failed (likely ended thread); forcing ended state: {e}")
+            next_scene, new_image = "The story has ended. Type __REWIND__ to rewind, or __MENU__ to return to the menu.", None
+            meta["ended"] = True
+        states.invalidate()
+
+        if next_scene == "Nothing for now":
+            try:
+                st = states.get({"configurable": {"thread_id": thread_id}})
+                values = getattr(st, "values", None)
+                situation = values.get("situation") if isinstance(values, dict) else None
+                if situation:
+                    last = situation[-1]
+                    recovered = getattr(last, "content", None)
+                    next_scene = (recovered.strip() if isinstance(recovered, str) else str(last).strip())
+                else:
+                    next_scene = "The story has ended. Type __REWIND__ to rewind, or __MENU__ to return to the menu."
+            except Exception:
+                next_scene = "The story has ended. Type __REWIND__ to rewind, or __MENU__ to return to the menu."
 
-        next_scene, new_image = run_until_interrupt(app, resume_cmd, config=interrupt_cfg)
-    except Exception as e:
-        print(f"[chat] continue failed (likely ended thread); forcing ended state: {e}")
-        next_scene, new_image = "The story has ended. Type __REWIND__ to rewind, or __MENU__ to return to the menu.", None
-        meta["ended"] = True
+        if isinstance(next_scene, str) and next_scene.lstrip().startswith(("GAME OVER", "GAME😩OVER")):
+            meta["ended"] = True
+
+        if new_image is not None:
+            meta["last_image"] = new_image
+            meta.setdefault("images", []).append(new_image)
+
+        # Continue should NOT add a synthetic user message; append to the last assistant *text* message.
+        history = list(history or [])
+        last_text_idx = _find_last_assistant_text_index(history)
+        record = {
+            "type": "continue",
+            "assistant_text_index": last_text_idx,
+            "assistant_text_before": (str(history[last_text_idx].get("content") or "") if last_text_idx is not None else ""),
+            "image_added": bool(new_image is not None),
+            "ended_after": bool(meta.get("ended")),
+            "cfg_before": cfg_before,
+        }
+        if last_text_idx is not None:
+            prior = str(history[last_text_idx].get("content") or "")
+            history[last_text_idx]["content"] = (prior + "\n\n" + next_scene).strip() if prior else next_scene
+        else:
+            history.append({"role": "assistant", "content": next_scene})
 
-    if next_scene == "Nothing for now":
         try:
-            st = app.get_state({"configurable": {"thread_id": thread_id}})
-            values = getattr(st, "values", None)
-            situation = values.get("situation") if isinstance(values, dict) else None
-            if situation:
-                last = situation[-1]
-                recovered = getattr(last, "content", None)
-                next_scene = (recovered.strip() if isinstance(recovered, str) else str(last).strip())
-            else:
-                next_scene = "The story has ended. Type __REWIND__ to rewind, or __MENU__ to return to the menu."
+            if new_image is not None:
+                _append_real_image_message(history, image_bytes=new_image, thread_id=thread_id)
         except Exception:
-            next_scene = "The story has ended. Type __REWIND__ to rewind, or __MENU__ to return to the menu."
+            pass
 
-    if isinstance(next_scene, str) and next_scene.lstrip().startswith(("GAME OVER", "GAME😩OVER")):
-        meta["ended"] = True
+        meta.setdefault("turn_records", []).append(record)
+        try:
+            st = states.get({"configurable": {"thread_id": thread_id}})
+            if getattr(st, "interrupts", None):
+                _pin_interrupt(meta, st)
+                record["image_job"] = _start_image_job(thread_id, meta, st)
+                _start_speculation(thread_id, meta, states)
+        except Exception:
+            pass
+        _advance_story_tree(meta, record, CONTINUE_KEY, new_image, history)
+        yield _Offload(_store_session, thread_id, meta)
 
-    if new_image is not None:
-        meta["last_image"] = new_image
-        meta.setdefault("images", []).append(new_image)
+        yield history, thread_id
 
-    # Continue should NOT add a synthetic user message; append to the last assistant *text* message.
-    history = list(history or [])
-    last_text_idx = _find_last_assistant_text_index(history)
-    record = {
-        "type": "continue",
-        "assistant_text_index": last_text_idx,
-        "assistant_text_before": (str(history[last_text_idx].get("content") or "") if last_text_idx is not None else ""),
-        "image_added": bool(new_image is not None),
-        "ended_after": bool(meta.get("ended")),
-        "cfg_before": cfg_before,
-    }
-    if last_text_idx is not None:
-        prior = str(history[last_text_idx].get("content") or "")
-        history[last_text_idx]["content"] = (prior + "\n\n" + next_scene).strip() if prior else next_scene
-    else:
-        history.append({"role": "assistant", "content": next_scene})
 
+    lock = _thread_lock(thread_id)
+    yield _Acquire(lock)
     try:
-        if new_image is not None:
-            _append_real_image_message(history, image_bytes=new_image, thread_id=thread_id)
-    except Exception:
-        pass
-
-    meta.setdefault("turn_records", []).append(record)
-    try:
-        st = app.get_state({"configurable": {"thread_id": thread_id}})
-        if getattr(st, "interrupts", None):
-            meta["cfg"] = st.config
-            meta["last_interrupt_cfg"] = st.config
-    except Exception:
-        pass
-
-    return history, thread_id
-
+        history, _ = _deliver_ready_images(history, thread_id, meta)
+        _remember_story_history(meta, history)
+        yield from _resume_continue(history)
+    finally:
+        lock.release()
 
 from gradio_frontend import build_demo, CSS, HEAD
+if ASYNC_GRAPH:
+    _ui_handlers = dict(
+        on_user_message=aon_user_message_stream,
+        on_begin_story_checked=aon_begin_story_checked_stream,
+        on_continue_story=acontinue_story_stream,
+        on_image_followup=aon_image_followup,
+    )
+else:
+    _ui_handlers = dict(
+        on_user_message=on_user_message_stream if STREAM_TOKENS else on_user_message,
+        on_begin_story_checked=on_begin_story_checked_stream if STREAM_TOKENS else on_begin_story_checked,
+        on_continue_story=continue_story_stream if STREAM_TOKENS else continue_story,
+        on_image_followup=on_image_followup,
+    )
 demo = build_demo(
-    on_user_message=on_user_message,
+    **_ui_handlers,
     on_begin_story=on_begin_story,
-    on_begin_story_checked=on_begin_story_checked,
-    on_continue_story=continue_story,
     on_rewind_story=on_rewind_click,
     on_menu_story=on_menu_click,
+    on_prefetch_intro=on_prefetch_intro,
+    story_branches=story_branches,
+    on_switch_branch=on_switch_branch,
 )
 if __name__ == "__main__":
+    INTRO_POOL.refill_known_roles()
     demo.queue().launch(theme=gr.themes.Soft(
                             primary_hue="purple",
                             secondary_hue="yellow",
@@ -1477,6 +3819,6 @@ if __name__ == "__main__":
                             ),
                         css=CSS,
                         head=HEAD,
-                        allowed_paths=[os.path.abspath("frontend")]
+                        allowed_paths=[os.path.abspath("frontend"), os.path.abspath(RUNTIME_IMAGES_DIR)]
                         )
     
\ No newline at end of file
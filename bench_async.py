@@ -0,0 +1,116 @@
+"""Benchmark: sync (thread per player) vs async (event loop) graph execution.
+
+Every model call is replaced by a stub that just waits --latency seconds, so the numbers
+show how each path copes with many players waiting on the model at once, not model speed.
+Images, the intro pool, intro prefetch and speculation are off so only the turn path is
+measured.
+
+    python bench_async.py --players 200 --turns 3 --latency 0.5 --threads 40
+
+--threads mirrors Gradio's worker thread limit, which caps the sync path.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from script_stubs import StubChat, stub_env
+
+stub_env(ASYNC_IMAGES=None, JUDGER_FAST_PATH=None)
+
+import app as fable
+
+
+def _reply(text: str) -> str:
+    if "verdict" in text:
+        return '{"verdict": "ok", "resolved_action": "", "progress_change": 5}'
+    return "The lantern gutters as something moves in the dark. What do you do?"
+
+
+def _player_sync(i: int, turns: int, turn_times: list[float]) -> None:
+    out = fable._last_event(fable.on_begin_story_stream(f"Player {i}", "fantasy", "elven_ranger", "", [], ""))
+    history, thread_id = out[0], out[1]
+    for t in range(turns):
+        started = time.perf_counter()
+        out = fable._last_event(fable.on_user_message_stream(f"I search room {t}", history, thread_id))
+        turn_times.append(time.perf_counter() - started)
+        history = out[1]
+
+
+async def _player_async(i: int, turns: int, turn_times: list[float]) -> None:
+    async for out in fable.aon_begin_story_stream(f"Player {i}", "fantasy", "elven_ranger", "", [], ""):
+        pass
+    history, thread_id = out[0], out[1]
+    for t in range(turns):
+        started = time.perf_counter()
+        async for out in fable.aon_user_message_stream(f"I search room {t}", history, thread_id):
+            pass
+        turn_times.append(time.perf_counter() - started)
+        history = out[1]
+
+
+def _report(name: str, wall: float, turn_times: list[float], peak_threads: int) -> None:
+    turn_times = sorted(turn_times)
+    p95 = turn_times[int(0.95 * (len(turn_times) - 1))] if turn_times else 0.0
+    print(
+        f"{name:>5}: wall {wall:7.2f}s | turns {len(turn_times)} | "
+        f"turn p50 {statistics.median(turn_times) if turn_times else 0.0:6.2f}s p95 {p95:6.2f}s | "
+        f"peak threads {peak_threads}"
+    )
+
+
+def _watch_threads(stop: threading.Event, peak: list[int]) -> None:
+    while not stop.is_set():
+        peak[0] = max(peak[0], threading.active_count())
+        time.sleep(0.02)
+
+
+def _measure(run) -> tuple[float, int]:
+    stop, peak = threading.Event(), [threading.active_count()]
+    watcher = threading.Thread(target=_watch_threads, args=(stop, peak), daemon=True)
+    watcher.start()
+    started = time.perf_counter()
+    run()
+    wall = time.perf_counter() - started
+    stop.set()
+    watcher.join()
+    return wall, peak[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per stubbed model call")
+    parser.add_argument("--threads", type=int, default=40, help="worker threads for the sync path")
+    args = parser.parse_args()
+
+    fable.llm = fable.llm2 = StubChat(reply=_reply, latency_s=args.latency)
+    # No image providers in a benchmark.
+    fable._should_generate_image = lambda state: False
+
+    sync_times: list[float] = []
+
+    def _run_sync():
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(lambda i: _player_sync(i, args.turns, sync_times), range(args.players)))
+
+    wall, peak = _measure(_run_sync)
+    _report("sync", wall, sync_times, peak)
+
+    async_times: list[float] = []
+
+    async def _all_async():
+        await asyncio.gather(*(_player_async(i, args.turns, async_times) for i in range(args.players)))
+
+    wall, peak = _measure(lambda: asyncio.run(_all_async()))
+    _report("async", wall, async_times, peak)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Benchmark: checkpoint size and (de)serialization time as a story gets longer.
+
+Plays one player through --turns turns twice in the same process: with the situation /
+your_action channels unbounded (SITUATION_WINDOW=0, ACTION_WINDOW=0) and with the default
+windows. After every --every turns it serializes the thread's newest checkpoint the way
+the checkpointer does and times a full app.get_state, so the growth per turn shows up
+directly. Every model call is a stub that answers at once with a --scene-chars long
+scene and moves the story 10% closer to a milestone; images and the judge fast path are
+off.
+
+    python bench_checkpoints.py --turns 80 --every 20 --scene-chars 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+from script_stubs import StubChat, stub_env
+
+stub_env()
+
+import app as fable
+
+SCENE_CHARS = 2000
+
+
+def _reply(text: str) -> str:
+    if "RULES ENGINE" in text:
+        return '{"verdict": "ok", "resolved_action": "", "progress_change": 10, "story_summary": "So far, so good."}'
+    if "Summarize" in text:
+        return "So far, so good."
+    scene = "The lantern gutters as something moves in the dark. "
+    return (scene * (SCENE_CHARS // len(scene) + 1))[:SCENE_CHARS] + " What do you do?"
+
+
+def _measure(thread_id: str) -> tuple[int, float, float]:
+    """(bytes, ms to serialize, ms for app.get_state) of the thread's newest checkpoint."""
+    cfg = {"configurable": {"thread_id": thread_id}}
+    values = fable.memory.get_tuple(cfg).checkpoint["channel_values"]
+    started = time.perf_counter()
+    size = sum(len(fable.memory.serde.dumps_typed(value)[1]) for value in values.values())
+    dump_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    fable.app.get_state(cfg)
+    load_ms = (time.perf_counter() - started) * 1000
+    return size, dump_ms, load_ms
+
+
+def _play(name: str, turns: int, every: int) -> None:
+    out = fable._last_event(fable.on_begin_story_stream("Mira", "fantasy", "elven_ranger", "", [], ""))
+    history, thread_id = out[0], out[1]
+    for t in range(1, turns + 1):
+        history = fable._last_event(fable.on_user_message_stream(f"I search room {t}", history, thread_id))[1]
+        if t % every == 0:
+            size, dump_ms, load_ms = _measure(thread_id)
+            print(f"{name:>9} turn {t:4d}: checkpoint {size / 1024:8.1f} KiB | serialize {dump_ms:6.2f} ms | get_state {load_ms:6.2f} ms")
+    archive = fable.SCENE_ARCHIVES.get(thread_id)
+    if archive is not None:
+        print(f"{name:>9}: scene archive holds {len(archive)} scenes in {len(archive.chapters())} closed chapters")
+    fable.SESSIONS.discard(thread_id, reason="benchmark")
+
+
+def main() -> None:
+    global SCENE_CHARS
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=80)
+    parser.add_argument("--every", type=int, default=20, help="measure every this many turns")
+    parser.add_argument("--scene-chars", type=int, default=2000, help="length of every stub scene")
+    args = parser.parse_args()
+    SCENE_CHARS = args.scene_chars
+
+    fable.llm = fable.llm2 = StubChat(reply=_reply)
+    fable._should_generate_image = lambda state: False
+    fable.LLM_CACHE.max_entries = 0
+
+    windows = (fable.SITUATION_WINDOW, fable.ACTION_WINDOW)
+    fable.SITUATION_WINDOW = fable.ACTION_WINDOW = 0
+    _play("unbounded", args.turns, args.every)
+    fable.SITUATION_WINDOW, fable.ACTION_WINDOW = windows
+    _play("windowed", args.turns, args.every)
+
+
+if __name__ == "__main__":
+    main()
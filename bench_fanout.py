@@ -0,0 +1,118 @@
+"""Benchmark: per-turn wall clock with post-scene work chained vs fanned out.
+
+Runs one player through --turns turns twice, in child processes (the graph is built at
+import time): once with PARALLEL_BOOKKEEPING=0, where image generation runs alone after the
+scene and a due summary goes into the next judge call, and once with the default fan-out,
+where the bookkeeping node folds the summary in while the image is being made. Every model
+call and the image provider are stubs that wait a fixed time per kind of call, so the
+numbers show how the graph schedules work, not provider speed. Images are generated inline
+(ASYNC_IMAGES=0) on every turn and the caches and judge fast path are off.
+
+    python bench_fanout.py --turns 8 --scene 1.0 --judge 0.4 --fused-judge 0.8 --summary 0.7 --image 1.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+_RESULT_TAG = "[bench_fanout] result "
+
+
+def _child(args: argparse.Namespace) -> None:
+    from script_stubs import StubChat, stub_env
+
+    stub_env(SUMMARY_TRIGGER_TOKENS=str(args.summary_trigger))
+
+    import app as fable
+
+    scene = "Captain Vorn raises a lantern as the Ashen Gate groans open. What do you do?"
+
+    def _reply(text: str) -> tuple[float, str]:
+        if "ARCHIVIST" in text:
+            return args.fused_judge, '{"verdict": "ok", "resolved_action": "", "progress_change": 5, "story_summary": "So far."}'
+        if "RULES ENGINE" in text:
+            return args.judge, '{"verdict": "ok", "resolved_action": "", "progress_change": 5}'
+        if "Summarize" in text:
+            return args.summary, "So far, the hero has walked the road."
+        if "tiny, stable visual tagset" in text:
+            return args.image_llm, "STYLE: painterly\nHERO: cloaked ranger\nMOTIFS: lantern, gate"
+        if "diffusion prompt" in text:
+            return args.image_llm, "cloaked ranger at a huge gate, lantern light, wide shot"
+        return args.scene, scene
+
+    def _slow_image(prompt, **kwargs):
+        time.sleep(args.image)
+        return b"\x89PNG stub", "image/png"
+
+    fable.llm = fable.llm2 = StubChat(reply=_reply)
+    fable.pollinations_image = _slow_image
+    fable._should_generate_image = lambda state: True
+    fable.IMAGE_CACHE.max_files = 0
+    fable.LLM_CACHE.max_entries = 0
+
+    out = fable._last_event(fable.on_begin_story_stream("Mira", "fantasy", "elven_ranger", "", [], ""))
+    history, thread_id = out[0], out[1]
+    turn_times: list[float] = []
+    for t in range(args.turns):
+        started = time.perf_counter()
+        out = fable._last_event(fable.on_user_message_stream(f"I search room {t}", history, thread_id))
+        turn_times.append(time.perf_counter() - started)
+        history = out[1]
+    print(_RESULT_TAG + json.dumps({"turn_times": turn_times}), flush=True)
+
+
+def _run(mode: str, argv: list[str]) -> list[float]:
+    env = dict(os.environ, PARALLEL_BOOKKEEPING="1" if mode == "fanout" else "0")
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", *argv],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    for line in proc.stdout.splitlines():
+        if line.startswith(_RESULT_TAG):
+            return json.loads(line[len(_RESULT_TAG):])["turn_times"]
+    sys.stderr.write(proc.stderr[-2000:])
+    raise SystemExit(f"{mode} run failed (exit {proc.returncode})")
+
+
+def _report(name: str, turn_times: list[float]) -> None:
+    print(
+        f"{name:>7}: turns {len(turn_times)} | mean {statistics.mean(turn_times):6.2f}s | "
+        f"p50 {statistics.median(turn_times):6.2f}s | max {max(turn_times):6.2f}s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--scene", type=float, default=1.0, help="seconds per storyteller scene")
+    parser.add_argument("--judge", type=float, default=0.4, help="seconds per plain judge call")
+    parser.add_argument("--fused-judge", type=float, default=0.8, help="seconds per judge call that also summarizes")
+    parser.add_argument("--summary", type=float, default=0.7, help="seconds per summary call")
+    parser.add_argument("--image-llm", type=float, default=0.3, help="seconds per image rules/prompt call")
+    parser.add_argument("--image", type=float, default=1.2, help="seconds per image provider request")
+    parser.add_argument("--summary-trigger", type=int, default=30, help="SUMMARY_TRIGGER_TOKENS for both runs")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args, _ = parser.parse_known_args()
+    if args.child:
+        _child(args)
+        return
+
+    argv = [a for a in sys.argv[1:] if a != "--child"]
+    chained = _run("chained", argv)
+    _report("chained", chained)
+    fanout = _run("fanout", argv)
+    _report("fanout", fanout)
+    saved = statistics.mean(chained) - statistics.mean(fanout)
+    print(f"fan-out saves {saved:.2f}s per turn on average ({saved / statistics.mean(chained):.0%})")
+
+
+if __name__ == "__main__":
+    main()
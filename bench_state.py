@@ -0,0 +1,95 @@
+"""Benchmark: app.get_state reads per turn with and without the request's snapshot cache.
+
+Plays one player through --turns turns twice in the same process, with
+STATE_SNAPSHOT_CACHE off and then on, and counts every app.get_state call made on the turn
+path and the time spent deserializing state in them. Every model call is a stub that
+answers at once with a --scene-chars long scene, so the situation list each read has to
+load keeps growing as it would in a long story. Images and the judge fast path are off;
+speculative Continue is on, since it reads the pinned state too.
+
+    python bench_state.py --turns 40 --scene-chars 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import time
+
+from script_stubs import StubChat, stub_env
+
+stub_env(SPECULATIVE_CONTINUE=os.environ.get("SPECULATIVE_CONTINUE") or "1")
+
+import app as fable
+
+SCENE_CHARS = 2000
+READS = {"calls": 0, "seconds": 0.0}
+
+
+def _reply(text: str) -> str:
+    if "RULES ENGINE" in text:
+        return '{"verdict": "ok", "resolved_action": "", "progress_change": 1}'
+    scene = "The lantern gutters as something moves in the dark. "
+    return (scene * (SCENE_CHARS // len(scene) + 1))[:SCENE_CHARS] + " What do you do?"
+
+
+def _counting(get_state):
+    def _get_state(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return get_state(*args, **kwargs)
+        finally:
+            READS["seconds"] += time.perf_counter() - started
+            READS["calls"] += 1
+
+    return _get_state
+
+
+def _play(turns: int) -> list[tuple[int, float, float]]:
+    """(get_state calls, seconds in get_state, turn seconds) per turn."""
+    out = fable._last_event(fable.on_begin_story_stream("Mira", "fantasy", "elven_ranger", "", [], ""))
+    history, thread_id = out[0], out[1]
+    rows = []
+    for t in range(turns):
+        calls, seconds = READS["calls"], READS["seconds"]
+        started = time.perf_counter()
+        if t % 2:
+            history = fable._last_event(fable.continue_story_stream(history, thread_id))[0]
+        else:
+            history = fable._last_event(fable.on_user_message_stream(f"I search room {t}", history, thread_id))[1]
+        rows.append((READS["calls"] - calls, READS["seconds"] - seconds, time.perf_counter() - started))
+    fable.SESSIONS.discard(thread_id, reason="benchmark")
+    return rows
+
+
+def _report(name: str, rows: list[tuple[int, float, float]]) -> float:
+    reads = statistics.mean(r[0] for r in rows)
+    read_ms = statistics.mean(r[1] for r in rows) * 1000
+    turn_ms = statistics.mean(r[2] for r in rows) * 1000
+    print(f"{name:>9}: {reads:4.1f} get_state/turn | {read_ms:7.2f} ms reading state/turn | {turn_ms:7.1f} ms/turn")
+    return read_ms
+
+
+def main() -> None:
+    global SCENE_CHARS
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=40, help="turns per run; odd ones are Continues")
+    parser.add_argument("--scene-chars", type=int, default=2000, help="length of every stub scene")
+    args = parser.parse_args()
+    SCENE_CHARS = args.scene_chars
+
+    fable.llm = fable.llm2 = StubChat(reply=_reply)
+    fable._should_generate_image = lambda state: False
+    fable.LLM_CACHE.max_entries = 0
+    fable.app.get_state = _counting(fable.app.get_state)
+
+    fable.STATE_SNAPSHOT_CACHE = False
+    uncached = _report("uncached", _play(args.turns))
+    fable.STATE_SNAPSHOT_CACHE = True
+    cached = _report("cached", _play(args.turns))
+    print(f"snapshot cache saves {uncached - cached:.2f} ms of state reads per turn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Content-addressed blob store for generated images.
+
+Story state and thread meta only keep the sha256 hex digest of an image; the bytes
+live here once, no matter how many checkpoints or chat messages refer to them.
+
+Tiers:
+  - memory: LRU bounded by max_memory_bytes
+  - disk (optional): <disk_dir>/<hash>.png, used when the memory tier evicted a blob
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+def blob_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_blob_hash(value: object) -> bool:
+    if not isinstance(value, str) or len(value) != 64:
+        return False
+    try:
+        int(value, 16)
+        return True
+    except ValueError:
+        return False
+
+
+class BlobStore:
+    def __init__(self, *, max_memory_bytes: int = 64 * 1024 * 1024, disk_dir: str | None = None) -> None:
+        self.max_memory_bytes = max(0, int(max_memory_bytes))
+        self.disk_dir = disk_dir or None
+        self._blobs: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, data: bytes) -> str:
+        """Store bytes and return their content hash (idempotent)."""
+        data = bytes(data)
+        key = blob_hash(data)
+        with self._lock:
+            if key in self._blobs:
+                self._blobs.move_to_end(key)
+            else:
+                self._blobs[key] = data
+                self._memory_bytes += len(data)
+                self._evict_locked()
+        if self.disk_dir:
+            self._write_disk(key, data)
+        return key
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            data = self._blobs.get(key)
+            if data is not None:
+                self._blobs.move_to_end(key)
+                return data
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if blob_hash(data) != key:
+            return None
+        with self._lock:
+            if key not in self._blobs:
+                self._blobs[key] = data
+                self._memory_bytes += len(data)
+                self._evict_locked()
+        return data
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            if key in self._blobs:
+                return True
+        return bool(self.disk_dir) and isinstance(key, str) and os.path.exists(self._disk_path(key))
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"blobs": len(self._blobs), "memory_bytes": self._memory_bytes}
+
+    def _evict_locked(self) -> None:
+        # Always keep the newest blob, even if it alone exceeds the budget.
+        while self._memory_bytes > self.max_memory_bytes and len(self._blobs) > 1:
+            _, old = self._blobs.popitem(last=False)
+            self._memory_bytes -= len(old)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir or "", f"{key}.png")
+
+    def _write_disk(self, key: str, data: bytes) -> None:
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(self.disk_dir or ".", exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[blob_store] failed to write {path}: {e}")
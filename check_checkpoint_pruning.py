@@ -0,0 +1,117 @@
+"""Check that checkpoint pruning keeps memory flat and every rewind target alive.
+
+Plays one player through --turns turns with CHECKPOINT_REWIND_DEPTH=3 and a story tree of
+4 nodes, then asserts that:
+
+- the thread's checkpoint count stopped growing, and at most the tree's nodes, the turn
+  records' checkpoints and the newest one are left;
+- every kept checkpoint but the newest is at the user interrupt (the per-node ones in
+  between are gone);
+- no channel blob is left that no kept checkpoint uses;
+- turn_records and the pinned interrupt ids were trimmed to what is kept;
+- rewinding to the oldest turn still in the tree restores that turn's chat, and the story
+  carries on from there.
+
+    python check_checkpoint_pruning.py --turns 12
+
+Exits non-zero if pruning leaks or removes something a rewind needs.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+
+from script_stubs import StubChat, stub_env
+
+stub_env(CHECKPOINT_REWIND_DEPTH="3", STORY_TREE_MAX_NODES="4")
+
+import app as fable
+
+CALLS = {"model": 0}
+
+
+def _reply(text: str) -> str:
+    CALLS["model"] += 1
+    if "RULES ENGINE" in text:
+        return '{"verdict": "ok", "resolved_action": "", "progress_change": 10, "story_summary": "So far."}'
+    return f"Scene number {CALLS['model']}: the lantern gutters in the dark. What do you do?"
+
+
+def _texts(history: list[dict]) -> list[str]:
+    return [str(m["content"]) for m in history if isinstance(m.get("content"), str)]
+
+
+def _saved(thread_id: str) -> dict:
+    return fable.memory.storage.get(thread_id, {}).get("", {})
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=12)
+    args = parser.parse_args()
+
+    fable.llm = fable.llm2 = StubChat(reply=_reply)
+    fable._should_generate_image = lambda state: False
+    fable.LLM_CACHE.max_entries = 0
+
+    out = fable._last_event(fable.on_begin_story_stream("Mira", "fantasy", "elven_ranger", "", [], ""))
+    history, thread_id = out[0], out[1]
+    chats: list[list[str]] = []
+    counts: list[int] = []
+    for t in range(args.turns):
+        history = fable._last_event(fable.on_user_message_stream(f"I search room {t}", history, thread_id))[1]
+        chats.append(_texts(history))
+        counts.append(len(_saved(thread_id)))
+    meta = fable.SESSIONS.get(thread_id)
+    saved = _saved(thread_id)
+    print(f"checkpoints per turn: {counts}")
+
+    ok = True
+    bound = fable.STORY_TREE_MAX_NODES + fable.CHECKPOINT_REWIND_DEPTH + 1
+    if len(saved) > bound or counts[-1] > counts[len(counts) // 2]:
+        print(f"FAIL: {len(saved)} checkpoints kept (bound {bound}) or the count is still growing")
+        ok = False
+
+    newest = max(saved)
+    for cid in saved:
+        snapshot = fable.app.get_state({"configurable": {"thread_id": thread_id, "checkpoint_id": cid}})
+        if cid != newest and not snapshot.interrupts:
+            print(f"FAIL: kept checkpoint {cid} is not at the user interrupt")
+            ok = False
+
+    used = set()
+    for entry in saved.values():
+        checkpoint = fable.memory.serde.loads_typed(entry[0])
+        used |= {(thread_id, "", channel, version) for channel, version in checkpoint["channel_versions"].items()}
+    orphans = [key for key in fable.memory.blobs if key[0] == thread_id and key not in used]
+    if orphans:
+        print(f"FAIL: {len(orphans)} channel blobs are used by no kept checkpoint")
+        ok = False
+
+    if len(meta.get("turn_records") or []) > fable.CHECKPOINT_REWIND_DEPTH:
+        print("FAIL: turn_records should be trimmed to CHECKPOINT_REWIND_DEPTH")
+        ok = False
+    if set(meta.get("interrupt_ids") or {}) - set(saved):
+        print("FAIL: interrupt ids are pinned for pruned checkpoints")
+        ok = False
+
+    tree = meta["story_tree"]
+    oldest = min(node.turn for node in tree.nodes.values() if node.turn)
+    history = fable._last_event(fable.on_user_message_stream(f"{fable.REWIND_TO_KEY}{oldest}", history, thread_id))[1]
+    print(f"rewound to turn {oldest} of {args.turns}")
+    if _texts(history) != chats[oldest - 1]:
+        print(f"FAIL: rewinding to turn {oldest} did not restore its chat")
+        ok = False
+    history = fable._last_event(fable.on_user_message_stream("I turn back", history, thread_id))[1]
+    if _texts(history)[: len(chats[oldest - 1])] != chats[oldest - 1] or len(_texts(history)) <= len(chats[oldest - 1]):
+        print("FAIL: the story should carry on from the rewound turn")
+        ok = False
+    if not ok:
+        return 1
+    print("OK: pruning keeps the checkpoint count flat and rewind targets alive")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Check the judge fast path's local verdicts and that it really skips the model.
+
+Runs _fast_verdict over actions that must stay with the model (risky verbs, hazards in the
+action, handling verbs in a hazardous scene, new proper nouns, long or numeric input) and
+over ones that must not, and checks that a Continue gets the same progress floor as the
+model path. Then runs judger_improver with JUDGER_FAST_PATH=on against a counting stub and
+asserts that a fast turn makes no model call and compiles no prompt, while a risky one
+does both.
+
+    python check_fast_path.py
+
+Exits non-zero if a verdict is wrong or the fast path reaches the model.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+
+from langchain_core.messages import AIMessage
+
+from script_stubs import StubChat, stub_env
+
+stub_env(ASYNC_IMAGES=None, JUDGER_FAST_PATH="on")
+
+import app as fable
+
+CALLS = {"model": 0}
+CALM = "The tavern is warm and quiet. A cup of tea waits on the table. What do you do?"
+HAZARD = "Red lights flash over the airlock as the pressure alarm wails. What do you do?"
+
+LOCAL = [
+    ("look around", CALM),
+    ("I search the room", CALM),
+    ("ask the innkeeper about the road", CALM),
+    ("follow the path", HAZARD),
+    ("open the door", CALM),
+    ("take the cup", CALM),
+]
+MODEL = [
+    ("open the airlock", CALM),
+    ("open the door", HAZARD),
+    ("take the cup", HAZARD),
+    ("attack the innkeeper", CALM),
+    ("walk into the fire", CALM),
+    ("ask Morwen about the road", CALM),
+    ("search room 12", CALM),
+    ("dance on the table", CALM),
+    ("look around the room and then carefully check under every single board", CALM),
+]
+
+
+def _reply(text: str) -> str:
+    """Stub rules engine that counts its calls."""
+    CALLS["model"] += 1
+    return '{"verdict": "ok", "resolved_action": "", "progress_change": 2}'
+
+
+def _state(action: str, scene: str) -> dict:
+    return {
+        **fable.initial_state,
+        "situation": [AIMessage(content=scene)],
+        "your_action": [action],
+        "last_action_raw": action,
+        "turn_count": 1,
+    }
+
+
+def _judge(action: str, scene: str) -> tuple[int, int]:
+    """(model calls, adjudication prompts compiled) for one judger_improver run."""
+    calls = CALLS["model"]
+    compiled = fable.PROMPTS.stats().get("adjudication", {}).get("calls", 0)
+    fable.judger_improver(_state(action, scene))
+    return CALLS["model"] - calls, fable.PROMPTS.stats().get("adjudication", {}).get("calls", 0) - compiled
+
+
+def main() -> int:
+    fable.llm = fable.llm2 = StubChat(reply=_reply)
+    fable.LLM_CACHE.max_entries = 0
+    ok = True
+
+    for action, scene in LOCAL:
+        if fable._fast_verdict(action, scene) is None:
+            print(f"FAIL: {action!r} should be judged locally")
+            ok = False
+    for action, scene in MODEL:
+        if fable._fast_verdict(action, scene) is not None:
+            print(f"FAIL: {action!r} should go to the model")
+            ok = False
+
+    verdict = json.loads(fable._fast_verdict(fable.CONTINUE_KEY))
+    if verdict["progress_change"] != 4:
+        print(f"FAIL: a local Continue should advance 4 like the model path, not {verdict['progress_change']}")
+        ok = False
+
+    calls, compiled = _judge("look around", CALM)
+    print(f"fast turn: {calls} model calls, {compiled} prompts compiled")
+    if calls or compiled:
+        print("FAIL: a fast-path turn should neither call the model nor compile its prompt")
+        ok = False
+    calls, compiled = _judge("open the airlock", HAZARD)
+    print(f"risky turn: {calls} model calls, {compiled} prompts compiled")
+    if calls != 1 or compiled != 1:
+        print("FAIL: a risky turn should go to the model once")
+        ok = False
+    if not ok:
+        return 1
+    print("OK: fast-path verdicts and model skipping behave as expected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
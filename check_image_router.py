@@ -0,0 +1,128 @@
+"""Exercise image_router.ImageRouter with local stub providers (no network).
+
+Checks that a slow provider is hedged by the next one, that a failing provider fails over
+right away, that its circuit breaker opens after repeated failures and closes again after
+a successful trial once the cool-down has passed, that a trial cancelled before it starts
+gives its slot back, and that the hedge delay follows the provider's observed latency.
+
+    python check_image_router.py
+
+Exits non-zero if any check fails.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+
+from image_router import ImageRouter
+
+
+class StubProvider:
+    """Returns fixed bytes after `latency_s`, or raises while `failing` is set."""
+
+    def __init__(self, name: str, latency_s: float, failing: bool = False) -> None:
+        self.name = name
+        self.latency_s = latency_s
+        self.failing = failing
+        self.calls = 0
+
+    def __call__(self, prompt: str, *, width: int, height: int, seed: int | None) -> bytes:
+        self.calls += 1
+        time.sleep(self.latency_s)
+        if self.failing:
+            raise RuntimeError(f"{self.name} is down")
+        return f"{self.name}:{prompt}".encode()
+
+
+def _timed(router: ImageRouter, prompt: str) -> tuple[str, float]:
+    started = time.monotonic()
+    _data, provider = router.generate(prompt, width=64, height=64, seed=1)
+    return provider, time.monotonic() - started
+
+
+def main() -> int:
+    failures: list[str] = []
+
+    def check(ok: bool, what: str) -> None:
+        print(("OK:   " if ok else "FAIL: ") + what)
+        if not ok:
+            failures.append(what)
+
+    # Hedging: the primary is slower than its hedge delay, so the secondary wins.
+    slow, fast = StubProvider("slow", 1.5), StubProvider("fast", 0.1)
+    router = ImageRouter(hedge_default_s=0.3, hedge_floor_s=0.05)
+    router.add_provider("slow", slow)
+    router.add_provider("fast", fast)
+    provider, took = _timed(router, "hedge")
+    check(provider == "fast" and took < 1.0, f"slow provider hedged ({provider} in {took:.2f}s)")
+    check(router.stats()["fast"]["hedges"] == 1, "hedge counted")
+
+    # Failover and breaker: a failing primary is skipped once its breaker opens.
+    broken, backup = StubProvider("broken", 0.0, failing=True), StubProvider("backup", 0.0)
+    router = ImageRouter(breaker_failures=2, breaker_cooldown_s=0.5, hedge_default_s=5)
+    router.add_provider("broken", broken)
+    router.add_provider("backup", backup)
+    results = [_timed(router, f"failover {i}")[0] for i in range(4)]
+    check(results == ["backup"] * 4, f"failed over to backup every time ({results})")
+    check(broken.calls == 2 and router.stats()["broken"]["breaker"] == "open", f"breaker opened after 2 failures ({broken.calls} calls)")
+    time.sleep(0.6)
+    broken.failing = False
+    provider, _ = _timed(router, "trial")
+    check(provider == "broken" and router.stats()["broken"]["breaker"] == "closed", "breaker closed after a good trial")
+
+    # A half-open trial that loses the race before it starts hands its slot back.
+    flaky = StubProvider("flaky", 0.0)
+    gate = threading.Event()
+
+    def quick(prompt: str, **kwargs) -> bytes:
+        # Queue a blocker ahead of the hedge, so this worker picks it up next and the
+        # hedge is still waiting for a worker when this call wins.
+        router._executor.submit(gate.wait)
+        time.sleep(0.3)
+        return b"quick"
+
+    router = ImageRouter(max_workers=2, hedge_default_s=0.05, hedge_floor_s=0.01, breaker_failures=1, breaker_cooldown_s=0.1)
+    router.add_provider("quick", quick)
+    router.add_provider("flaky", flaky)
+    router._providers[1].breaker.record(False)
+    time.sleep(0.15)
+    router._executor.submit(gate.wait)  # keeps the other worker busy too
+    provider, _ = _timed(router, "queued trial")
+    gate.set()
+    check(provider == "quick" and flaky.calls == 0, f"queued trial was cancelled ({provider}, {flaky.calls} flaky calls)")
+    breaker = router._providers[1].breaker
+    check(breaker.state == "half_open" and breaker.allow(), "cancelled trial released its slot")
+
+    # No provider left: a clear error instead of a hang.
+    broken.failing = True
+    router = ImageRouter(breaker_failures=1, breaker_cooldown_s=60)
+    router.add_provider("broken", broken)
+    try:
+        router.generate("x", width=64, height=64, seed=1)
+    except RuntimeError:
+        pass
+    try:
+        router.generate("x", width=64, height=64, seed=1)
+        check(False, "open breaker with no fallback raises")
+    except RuntimeError as e:
+        check("circuit open" in str(e), f"open breaker with no fallback raises ({e})")
+
+    # The hedge delay follows the provider's recent latency once there are enough samples.
+    steady = StubProvider("steady", 0.05)
+    router = ImageRouter(hedge_min_samples=3, hedge_default_s=9, hedge_floor_s=0.01)
+    router.add_provider("steady", steady)
+    for i in range(5):
+        _timed(router, f"sample {i}")
+    delay = router.hedge_delay("steady") or 0.0
+    check(0.04 < delay < 0.5, f"hedge delay learned from latency ({delay:.3f}s)")
+
+    if failures:
+        return 1
+    print("OK: router hedges, fails over and breaks circuits as expected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
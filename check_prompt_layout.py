@@ -0,0 +1,95 @@
+"""Check that the storyteller's prompt prefix stays byte-identical across a thread's turns.
+
+Plays a few turns (typed actions, Continue, a milestone) with a stub model that records
+every storyteller call, and a running summary that grows past the input budget, then
+asserts that the first message of every storyteller call in the thread is the same.
+The stub reports usage with cached input tokens, so the check also covers how
+PROMPTS.stats() surfaces them.
+
+    python check_prompt_layout.py
+
+Exits non-zero if the prefix changes between turns.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+
+from script_stubs import StubChat, prompt_text, stub_env
+
+stub_env(ASYNC_IMAGES=None, PROMPT_LAYOUT="stable_prefix")
+
+import app as fable
+
+STORYTELLER_CALLS: list[list] = []
+
+
+def _reply(text: str) -> str:
+    if "RULES ENGINE" in text:
+        # A long summary so the budget has to trim it on later turns.
+        summary = " ".join(f"Event {i} changed the road ahead." for i in range(60 * len(STORYTELLER_CALLS) + 1))
+        return (
+            '{"verdict": "ok", "resolved_action": "", "progress_change": 20, "story_summary": "%s"}' % summary
+        )
+    return "The lantern gutters as something moves in the dark. What do you do?"
+
+
+class RecordingChat(StubChat):
+    """Stub model that records every storyteller call."""
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = prompt_text(messages)
+        if "storyteller running" not in str(messages[0].content):
+            # Intro and judge calls are streamed too while the graph runs; not recorded.
+            yield ChatGenerationChunk(message=AIMessageChunk(content=self.reply(text)))
+            return
+        STORYTELLER_CALLS.append(list(messages))
+        prefix_tokens = fable.estimate_tokens(str(messages[0].content))
+        for word in self.reply("").split(" "):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+        usage = {
+            "input_tokens": sum(fable.estimate_tokens(str(m.content)) for m in messages),
+            "output_tokens": 20,
+            "total_tokens": 0,
+            # Pretend the provider served the prefix from its cache after the first turn.
+            "input_token_details": {"cache_read": prefix_tokens if len(STORYTELLER_CALLS) > 1 else 0},
+        }
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
+
+
+def main() -> int:
+    fable.llm = fable.llm2 = RecordingChat(reply=_reply)
+    fable._should_generate_image = lambda state: False
+    fable.LLM_CACHE.max_entries = 0
+
+    out = fable._last_event(fable.on_begin_story_stream("Mira", "fantasy", "elven_ranger", "", [], ""))
+    history, thread_id = out[0], out[1]
+    for action in ["I follow the tracks", fable.CONTINUE_KEY, "I call out to the stranger", "I open the gate", fable.CONTINUE_KEY]:
+        out = fable._last_event(fable.on_user_message_stream(action, history, thread_id))
+        history = out[1]
+
+    prefixes = [str(messages[0].content) for messages in STORYTELLER_CALLS]
+    turns = [str(messages[-1].content) for messages in STORYTELLER_CALLS]
+    stats = fable.PROMPTS.stats().get("storyteller", {})
+    print(f"storyteller calls: {len(prefixes)}, distinct prefixes: {len(set(prefixes))}, distinct turn parts: {len(set(turns))}")
+    print(f"cached input tokens reported: {stats.get('cached_input_tokens', 0)} of {stats.get('reported_input_tokens', 0)}")
+    if len(prefixes) < 2:
+        print("FAIL: expected several storyteller calls")
+        return 1
+    if len(set(prefixes)) != 1:
+        for i, prefix in enumerate(prefixes[1:], start=1):
+            if prefix != prefixes[0]:
+                at = len(os.path.commonprefix([prefix, prefixes[0]]))
+                print(f"FAIL: prefix of call {i} differs from call 0 at character {at}")
+                break
+        return 1
+    print("OK: prefix is byte-stable across turns")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
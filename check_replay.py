@@ -0,0 +1,87 @@
+"""Check that _replay_thread rebuilds a thread from its turn journal without model calls.
+
+Plays a thread live with a stub model whose every reply is numbered (so a live re-run
+could never reproduce it) and a stub image provider, then rebuilds it from
+TURN_JOURNALS with _replay_thread and asserts that no model or image call was made, that
+the scenes and images match, and that inputs past the end of the journal run live.
+
+    python check_replay.py
+
+Exits non-zero if the rebuild differs or calls a model.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+
+from script_stubs import StubChat, stub_env
+
+stub_env(TURN_JOURNAL="1")
+
+import app as fable
+
+CALLS = {"model": 0, "image": 0}
+
+
+def _reply(text: str) -> str:
+    CALLS["model"] += 1
+    n = CALLS["model"]
+    if "RULES ENGINE" in text:
+        return '{"verdict": "ok", "resolved_action": "", "progress_change": 10, "story_summary": "Summary %d."}' % n
+    if "tiny, stable visual tagset" in text:
+        return "STYLE: ink wash\nHERO: cloaked ranger\nMOTIFS: lantern, gate"
+    if "diffusion prompt" in text:
+        return f"cloaked ranger at gate number {n}, wide shot"
+    return f"Scene number {n}: the lantern gutters as something moves in the dark. What do you do?"
+
+
+def _stub_image(prompt: str, **kwargs):
+    CALLS["image"] += 1
+    return f"image {CALLS['image']} for {prompt}".encode(), "image/png"
+
+
+def _scenes(history: list[dict]) -> list[str]:
+    return [str(m["content"]) for m in history if isinstance(m.get("content"), str)]
+
+
+def main() -> int:
+    fable.llm = fable.llm2 = StubChat(reply=_reply)
+    fable.pollinations_image = _stub_image
+    fable.IMAGE_CACHE.max_files = 0
+    fable.LLM_CACHE.max_entries = 0
+
+    starter = fable.initialize_state("Mira", "fantasy", "elven_ranger")
+    inputs = ["I follow the tracks", fable.CONTINUE_KEY, "I call out to the stranger", "I open the gate", fable.CONTINUE_KEY]
+    live, live_thread, _, live_images = fable._replay_thread(starter=starter, inputs=inputs)
+    journal = fable.TURN_JOURNALS[live_thread]
+    print(f"live run: {CALLS['model']} model calls, {CALLS['image']} images, {len(journal)} journaled steps")
+
+    before = dict(CALLS)
+    started = time.perf_counter()
+    rebuilt, _, _, rebuilt_images = fable._replay_thread(starter=starter, inputs=journal.actions("judger_improver"), journal=journal)
+    took_ms = (time.perf_counter() - started) * 1000
+    calls = {k: CALLS[k] - before[k] for k in CALLS}
+    print(f"replay: {calls['model']} model calls, {calls['image']} images, {took_ms:.0f} ms")
+
+    ok = True
+    if calls != {"model": 0, "image": 0}:
+        print("FAIL: replay called a model or image provider")
+        ok = False
+    if _scenes(rebuilt) != _scenes(live) or rebuilt_images != live_images:
+        print("FAIL: replayed scenes or images differ from the live run")
+        ok = False
+
+    before = dict(CALLS)
+    extended, _, _, _ = fable._replay_thread(starter=starter, inputs=journal.actions("judger_improver") + ["I run"], journal=journal)
+    if CALLS["model"] == before["model"] or _scenes(extended)[: len(_scenes(live))] != _scenes(live):
+        print("FAIL: an input past the journal should run live after the replayed turns")
+        ok = False
+    if not ok:
+        return 1
+    print("OK: thread rebuilt from the journal without model calls")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
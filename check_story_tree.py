@@ -0,0 +1,146 @@
+"""Check that a rewound-away branch can be switched back to without model calls.
+
+Plays two turns with a stub model whose every reply is numbered, rewinds one turn and plays
+a different one (a second branch), rewinds again and uses REDO_KEY to step back onto the
+second branch, then on_switch_branch to reach the first one. Asserts that each switch shows
+exactly what that branch showed before, that no model was called for it, and that the
+story carries on from the restored branch. Finally jumps back two turns at once with
+REWIND_TO_KEY and checks the chat matches what it was after the first turn. Images are
+made in the background, and the last check plays a turn, lets its image land, rewinds and
+redoes, and asserts the restored checkpoint still has the image's prompt.
+
+    python check_story_tree.py
+
+Exits non-zero if the restored branch differs or the switch calls a model.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+
+from script_stubs import StubChat, stub_env
+
+stub_env(ASYNC_IMAGES="1")
+
+import app as fable
+
+CALLS = {"model": 0}
+
+
+def _reply(text: str) -> str:
+    CALLS["model"] += 1
+    n = CALLS["model"]
+    if "RULES ENGINE" in text:
+        return '{"verdict": "ok", "resolved_action": "", "progress_change": 10, "story_summary": "Summary %d."}' % n
+    if "tiny, stable visual tagset" in text:
+        return "STYLE: ink wash\nHERO: cloaked ranger\nMOTIFS: lantern, gate"
+    if "diffusion prompt" in text:
+        return f"cloaked ranger at gate number {n}, wide shot"
+    return f"Scene number {n}: the lantern gutters as something moves in the dark. What do you do?"
+
+
+def _texts(history: list[dict]) -> list[str]:
+    return [str(m["content"]) for m in history if isinstance(m.get("content"), str)]
+
+
+def _send(msg: str, history: list[dict], thread_id: str) -> list[dict]:
+    return fable._last_event(fable.on_user_message_stream(msg, history, thread_id))[1]
+
+
+def _settle(history: list[dict], thread_id: str) -> list[dict]:
+    """Wait for the thread's background images and deliver them, as the follow-up would."""
+    meta = fable.SESSIONS.get(thread_id)
+    for future in list((meta.get("image_jobs") or {}).values()):
+        future.result(timeout=30)
+    with fable._thread_lock(thread_id):
+        history, _ = fable._deliver_ready_images(history, thread_id, meta)
+    return history
+
+
+def main() -> int:
+    fable.llm = fable.llm2 = StubChat(reply=_reply)
+    fable.pollinations_image = lambda prompt, **kwargs: (b"\x89PNG stub", "image/png")
+    fable.IMAGE_CACHE.max_files = 0
+    fable.LLM_CACHE.max_entries = 0
+
+    out = fable._last_event(fable.on_begin_story_stream("Mira", "fantasy", "elven_ranger", "", [], ""))
+    history, thread_id = out[0], out[1]
+    history = _send("I follow the tracks", history, thread_id)
+    after_first = _texts(history)
+    history = _send("I open the gate", history, thread_id)
+    first_branch = _texts(history)
+
+    history = _send(fable.REWIND_KEY, history, thread_id)
+    time.sleep(1.3)  # past the double-click guard
+    history = _send("I climb the wall instead", history, thread_id)
+    second_branch = _texts(history)
+    print(f"branches: {len(fable.story_branches(thread_id))}")
+
+    history = _send(fable.REWIND_KEY, history, thread_id)
+    time.sleep(1.3)
+    history = _settle(history, thread_id)  # image jobs call the model too
+    before = CALLS["model"]
+    started = time.perf_counter()
+    history = _send(fable.REDO_KEY, history, thread_id)
+    took_ms = (time.perf_counter() - started) * 1000
+    calls = CALLS["model"] - before
+    print(f"redo: {calls} model calls, {took_ms:.1f} ms")
+
+    ok = True
+    if calls:
+        print("FAIL: switching branches called a model")
+        ok = False
+    if _texts(history) != second_branch or first_branch == second_branch:
+        print("FAIL: redo did not restore the branch the rewind left")
+        ok = False
+
+    leaf = next(row["id"] for row in fable.story_branches(thread_id) if not row["current"])
+    history, _ = fable.on_switch_branch(history, thread_id, leaf)
+    if _texts(history) != first_branch:
+        print("FAIL: on_switch_branch did not restore the first branch")
+        ok = False
+
+    history = _send("I step through", history, thread_id)
+    if _texts(history)[: len(first_branch)] != first_branch or len(_texts(history)) <= len(first_branch):
+        print("FAIL: the story should carry on from the restored branch")
+        ok = False
+
+    history = _settle(history, thread_id)
+    before = CALLS["model"]
+    started = time.perf_counter()
+    history = _send(f"{fable.REWIND_TO_KEY}1", history, thread_id)
+    took_ms = (time.perf_counter() - started) * 1000
+    print(f"rewind to turn 1: {CALLS['model'] - before} model calls, {took_ms:.1f} ms")
+    if CALLS["model"] != before or _texts(history) != after_first:
+        print("FAIL: rewinding to turn 1 should restore the chat after the first turn without model calls")
+        ok = False
+    if _texts(_send(f"{fable.REWIND_TO_KEY}1", history, thread_id)) != after_first:
+        print("FAIL: a repeated rewind to the same turn should change nothing")
+        ok = False
+    history = _send("I turn back", history, thread_id)
+    if _texts(history)[: len(after_first)] != after_first or len(_texts(history)) <= len(after_first):
+        print("FAIL: the story should carry on after rewinding to turn 1")
+        ok = False
+
+    # A background image written into the current turn's checkpoint must still be there
+    # after switching away and back.
+    fable._should_generate_image = lambda state: True
+    history = _settle(_send("I light the lantern", history, thread_id), thread_id)
+    prompt = fable.app.get_state(fable.SESSIONS.get(thread_id)["cfg"]).values.get("last_image_prompt")
+    history = _send(fable.REWIND_KEY, history, thread_id)
+    time.sleep(1.3)
+    history = _send(fable.REDO_KEY, history, thread_id)
+    restored = fable.app.get_state(fable.SESSIONS.get(thread_id)["cfg"]).values.get("last_image_prompt")
+    print(f"image prompt after redo: {restored!r}")
+    if not prompt or restored != prompt:
+        print("FAIL: switching back should resume from the checkpoint the image was written into")
+        ok = False
+    if not ok:
+        return 1
+    print("OK: branches switch and rewinds jump without model calls")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
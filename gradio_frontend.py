@@ -1,6 +1,7 @@
 import gradio as gr
-import time
 import html
+import functools
+import inspect
 
 
 HEAD = """
@@ -346,7 +347,57 @@ def _render_readout(label, value):
 
 
 # on_begin_story not used but used in app.py and kept here for reference
-def build_demo(*, on_user_message, on_begin_story, on_begin_story_checked, on_continue_story, on_rewind_story, on_menu_story) -> gr.Blocks:
+def _iter_outputs(result):
+  """Handlers may return one output tuple or a generator of them (token streaming)."""
+  if inspect.isgenerator(result):
+    yield from result
+  else:
+    yield result
+
+
+def _map_outputs(handler, shape, name):
+  """Gradio fn that runs handler and yields shape(output) for each of its outputs.
+
+  Async-generator handlers get an async fn, so Gradio runs them on its event loop
+  instead of a worker thread. name keeps the event's api_name stable either way.
+  """
+  if inspect.isasyncgenfunction(handler):
+    async def _run(*args):
+      async for out in handler(*args):
+        yield shape(out)
+  else:
+    def _run(*args):
+      for out in _iter_outputs(handler(*args)):
+        yield shape(out)
+  _run.__name__ = _run.__qualname__ = name
+  return _run
+
+
+def _no_image_followup(history, thread_id):
+  """Stand-in follow-up handler when the app delivers no background images."""
+  return
+  yield
+
+
+def _branch_choices(rows):
+  """Dropdown (label, node id) pairs for story_branches rows, current branch first."""
+  choices = []
+  for row in sorted(rows or [], key=lambda r: (not r.get("current"), -int(r.get("depth") or 0))):
+    action = str(row.get("action") or "")
+    if action == "__CONTINUE__":
+      action = "(Continue the story)"
+    label = f"Turn {row.get('depth')}: {action or '(the opening)'}"
+    if len(label) > 70:
+      label = label[:67] + "..."
+    if row.get("ended"):
+      label += " (ended)"
+    if row.get("current"):
+      label += " (you are here)"
+    choices.append((label, row["id"]))
+  return choices
+
+
+def build_demo(*, on_user_message, on_begin_story, on_begin_story_checked, on_continue_story, on_rewind_story, on_menu_story, on_image_followup=None, on_prefetch_intro=None, story_branches=None, on_switch_branch=None) -> gr.Blocks:
 
     with gr.Blocks(fill_height=True) as demo:
 
@@ -372,6 +423,7 @@ def build_demo(*, on_user_message, on_begin_story, on_begin_story_checked, on_co
         char_name_state = gr.State("")
         genre_state = gr.State("")
         image_style_state = gr.State("")
+        intro_prefetch_state = gr.State("")
 
         ROLE_OPTIONS = {
           "fantasy": [
@@ -567,17 +619,11 @@ def build_demo(*, on_user_message, on_begin_story, on_begin_story_checked, on_co
             )
 
             REWIND_KEY = "__REWIND__"
+            REWIND_TO_KEY = "__REWIND_TO__:"
             MENU_KEY = "__MENU__"
 
-            def _submit_message(user_message, history, thread_id):
-                (
-                    box,
-                    new_history,
-                    new_thread_id,
-                    title_u,
-                    crystal_u,
-                    chat_u,
-                ) = on_user_message(user_message, history, thread_id)
+            def _message_outputs(out):
+                box, new_history, new_thread_id, title_u, crystal_u, chat_u = out
 
                 # Always clear the textbox client-side state after a submit.
                 # This prevents accidental re-submission of stale text under queue/reconnect edge cases.
@@ -593,19 +639,33 @@ def build_demo(*, on_user_message, on_begin_story, on_begin_story_checked, on_co
                     chat_u,
                 )
 
-            def _rewind_click(history, thread_id):
-                return _submit_message(REWIND_KEY, history, thread_id)
-
-            def _menu_click(history, thread_id):
-                out = _submit_message(MENU_KEY, history, thread_id)
+            def _menu_outputs(out):
                 # Clear readouts when returning to menu.
-                return (*out, _render_readout("Character", "Unknown Hero"), _render_readout("Genre", ""))
+                return (*_message_outputs(out), _render_readout("Character", "Unknown Hero"), _render_readout("Genre", ""))
 
-            def _continue_click(history, thread_id):
-                new_history, new_thread_id = on_continue_story(history, thread_id)
+            def _continue_outputs(out):
+                new_history, new_thread_id = out
                 return new_history, new_history, new_thread_id
 
-            textbox.submit(
+            _submit_message = _map_outputs(on_user_message, _message_outputs, "_submit_message")
+            _rewind_click = _map_outputs(functools.partial(on_user_message, REWIND_KEY), _message_outputs, "_rewind_click")
+            _menu_click = _map_outputs(functools.partial(on_user_message, MENU_KEY), _menu_outputs, "_menu_click")
+
+            # Turn number -> one "__REWIND_TO__:N" command, keeping the handler sync or async.
+            if inspect.isasyncgenfunction(on_user_message):
+              async def _rewind_to(turn, history, thread_id):
+                async for out in on_user_message(f"{REWIND_TO_KEY}{int(turn or 0)}", history, thread_id):
+                  yield out
+            else:
+              def _rewind_to(turn, history, thread_id):
+                return on_user_message(f"{REWIND_TO_KEY}{int(turn or 0)}", history, thread_id)
+            _rewind_to_click = _map_outputs(_rewind_to, _message_outputs, "_rewind_to_click")
+            _continue_click = _map_outputs(on_continue_story, _continue_outputs, "_continue_click")
+
+            # Background images arrive after the scene; this chained event streams them in.
+            _image_followup = _map_outputs(on_image_followup or _no_image_followup, lambda new_history: (new_history, new_history), "_image_followup")
+
+            submit_event = textbox.submit(
                 fn=_submit_message,
                 inputs=[textbox, history_state, thread_id_state],
                 outputs=[
@@ -624,12 +684,31 @@ def build_demo(*, on_user_message, on_begin_story, on_begin_story_checked, on_co
                 rewind_btn = gr.Button("Rewind ⏪ Try Again", scale=1, min_width=140)
                 menu_btn = gr.Button("Start a New Adventure!🌱💫", scale=1, min_width=120)
 
-            continue_btn.click(
+            with gr.Accordion("Go back further ⏮️", open=False):
+              with gr.Row(equal_height=True):
+                rewind_turn = gr.Number(label="Turn (0 = the opening)", value=0, minimum=0, precision=0, scale=1)
+                rewind_to_btn = gr.Button("Rewind to this turn", scale=1, min_width=140)
+
+            # Turns a rewind undid are kept as branches; pick one to go back onto it.
+            with gr.Accordion("Other branches 🌿", open=False, visible=story_branches is not None and on_switch_branch is not None):
+              with gr.Row(equal_height=True):
+                branch_dd = gr.Dropdown(label="Branch", choices=[], value=None, scale=2)
+                branches_btn = gr.Button("Refresh 🔄", scale=1, min_width=100)
+                switch_branch_btn = gr.Button("Go to this branch", scale=1, min_width=140)
+
+            continue_event = continue_btn.click(
                 fn=_continue_click,
                 inputs=[history_state, thread_id_state],
                 outputs=[chatbot, history_state, thread_id_state],
             )
 
+            for event in (submit_event, continue_event):
+                event.then(
+                    fn=_image_followup,
+                    inputs=[history_state, thread_id_state],
+                    outputs=[chatbot, history_state],
+                )
+
             rewind_btn.click(
                 fn=_rewind_click,
                 inputs=[history_state, thread_id_state],
@@ -644,6 +723,37 @@ def build_demo(*, on_user_message, on_begin_story, on_begin_story_checked, on_co
                 ],
             )
 
+            rewind_to_btn.click(
+                fn=_rewind_to_click,
+                inputs=[rewind_turn, history_state, thread_id_state],
+                outputs=[
+                    textbox,
+                    chatbot,
+                    history_state,
+                    thread_id_state,
+                    title_screen,
+                    crystal_ball_screen,
+                    chat_screen,
+                ],
+            )
+
+            def _list_branches(thread_id):
+              choices = _branch_choices(story_branches(thread_id) if story_branches else [])
+              return gr.update(choices=choices, value=None)
+
+            def _switch_branch_click(node_id, history, thread_id):
+              if on_switch_branch is None or not node_id:
+                return history, history, thread_id
+              new_history, new_thread_id = on_switch_branch(history, thread_id, node_id)
+              return new_history, new_history, new_thread_id
+
+            branches_btn.click(fn=_list_branches, inputs=[thread_id_state], outputs=[branch_dd])
+            switch_branch_btn.click(
+                fn=_switch_branch_click,
+                inputs=[branch_dd, history_state, thread_id_state],
+                outputs=[chatbot, history_state, thread_id_state],
+            ).then(fn=_list_branches, inputs=[thread_id_state], outputs=[branch_dd])
+
             menu_btn.click(
                 fn=_menu_click,
                 inputs=[history_state, thread_id_state],
@@ -678,6 +788,19 @@ def build_demo(*, on_user_message, on_begin_story, on_begin_story_checked, on_co
             """
         )
 
+        def _prefetch_intro(n, g, r, s, key):
+            # Start writing the intro while the player finishes up / the crystal ball
+            # animates; on_begin_story picks it up with the key kept in intro_prefetch_state,
+            # which also carries this session's nonce.
+            if on_prefetch_intro is None:
+                return key
+            return on_prefetch_intro(n, g, r, (s or ""), key)
+
+        prefetch_inputs = [char_name, genre, role, image_style_state, intro_prefetch_state]
+        role.change(fn=_prefetch_intro, inputs=prefetch_inputs, outputs=intro_prefetch_state, queue=False)
+        char_name.blur(fn=_prefetch_intro, inputs=prefetch_inputs, outputs=intro_prefetch_state, queue=False)
+        begin_btn.click(fn=_prefetch_intro, inputs=prefetch_inputs, outputs=intro_prefetch_state, queue=False)
+
         begin_btn.click(
             fn=None,
             js="""
@@ -749,45 +872,62 @@ def build_demo(*, on_user_message, on_begin_story, on_begin_story_checked, on_co
               """
         )
 
-        def _begin_story_click(n, g, r, s, h, t):
-          if not (g or "").strip() or not (r or "").strip() or r == "__NEED_PATH__":
-            return (
-              h,
-              t,
-              n,
-              g,
-              h,
-              gr.update(),
-              gr.update(),
-              '<div style="color: #ffffff; font-weight: 700;">Finish your adventure\'s details!</div>',
-              gr.update(visible=True),
-              gr.update(visible=False),
-              gr.update(visible=False),
-            )
+        def _begin_details_missing(g, r):
+          return not (g or "").strip() or not (r or "").strip() or r == "__NEED_PATH__"
 
-          out = on_begin_story_checked(n, g, r, (s or ""), h, t)
-          new_history = out[0]
-          new_thread_id = out[1]
-          new_char_name = out[2]
-          new_genre = out[3]
-          display_char_name = (new_char_name or "").strip() or "Unknown Hero"
+        def _begin_warning(n, g, h, t):
           return (
-              new_history,
-              new_thread_id,
-              new_char_name,
-              new_genre,
-              new_history,
-              _render_readout("Character", display_char_name),
-              _render_readout("Genre", new_genre),
-          "",
-              gr.update(visible=False),
-              gr.update(visible=False),
-              gr.update(visible=True),
+            h,
+            t,
+            n,
+            g,
+            h,
+            gr.update(),
+            gr.update(),
+            '<div style="color: #ffffff; font-weight: 700;">Finish your adventure\'s details!</div>',
+            gr.update(visible=True),
+            gr.update(visible=False),
+            gr.update(visible=False),
           )
 
-        begin_backend_btn.click(
+        def _begin_outputs(out):
+            new_history = out[0]
+            new_thread_id = out[1]
+            new_char_name = out[2]
+            new_genre = out[3]
+            display_char_name = (new_char_name or "").strip() or "Unknown Hero"
+            return (
+                new_history,
+                new_thread_id,
+                new_char_name,
+                new_genre,
+                new_history,
+                _render_readout("Character", display_char_name),
+                _render_readout("Genre", new_genre),
+            "",
+                gr.update(visible=False),
+                gr.update(visible=False),
+                gr.update(visible=True),
+            )
+
+        _begin_stream = _map_outputs(on_begin_story_checked, _begin_outputs, "_begin_stream")
+        if inspect.isasyncgenfunction(_begin_stream):
+          async def _begin_story_click(n, g, r, s, h, t, k):
+            if _begin_details_missing(g, r):
+              yield _begin_warning(n, g, h, t)
+              return
+            async for out in _begin_stream(n, g, r, (s or ""), h, t, (k or "")):
+              yield out
+        else:
+          def _begin_story_click(n, g, r, s, h, t, k):
+            if _begin_details_missing(g, r):
+              yield _begin_warning(n, g, h, t)
+              return
+            yield from _begin_stream(n, g, r, (s or ""), h, t, (k or ""))
+
+        begin_event = begin_backend_btn.click(
           fn=_begin_story_click,
-          inputs=[char_name, genre, role, image_style_state, history_state, thread_id_state],
+          inputs=[char_name, genre, role, image_style_state, history_state, thread_id_state, intro_prefetch_state],
           outputs=[
             history_state,
             thread_id_state,
@@ -802,5 +942,10 @@ def build_demo(*, on_user_message, on_begin_story, on_begin_story_checked, on_co
             chat_screen,
           ],
         )
+        begin_event.then(
+          fn=_image_followup,
+          inputs=[history_state, thread_id_state],
+          outputs=[chatbot, history_state],
+        )
 
     return demo
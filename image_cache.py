@@ -0,0 +1,137 @@
+"""Disk LRU cache for generated images, in front of the image provider.
+
+Keys are a sha256 of the canonical prompt (case and whitespace folded, the style preset
+already merged in) plus model, width, height and seed, so a rewind/retry or a replayed
+thread that asks for the same picture gets the stored PNG instead of a new request. The
+model names whoever made the bytes; get_first looks up one key per candidate model.
+Recency is the file mtime (refreshed on every hit), which also lets the index be rebuilt
+from the directory after a restart. Bounded by max_files and max_bytes like
+RUNTIME_IMAGES_MAX_FILES; max_files <= 0 turns the cache off.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+
+def canonical_prompt(prompt: str) -> str:
+    text = " ".join((prompt or "").lower().split())
+    # Trailing punctuation and spaces around commas don't change the picture.
+    text = re.sub(r"\s*,\s*", ", ", text)
+    return text.strip(" .,;:!")
+
+
+class ImageCache:
+    def __init__(self, *, cache_dir: str, max_files: int = 300, max_bytes: int = 200 * 1024 * 1024) -> None:
+        self.cache_dir = cache_dir
+        self.max_files = int(max_files)
+        self.max_bytes = max(0, int(max_bytes))
+        self._index: OrderedDict[str, int] = OrderedDict()  # key -> size, oldest first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if self.enabled:
+            self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_files > 0
+
+    def key(self, prompt: str, *, model: str, width: int, height: int, seed: int | None) -> str:
+        payload = json.dumps([canonical_prompt(prompt), model, int(width), int(height), seed])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> bytes | None:
+        return self.get_first([key])[1]
+
+    def get_first(self, keys: list[str]) -> tuple[str | None, bytes | None]:
+        """(key, data) for the first of `keys` that is cached; counts as one lookup."""
+        if not self.enabled:
+            return None, None
+        with self._lock:
+            for key in keys:
+                if key not in self._index:
+                    continue
+                path = self._path(key)
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    os.utime(path, None)
+                except OSError:
+                    self._bytes -= self._index.pop(key, 0)
+                    continue
+                self._index.move_to_end(key)
+                self._stats["hits"] += 1
+                return key, data
+            self._stats["misses"] += 1
+            return None, None
+
+    def put(self, key: str, data: bytes) -> None:
+        if not self.enabled or not data:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[image_cache] failed to write {path}: {e}")
+            return
+        with self._lock:
+            self._bytes -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._bytes += len(data)
+            self._stats["stores"] += 1
+            self._evict_locked()
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            out: dict[str, float] = dict(self._stats)
+            out["files"] = len(self._index)
+            out["bytes"] = self._bytes
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = (out["hits"] / lookups) if lookups else 0.0
+        return out
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def _evict_locked(self) -> None:
+        while self._index and (
+            len(self._index) > self.max_files or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            key, size = self._index.popitem(last=False)
+            self._bytes -= size
+            self._stats["evictions"] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _load_index(self) -> None:
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        entries: list[tuple[float, str, int]] = []
+        for name in names:
+            if not name.endswith(".png"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[: -len(".png")], st.st_size))
+        entries.sort()
+        with self._lock:
+            for _, key, size in entries:
+                self._index[key] = size
+                self._bytes += size
+            self._evict_locked()
@@ -0,0 +1,182 @@
+"""Shared HTTP layer for the image providers.
+
+One process-wide httpx.Client keeps TLS connections to Pollinations alive between
+images instead of opening a new one per request. Requests get separate connect/read
+timeouts and are retried on connection errors, timeouts, 429 and 5xx with exponential
+backoff plus full jitter. POLLINATIONS_BASE_URL points the client somewhere else, e.g. a
+local stub server. The Hugging Face InferenceClient is likewise built once per token.
+
+Env:
+  POLLINATIONS_BASE_URL          default https://gen.pollinations.ai
+  IMAGE_HTTP_CONNECT_TIMEOUT_S   default 5
+  IMAGE_HTTP_READ_TIMEOUT_S      default 60
+  IMAGE_HTTP_RETRIES             default 2 (extra attempts after the first)
+  IMAGE_HTTP_MAX_CONNECTIONS     default 8
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+import urllib.parse
+from typing import Any
+
+import httpx
+
+DEFAULT_POLLINATIONS_BASE_URL = "https://gen.pollinations.ai"
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class ProviderHTTPError(RuntimeError):
+    def __init__(self, status_code: int, body: str) -> None:
+        super().__init__(f"HTTP {status_code}: {body[:300]}")
+        self.status_code = status_code
+
+
+class ProviderClient:
+    def __init__(
+        self,
+        *,
+        base_url: str,
+        connect_timeout_s: float = 5.0,
+        read_timeout_s: float = 60.0,
+        retries: int = 2,
+        backoff_s: float = 0.5,
+        max_backoff_s: float = 8.0,
+        max_connections: int = 8,
+        user_agent: str = "FableFriend/1.0",
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.retries = max(0, int(retries))
+        self.backoff_s = float(backoff_s)
+        self.max_backoff_s = float(max_backoff_s)
+        self._client = httpx.Client(
+            timeout=httpx.Timeout(read_timeout_s, connect=connect_timeout_s),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            headers={"User-Agent": user_agent},
+            follow_redirects=True,
+        )
+        self._stats = {"requests": 0, "retries": 0, "failures": 0}
+        self._stats_lock = threading.Lock()
+
+    def url(self, path: str, params: dict[str, str] | None = None) -> str:
+        query = ("?" + urllib.parse.urlencode(params)) if params else ""
+        return f"{self.base_url}/{path.lstrip('/')}{query}"
+
+    def get_bytes(self, path: str, *, params: dict[str, str] | None = None, headers: dict[str, str] | None = None) -> tuple[bytes, str | None]:
+        """GET base_url/path; returns (body, content type). Raises after the last failed attempt."""
+        url = self.url(path, params)
+        attempt = 0
+        while True:
+            self._bump("requests")
+            try:
+                resp = self._client.get(url, headers=headers)
+                if resp.status_code < 400:
+                    return resp.content, resp.headers.get("Content-Type")
+                error: Exception = ProviderHTTPError(resp.status_code, resp.text)
+                retryable = resp.status_code in RETRY_STATUS
+                retry_after = _retry_after_s(resp.headers.get("Retry-After"))
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                error, retryable, retry_after = e, True, None
+            if not retryable or attempt >= self.retries:
+                self._bump("failures")
+                raise error
+            delay = random.uniform(0, min(self.max_backoff_s, self.backoff_s * (2 ** attempt)))
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, self.max_backoff_s))
+            attempt += 1
+            self._bump("retries")
+            print(f"[image_providers] {error}; retry {attempt}/{self.retries} in {delay:.2f}s")
+            time.sleep(delay)
+
+    def stats(self) -> dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def close(self) -> None:
+        self._client.close()
+
+    def _bump(self, key: str) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
+
+
+def _retry_after_s(value: str | None) -> float | None:
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+_POLLINATIONS: ProviderClient | None = None
+_HF_CLIENTS: dict[str, Any] = {}
+_LOCK = threading.Lock()
+
+
+def pollinations_client() -> ProviderClient:
+    """The process-wide Pollinations client (created on first use from the env)."""
+    global _POLLINATIONS
+    with _LOCK:
+        if _POLLINATIONS is None:
+            _POLLINATIONS = ProviderClient(
+                base_url=(os.environ.get("POLLINATIONS_BASE_URL") or DEFAULT_POLLINATIONS_BASE_URL).strip(),
+                connect_timeout_s=float(os.environ.get("IMAGE_HTTP_CONNECT_TIMEOUT_S") or "5"),
+                read_timeout_s=float(os.environ.get("IMAGE_HTTP_READ_TIMEOUT_S") or "60"),
+                retries=int(os.environ.get("IMAGE_HTTP_RETRIES") or "2"),
+                max_connections=int(os.environ.get("IMAGE_HTTP_MAX_CONNECTIONS") or "8"),
+            )
+        return _POLLINATIONS
+
+
+def pollinations_request(
+    prompt: str,
+    *,
+    model: str,
+    width: int,
+    height: int,
+    api_key: str = "",
+    seed: int | None = None,
+    enhance: bool | None = None,
+    safe: bool = True,
+) -> tuple[str, dict[str, str], dict[str, str]]:
+    """Return (path, query params, headers) for a Pollinations image request.
+
+    Auth: pk_ (publishable) keys go in the query, sk_ (secret) keys in a Bearer header.
+    """
+    path = "image/" + urllib.parse.quote((prompt or "").strip(), safe="")
+    params: dict[str, str] = {"model": model, "width": str(width), "height": str(height)}
+    if enhance is not None:
+        params["enhance"] = "true" if enhance else "false"
+    params["safe"] = "true" if safe else "false"
+    if seed is not None:
+        params["seed"] = str(seed)
+    headers: dict[str, str] = {"Accept": "image/*"}
+    api_key = (api_key or "").strip()
+    if api_key.startswith("sk_"):
+        headers["Authorization"] = f"Bearer {api_key}"
+    elif api_key.startswith("pk_"):
+        params["key"] = api_key
+    return path, params, headers
+
+
+def pollinations_image(prompt: str, **kwargs: Any) -> tuple[bytes, str | None]:
+    path, params, headers = pollinations_request(prompt, **kwargs)
+    return pollinations_client().get_bytes(path, params=params, headers=headers)
+
+
+def hf_client(token: str, provider: str = "nebius") -> Any:
+    """Shared huggingface_hub InferenceClient per (provider, token)."""
+    from huggingface_hub import InferenceClient
+
+    key = f"{provider}:{token}"
+    with _LOCK:
+        client = _HF_CLIENTS.get(key)
+        if client is None:
+            client = _HF_CLIENTS[key] = InferenceClient(
+                provider=provider,
+                api_key=token,
+                timeout=float(os.environ.get("IMAGE_HTTP_READ_TIMEOUT_S") or "60"),
+            )
+        return client
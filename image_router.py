@@ -0,0 +1,230 @@
+"""Route image requests across providers with hedging and a circuit breaker per provider.
+
+A provider is any callable `fn(prompt, *, width, height, seed) -> bytes` registered under a
+name, in order of preference, so tests and benchmarks can plug in local stubs.
+ImageRouter.generate sends the request to the first provider whose breaker is closed. If
+that request is still running after the provider's usual latency (a percentile of its
+recent successes), it fires the same request at the next provider and returns whichever
+succeeds first. A failure moves on to the next provider right away. The slower request
+can't be aborted mid-flight (the provider calls are blocking HTTP); a loser that hasn't
+started is cancelled, and one that is already running finishes in the background with its
+result discarded, but it still counts towards that provider's latency and breaker.
+
+The breaker opens after `failures` consecutive failures and skips the provider for
+`cooldown_s`; after that a single trial request decides whether it closes again. A trial
+that is cancelled before it starts gives its slot back.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+Provider = Callable[..., bytes]
+
+
+class CircuitBreaker:
+    def __init__(self, *, failures: int = 3, cooldown_s: float = 60.0) -> None:
+        self.failures = max(1, int(failures))
+        self.cooldown_s = float(cooldown_s)
+        self._consecutive = 0
+        self._opened_at: float | None = None
+        self._trial = False  # a half-open trial request is in flight
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state_locked(time.monotonic())
+
+    def allow(self) -> bool:
+        """True if a request may go out now (claims the half-open trial slot)."""
+        return self.claim() is not None
+
+    def claim(self) -> str | None:
+        """Like allow(), but says what was claimed: "closed", "trial", or None (blocked)."""
+        with self._lock:
+            state = self._state_locked(time.monotonic())
+            if state == "closed":
+                return "closed"
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return "trial"
+            return None
+
+    def release(self) -> None:
+        """Give back a trial slot whose request never ran (cancelled before it started)."""
+        with self._lock:
+            self._trial = False
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._trial = False
+            if ok:
+                self._consecutive = 0
+                self._opened_at = None
+                return
+            self._consecutive += 1
+            if self._opened_at is not None or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+
+    def _state_locked(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "open" if now - self._opened_at < self.cooldown_s else "half_open"
+
+
+class _ProviderState:
+    def __init__(self, name: str, fn: Provider, breaker: CircuitBreaker, window: int) -> None:
+        self.name = name
+        self.fn = fn
+        self.breaker = breaker
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.stats = {"requests": 0, "successes": 0, "failures": 0, "wins": 0, "hedges": 0, "skipped_open": 0}
+
+
+class ImageRouter:
+    def __init__(
+        self,
+        *,
+        hedge_percentile: float = 90.0,
+        hedge_min_samples: int = 5,
+        hedge_default_s: float = 10.0,
+        hedge_floor_s: float = 1.0,
+        breaker_failures: int = 3,
+        breaker_cooldown_s: float = 60.0,
+        latency_window: int = 50,
+        max_workers: int = 8,
+    ) -> None:
+        self.hedge_percentile = float(hedge_percentile)  # <= 0: no hedging, failover only
+        self.hedge_min_samples = max(1, int(hedge_min_samples))
+        self.hedge_default_s = float(hedge_default_s)
+        self.hedge_floor_s = float(hedge_floor_s)
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown_s = breaker_cooldown_s
+        self.latency_window = latency_window
+        self._providers: list[_ProviderState] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(2, int(max_workers)), thread_name_prefix="image-provider")
+
+    def add_provider(self, name: str, fn: Provider) -> None:
+        """Register (or replace) a provider; earlier registrations are preferred."""
+        breaker = CircuitBreaker(failures=self.breaker_failures, cooldown_s=self.breaker_cooldown_s)
+        state = _ProviderState(name, fn, breaker, self.latency_window)
+        with self._lock:
+            for i, existing in enumerate(self._providers):
+                if existing.name == name:
+                    self._providers[i] = state
+                    return
+            self._providers.append(state)
+
+    def provider_names(self) -> list[str]:
+        """Registered provider names, most preferred first."""
+        with self._lock:
+            return [p.name for p in self._providers]
+
+    def hedge_delay(self, name: str) -> float | None:
+        """Seconds to wait on `name` before hedging, or None when hedging is off."""
+        if self.hedge_percentile <= 0:
+            return None
+        with self._lock:
+            state = next((p for p in self._providers if p.name == name), None)
+            samples = sorted(state.latencies) if state else []
+        if len(samples) < self.hedge_min_samples:
+            return self.hedge_default_s
+        index = min(len(samples) - 1, int(round(self.hedge_percentile / 100.0 * (len(samples) - 1))))
+        return max(self.hedge_floor_s, samples[index])
+
+    def generate(self, prompt: str, **kwargs: Any) -> tuple[bytes, str]:
+        """Return (image bytes, provider name) from the first provider that succeeds."""
+        with self._lock:
+            candidates = list(self._providers)
+        pending: dict[Future, _ProviderState] = {}
+        trials: set[Future] = set()  # futures holding their breaker's half-open trial slot
+        errors: list[str] = []
+        hedge_at: float | None = None
+
+        def _launch() -> bool:
+            nonlocal hedge_at
+            while candidates:
+                state = candidates.pop(0)
+                claimed = state.breaker.claim()
+                if claimed is None:
+                    self._bump(state, "skipped_open")
+                    errors.append(f"{state.name}: circuit open")
+                    continue
+                if pending:
+                    self._bump(state, "hedges")
+                    print(f"[image_router] {state.name} hedging a slow request")
+                future = self._executor.submit(self._call, state, prompt, kwargs)
+                pending[future] = state
+                if claimed == "trial":
+                    trials.add(future)
+                delay = self.hedge_delay(state.name)
+                hedge_at = (time.monotonic() + delay) if delay is not None else None
+                return True
+            return False
+
+        if not _launch():
+            raise RuntimeError("no image provider available (" + "; ".join(errors or ["none registered"]) + ")")
+        while pending:
+            timeout = None if hedge_at is None or not candidates else max(0.0, hedge_at - time.monotonic())
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                _launch()  # the running request is slow: hedge with the next provider
+                continue
+            for future in done:
+                state = pending.pop(future)
+                try:
+                    data = future.result()
+                except Exception as e:
+                    errors.append(f"{state.name}: {e}")
+                    continue
+                for loser, loser_state in pending.items():
+                    # A loser cancelled before it started never reaches record(); hand its
+                    # trial slot back or the provider would stay half-open for good.
+                    if loser.cancel() and loser in trials:
+                        loser_state.breaker.release()
+                self._bump(state, "wins")
+                return data, state.name
+            if not pending:
+                _launch()  # everything in flight failed: fail over right away
+        raise RuntimeError("all image providers failed (" + "; ".join(errors) + ")")
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            providers = list(self._providers)
+        out: dict[str, dict[str, Any]] = {}
+        for state in providers:
+            with self._lock:
+                row: dict[str, Any] = dict(state.stats)
+                samples = sorted(state.latencies)
+            row["breaker"] = state.breaker.state
+            row["latency_p50_s"] = round(samples[len(samples) // 2], 3) if samples else None
+            row["hedge_after_s"] = self.hedge_delay(state.name)
+            out[state.name] = row
+        return out
+
+    def _call(self, state: _ProviderState, prompt: str, kwargs: dict) -> bytes:
+        self._bump(state, "requests")
+        started = time.monotonic()
+        try:
+            data = state.fn(prompt, **kwargs)
+            if not data:
+                raise RuntimeError("empty image")
+        except Exception:
+            state.breaker.record(False)
+            self._bump(state, "failures")
+            raise
+        state.breaker.record(True)
+        with self._lock:
+            state.latencies.append(time.monotonic() - started)
+            state.stats["successes"] += 1
+        return data
+
+    def _bump(self, state: _ProviderState, key: str) -> None:
+        with self._lock:
+            state.stats[key] += 1
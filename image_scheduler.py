@@ -0,0 +1,217 @@
+"""Process-wide scheduler for image generation jobs.
+
+Every image job (inline image node or ASYNC_IMAGES background job) goes through one
+ImageScheduler: a fixed set of worker threads draining a priority queue, so the number of
+concurrent image generations is bounded no matter how many sessions are playing. Intro
+and milestone images (PRIORITY_KEY) run before cadence images (PRIORITY_CADENCE).
+
+The queue is bounded. When it is full, drop_policy decides what gives: "oldest" drops the
+longest-waiting job of the lowest class (if it doesn't outrank the new one), "newest"
+rejects the incoming job unless it outranks something queued. A cadence job that waited
+longer than max_wait_s is dropped instead of started, since the player has moved on by
+then. Dropped jobs come back as cancelled futures.
+
+throttle(provider) is a token bucket per provider (requests per second), called right
+before each provider request. stats() reports queue depth, wait times, drops and
+throttling.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+PRIORITY_KEY = 0
+PRIORITY_CADENCE = 1
+_CLASS_NAMES = {PRIORITY_KEY: "key", PRIORITY_CADENCE: "cadence"}
+
+
+def parse_rate_limits(spec: str) -> dict[str, float]:
+    """"pollinations=2, hf=0.5" -> {"pollinations": 2.0, "hf": 0.5} (requests per second)."""
+    limits: dict[str, float] = {}
+    for part in (spec or "").split(","):
+        name, _, rate = part.partition("=")
+        try:
+            if name.strip() and float(rate) > 0:
+                limits[name.strip()] = float(rate)
+        except ValueError:
+            print(f"[image_scheduler] ignoring bad rate limit {part.strip()!r}")
+    return limits
+
+
+class RateLimiter:
+    """Token bucket: `rate` requests per second, bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int | None = None) -> None:
+        self.rate = float(rate)
+        self.burst = max(1, int(burst or math.ceil(self.rate)))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available; return the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "future", "fn", "args", "kwargs", "queued_at")
+
+    def __init__(self, priority: int, seq: int, fn: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.future: Future = Future()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.queued_at = time.monotonic()
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class ImageScheduler:
+    def __init__(
+        self,
+        *,
+        workers: int = 4,
+        max_queue: int = 32,
+        drop_policy: str = "oldest",
+        max_wait_s: float = 60.0,
+        rate_limits: dict[str, float] | None = None,
+    ) -> None:
+        self.workers = max(1, int(workers))
+        self.max_queue = int(max_queue)  # <= 0: unbounded
+        self.drop_policy = drop_policy if drop_policy in ("oldest", "newest") else "oldest"
+        self.max_wait_s = float(max_wait_s)  # <= 0: cadence jobs never go stale
+        self._limiters = {name: RateLimiter(rate) for name, rate in (rate_limits or {}).items()}
+        self._queue: list[_Job] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._running = 0
+        self._stats: dict[str, float] = {
+            "submitted": 0, "completed": 0, "failed": 0,
+            "dropped_queue_full": 0, "dropped_stale": 0, "cancelled": 0,
+        }
+        self._waits: dict[int, list[float]] = {p: [0, 0.0, 0.0] for p in _CLASS_NAMES}  # count, total, max
+        self._throttle: dict[str, list[float]] = {name: [0, 0, 0.0] for name in self._limiters}  # calls, waited, seconds
+
+    def submit(self, fn: Callable[..., Any], *args: Any, priority: int = PRIORITY_CADENCE, **kwargs: Any) -> Future:
+        """Queue fn(*args, **kwargs); the future is cancelled if the job gets dropped."""
+        job = _Job(priority, next(self._seq), fn, args, kwargs)
+        with self._cond:
+            self._stats["submitted"] += 1
+            self._start_workers_locked()
+            if 0 < self.max_queue <= len(self._queue):
+                victim = self._overflow_victim_locked(job)
+                if victim is job:
+                    self._drop_locked(job, "dropped_queue_full")
+                    return job.future
+                self._queue.remove(victim)
+                heapq.heapify(self._queue)
+                self._drop_locked(victim, "dropped_queue_full")
+            heapq.heappush(self._queue, job)
+            self._cond.notify()
+        return job.future
+
+    def throttle(self, provider: str) -> float:
+        """Block until `provider`'s rate limit allows another request; return the seconds waited."""
+        limiter = self._limiters.get(provider)
+        if limiter is None:
+            return 0.0
+        waited = limiter.acquire()
+        with self._cond:
+            row = self._throttle[provider]
+            row[0] += 1
+            row[1] += 1 if waited > 0 else 0
+            row[2] += waited
+        return waited
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            out: dict[str, Any] = dict(self._stats)
+            out["running"] = self._running
+            out["queued"] = len(self._queue)
+            for priority, name in _CLASS_NAMES.items():
+                count, total, longest = self._waits[priority]
+                out[f"queued_{name}"] = sum(1 for job in self._queue if job.priority == priority)
+                out[f"wait_{name}_mean_s"] = round(total / count, 3) if count else 0.0
+                out[f"wait_{name}_max_s"] = round(longest, 3)
+            out["throttle"] = {
+                name: {"requests": int(calls), "delayed": int(delayed), "waited_s": round(seconds, 3)}
+                for name, (calls, delayed, seconds) in self._throttle.items()
+            }
+        return out
+
+    def _overflow_victim_locked(self, incoming: _Job) -> _Job:
+        lowest = max(job.priority for job in self._queue)
+        if lowest < incoming.priority:
+            return incoming  # everything queued outranks it
+        candidates = [job for job in self._queue if job.priority == lowest]
+        if self.drop_policy == "oldest":
+            return min(candidates, key=lambda job: job.seq)
+        if lowest == incoming.priority:
+            return incoming
+        return max(candidates, key=lambda job: job.seq)
+
+    def _drop_locked(self, job: _Job, reason: str) -> None:
+        self._stats[reason] += 1
+        job.future.cancel()
+        print(f"[image_scheduler] {reason.replace('_', ' ')}: {_CLASS_NAMES.get(job.priority)} job ({len(self._queue)} queued)")
+
+    def _start_workers_locked(self) -> None:
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"image-job-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job = heapq.heappop(self._queue)
+                waited = time.monotonic() - job.queued_at
+                if job.priority != PRIORITY_KEY and 0 < self.max_wait_s < waited:
+                    self._drop_locked(job, "dropped_stale")
+                    continue
+                if not job.future.set_running_or_notify_cancel():
+                    self._stats["cancelled"] += 1
+                    continue
+                row = self._waits[job.priority]
+                row[0] += 1
+                row[1] += waited
+                row[2] = max(row[2], waited)
+                self._running += 1
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except BaseException as e:
+                job.future.set_exception(e)
+                ok = False
+            else:
+                job.future.set_result(result)
+                ok = True
+            with self._cond:
+                self._running -= 1
+                self._stats["completed" if ok else "failed"] += 1
@@ -0,0 +1,170 @@
+"""Pool of ready-made opening scenes, kept per role.
+
+Intros are written ahead of time with NAME_PLACEHOLDER in place of the hero's name and
+handed out once each (take() removes the entry), so a player never gets a repeat.
+A single background thread tops a role back up to `size` whenever stock drops, and the
+pool is saved to a JSON file after every change so it survives restarts. Entries older
+than max_age_s are dropped rather than served.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import queue
+import threading
+import time
+from typing import Callable
+
+NAME_PLACEHOLDER = "[[HERO_NAME]]"
+
+
+def fill_name(text: str, char_name: str) -> str:
+    return (text or "").replace(NAME_PLACEHOLDER, char_name)
+
+
+def _looks_usable(text: str) -> bool:
+    # The model sometimes mangles the placeholder ("[HERO_NAME]", "Hero_Name"); such an
+    # intro would leak it to the player after substitution, so it is thrown away.
+    leftover = (text or "").replace(NAME_PLACEHOLDER, "")
+    return bool(leftover.strip()) and "HERO_NAME" not in leftover.upper()
+
+
+class IntroPool:
+    def __init__(
+        self,
+        *,
+        generate: Callable[[str], str],
+        size: int = 2,
+        max_age_s: float = 7 * 24 * 3600,
+        path: str | None = None,
+    ) -> None:
+        self.generate = generate
+        self.size = max(0, int(size))
+        self.max_age_s = float(max_age_s)
+        self.path = path or None
+        self._entries: dict[str, list[dict]] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._pending: set[str] = set()
+        self._worker: threading.Thread | None = None
+        self._stats = {"hits": 0, "misses": 0, "generated": 0, "rejected": 0, "evicted": 0}
+        self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def available(self, role_id: str) -> int:
+        with self._lock:
+            self._evict_stale_locked()
+            return len(self._entries.get(role_id) or [])
+
+    def take(self, role_id: str) -> str | None:
+        """Pop the oldest fresh intro for role_id (placeholder still in it) and schedule a refill."""
+        if not self.enabled or not role_id:
+            return None
+        with self._lock:
+            self._evict_stale_locked()
+            stock = self._entries.get(role_id) or []
+            entry = stock.pop(0) if stock else None
+            self._stats["hits" if entry else "misses"] += 1
+        if entry is not None:
+            self._save()
+        self.refill(role_id)
+        return entry["text"] if entry else None
+
+    def refill(self, role_id: str) -> None:
+        """Queue role_id for the background worker if it is below `size`."""
+        if not self.enabled or not role_id:
+            return
+        with self._lock:
+            if role_id in self._pending or len(self._entries.get(role_id) or []) >= self.size:
+                return
+            self._pending.add(role_id)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="intro-pool", daemon=True)
+                self._worker.start()
+        self._queue.put(role_id)
+
+    def refill_known_roles(self) -> None:
+        """Top up every role that already has (or had) entries on disk."""
+        with self._lock:
+            roles = list(self._entries)
+        for role_id in roles:
+            self.refill(role_id)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            out = dict(self._stats)
+            out["stock"] = sum(len(v) for v in self._entries.values())
+            out["pending"] = len(self._pending)
+        return out
+
+    def _run(self) -> None:
+        while True:
+            role_id = self._queue.get()
+            try:
+                self._fill(role_id)
+            finally:
+                with self._lock:
+                    self._pending.discard(role_id)
+
+    def _fill(self, role_id: str) -> None:
+        failures = 0
+        while self.available(role_id) < self.size and failures < 3:
+            try:
+                text = self.generate(role_id)
+            except Exception as e:
+                failures += 1
+                print(f"[intro_pool] generation failed for {role_id}: {e}")
+                continue
+            if not _looks_usable(text):
+                failures += 1
+                with self._lock:
+                    self._stats["rejected"] += 1
+                continue
+            with self._lock:
+                self._entries.setdefault(role_id, []).append({"text": text, "created": time.time()})
+                self._stats["generated"] += 1
+            self._save()
+            print(f"[intro_pool] {role_id}: {self.available(role_id)}/{self.size} ready")
+
+    def _evict_stale_locked(self) -> None:
+        cutoff = time.time() - self.max_age_s
+        for role_id, stock in self._entries.items():
+            fresh = [e for e in stock if float(e.get("created") or 0) >= cutoff]
+            self._stats["evicted"] += len(stock) - len(fresh)
+            self._entries[role_id] = fresh
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entries = data.get("entries") if isinstance(data, dict) else None
+            if isinstance(entries, dict):
+                self._entries = {
+                    str(role_id): [e for e in stock if isinstance(e, dict) and _looks_usable(e.get("text") or "")]
+                    for role_id, stock in entries.items()
+                    if isinstance(stock, list)
+                }
+            with self._lock:
+                self._evict_stale_locked()
+        except Exception as e:
+            print(f"[intro_pool] could not load {self.path}: {e}")
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps({"entries": self._entries}, ensure_ascii=False)
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[intro_pool] failed to write {self.path}: {e}")
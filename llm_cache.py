@@ -0,0 +1,163 @@
+"""Exact-match response cache for small, repeatable chat model calls.
+
+Call sites opt in by going through LLMCache.invoke / ainvoke instead of model.invoke.
+The key is a sha256 of the model name, temperature, max_tokens, any per-call model
+kwargs (e.g. max_tokens=...) and the full message list (type + content), so only
+byte-identical requests hit; what comes back is an AIMessage with the cached text.
+Entries sit in an in-memory LRU and, when sqlite_path is set, in a
+SQLite table as well so they survive restarts. Each entry remembers the tokens and
+latency of the original call; stats() reports what hits saved, per call site.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage
+
+
+def _model_signature(model: Any) -> list:
+    name = getattr(model, "model_name", None) or getattr(model, "model", None) or type(model).__name__
+    return [str(name), getattr(model, "temperature", None), getattr(model, "max_tokens", None)]
+
+
+def _usage_tokens(message: Any) -> int:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return int(usage.get("total_tokens") or 0)
+
+
+class LLMCache:
+    def __init__(self, *, max_entries: int = 1000, sqlite_path: str | None = None) -> None:
+        self.max_entries = int(max_entries)
+        self.sqlite_path = sqlite_path or None
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self._stats: dict[str, dict[str, float]] = {}
+        if self.enabled and self.sqlite_path:
+            try:
+                self._db = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"[llm_cache] SQLite tier disabled ({self.sqlite_path}): {e}")
+                self._db = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def key(self, model: Any, messages: Sequence[BaseMessage], **kwargs: Any) -> str:
+        payload = json.dumps(
+            [_model_signature(model), sorted(kwargs.items()), [[m.type, m.content] for m in messages]],
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def invoke(self, model: Any, messages: Sequence[BaseMessage], *, site: str, **kwargs: Any) -> AIMessage:
+        if not self.enabled:
+            return model.invoke(list(messages), **kwargs)
+        key = self.key(model, messages, **kwargs)
+        hit = self._lookup(key, site)
+        if hit is not None:
+            return hit
+        started = time.perf_counter()
+        message = model.invoke(list(messages), **kwargs)
+        self._store(key, site, message, time.perf_counter() - started)
+        return message
+
+    async def ainvoke(self, model: Any, messages: Sequence[BaseMessage], *, site: str, **kwargs: Any) -> AIMessage:
+        if not self.enabled:
+            return await model.ainvoke(list(messages), **kwargs)
+        key = self.key(model, messages, **kwargs)
+        hit = self._lookup(key, site)
+        if hit is not None:
+            return hit
+        started = time.perf_counter()
+        message = await model.ainvoke(list(messages), **kwargs)
+        self._store(key, site, message, time.perf_counter() - started)
+        return message
+
+    def stats(self) -> dict[str, Any]:
+        """Per-site hits/misses plus tokens_saved and latency_saved_s, and a "total" row."""
+        with self._lock:
+            sites = {site: dict(row) for site, row in self._stats.items()}
+            entries = len(self._entries)
+        total = {"hits": 0, "misses": 0, "tokens_saved": 0, "latency_saved_s": 0.0}
+        for row in sites.values():
+            for k in total:
+                total[k] += row[k]
+        for row in list(sites.values()) + [total]:
+            lookups = row["hits"] + row["misses"]
+            row["hit_rate"] = (row["hits"] / lookups) if lookups else 0.0
+        return {"sites": sites, "total": total, "entries": entries}
+
+    def _site_stats(self, site: str) -> dict[str, float]:
+        row = self._stats.get(site)
+        if row is None:
+            row = self._stats[site] = {"hits": 0, "misses": 0, "tokens_saved": 0, "latency_saved_s": 0.0}
+        return row
+
+    def _lookup(self, key: str, site: str) -> AIMessage | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            entry = self._load(key)
+            if entry is not None:
+                self._remember(key, entry)
+        with self._lock:
+            row = self._site_stats(site)
+            if entry is None:
+                row["misses"] += 1
+                return None
+            row["hits"] += 1
+            row["tokens_saved"] += entry["tokens"]
+            row["latency_saved_s"] += entry["latency_s"]
+        return AIMessage(content=entry["content"])
+
+    def _store(self, key: str, site: str, message: Any, latency_s: float) -> None:
+        content = getattr(message, "content", message)
+        if not isinstance(content, str) or not content.strip():
+            return  # don't pin an empty or structured reply
+        entry = {"content": content, "tokens": _usage_tokens(message), "latency_s": round(latency_s, 4)}
+        self._remember(key, entry)
+        if self._db is None:
+            return
+        try:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(entry, ensure_ascii=False), time.time()),
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            print(f"[llm_cache] failed to write {site} entry: {e}")
+
+    def _remember(self, key: str, entry: dict) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, key: str) -> dict | None:
+        if self._db is None:
+            return None
+        try:
+            with self._lock:
+                row = self._db.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            return json.loads(row[0]) if row else None
+        except (sqlite3.Error, ValueError) as e:
+            print(f"[llm_cache] failed to read entry: {e}")
+            return None
@@ -5,6 +5,7 @@ Usage (PowerShell):
   python pol.py --prompt "a huge spaceship being pulled into a vortex, attacked by drones" --model zimage
 
 This downloads the generated image and saves it to frontend/runtime_images/.
+Set POLLINATIONS_BASE_URL to point it at a local stub server instead.
 """
 
 from __future__ import annotations
@@ -13,45 +14,13 @@ import argparse
 import os
 import sys
 import time
-import urllib.parse
-import urllib.request
-
-
-def _build_image_url(*, prompt: str, model: str, width: int, height: int, seed: int | None, enhance: bool, safe: bool, key_in_query: str | None) -> str:
-	base = "https://gen.pollinations.ai/image/"
-	# The API uses the prompt as part of the path.
-	prompt_path = urllib.parse.quote(prompt, safe="")
-	query: dict[str, str] = {
-		"model": model,
-		"width": str(width),
-		"height": str(height),
-		"enhance": "true" if enhance else "false",
-		"safe": "true" if safe else "false",
-	}
-	if seed is not None:
-		query["seed"] = str(seed)
-	if key_in_query:
-		query["key"] = key_in_query
-	return base + prompt_path + "?" + urllib.parse.urlencode(query)
-
 
-def _make_request(url: str, api_key: str | None) -> tuple[bytes, str | None]:
-	headers: dict[str, str] = {
-		"User-Agent": "FableFriend/1.0 (smoke test)",
-		"Accept": "image/*",
-	}
+from image_providers import pollinations_client, pollinations_request
 
-	# Pollinations auth (per docs):
-	# - pk_... publishable: pass as query param (?key=pk_...)
-	# - sk_... secret: pass as Authorization: Bearer sk_...
-	if api_key and api_key.startswith("sk_"):
-		headers["Authorization"] = f"Bearer {api_key}"
 
-	req = urllib.request.Request(url, headers=headers, method="GET")
-	with urllib.request.urlopen(req, timeout=60) as resp:
-		content_type = resp.headers.get("Content-Type")
-		data = resp.read()
-		return data, content_type
+def _make_request(path: str, params: dict[str, str], headers: dict[str, str]) -> tuple[bytes, str | None]:
+	headers = {**headers, "User-Agent": "FableFriend/1.0 (smoke test)"}
+	return pollinations_client().get_bytes(path, params=params, headers=headers)
 
 
 def main(argv: list[str]) -> int:
@@ -81,16 +50,18 @@ def main(argv: list[str]) -> int:
 
 	key_in_query = api_key if api_key.startswith("pk_") else None
 
-	url = _build_image_url(
-		prompt=args.prompt,
+	# Same request shape (and pk_/sk_ auth handling) as the app's image node.
+	path, params, headers = pollinations_request(
+		args.prompt,
 		model=args.model,
 		width=args.width,
 		height=args.height,
 		seed=args.seed,
 		enhance=(not args.no_enhance),
 		safe=(not args.unsafe),
-		key_in_query=key_in_query,
+		api_key=api_key,
 	)
+	url = pollinations_client().url(path, params)
 
 	print("Request URL (redacted key):")
 	if key_in_query:
@@ -100,7 +71,7 @@ def main(argv: list[str]) -> int:
 
 	start = time.time()
 	try:
-		data, content_type = _make_request(url, api_key)
+		data, content_type = _make_request(path, params, headers)
 	except Exception as e:
 		print(f"ERROR: request failed: {e}")
 		return 1
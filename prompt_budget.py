@@ -0,0 +1,164 @@
+"""Token budgets for the per-turn prompts.
+
+PromptCompiler.compile fills a str.format template, but first trims the variable-length
+sections (intro, running summary, recent scenes) until the estimated prompt fits the
+call's input budget. The lowest-priority section is cut first and never below its
+min_tokens. Intros keep their beginning, summaries and scenes keep their end. It also
+counts, per call name, how many tokens went in, were trimmed and came back, plus the
+input/cached token counts the provider reports (record_usage).
+output_cap turns a "12-18 sentences" style length rule into a max_tokens value;
+sentence_limit / count_sentences / cut_after_sentences let a caller stop a reply that runs
+far past its rule.
+
+Token counts are estimates (~4 characters per token); they only have to be consistent.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+from typing import Any, NamedTuple
+
+CHARS_PER_TOKEN = 4
+TOKENS_PER_SENTENCE = 40
+_SENTENCE_END = re.compile(r"[.!?…][\"')\]]?\s")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def trim_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """Cut text to about max_tokens, on a sentence boundary when one is close enough."""
+    text = (text or "").strip()
+    max_chars = max(0, int(max_tokens)) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= 0:
+        return ""
+    if keep == "tail":
+        cut = text[-max_chars:]
+        m = _SENTENCE_END.search(cut)
+        if m and m.end() < len(cut) // 2:
+            cut = cut[m.end():]
+        return "… " + cut.lstrip()
+    cut = text[:max_chars]
+    ends = list(_SENTENCE_END.finditer(cut))
+    if ends and ends[-1].end() > len(cut) // 2:
+        cut = cut[: ends[-1].end()]
+    return cut.rstrip() + " …"
+
+
+def sentence_limit(length_rule: str) -> int:
+    """The M of an "N-M sentences" length rule (6 when it has no number)."""
+    numbers = [int(n) for n in re.findall(r"\d+", length_rule or "")]
+    return max(numbers) if numbers else 6
+
+
+def output_cap(length_rule: str, *, reserve: int = 0, floor: int = 256) -> int:
+    """max_tokens for a "N-M sentences" length rule: M sentences plus `reserve` (e.g. reasoning)."""
+    return max(floor, sentence_limit(length_rule) * TOKENS_PER_SENTENCE + max(0, int(reserve)))
+
+
+def count_sentences(text: str) -> int:
+    """Finished sentences in text (a sentence counts once whitespace follows its end)."""
+    return len(_SENTENCE_END.findall(text or ""))
+
+
+def cut_after_sentences(text: str, sentences: int) -> str:
+    """text up to the end of its `sentences`-th sentence (all of it if it has fewer)."""
+    ends = list(_SENTENCE_END.finditer(text or ""))
+    if sentences <= 0 or len(ends) < sentences:
+        return text or ""
+    return text[: ends[sentences - 1].end()].rstrip()
+
+
+class Section(NamedTuple):
+    name: str  # template field it fills
+    text: str
+    priority: int  # lower is trimmed first
+    min_tokens: int = 0
+    keep: str = "head"  # "head" or "tail"
+
+
+class PromptCompiler:
+    def __init__(self, *, budgets: dict[str, int]) -> None:
+        self.budgets = {k: int(v) for k, v in budgets.items()}
+        self._stats: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def compile(
+        self,
+        call: str,
+        template: str,
+        sections: list[Section],
+        *,
+        budget: int | None = None,
+        record: bool = True,
+        **fields: Any,
+    ) -> str:
+        """Format template with fields plus sections, trimmed to the budget for `call` (<= 0: no limit).
+
+        `budget` overrides the configured one, e.g. for what is left after a prompt prefix.
+        record=False keeps the call out of stats() (work done ahead of time that may be thrown away).
+        """
+        texts = {s.name: (s.text or "") for s in sections}
+        sizes = {name: estimate_tokens(text) for name, text in texts.items()}
+        before = dict(sizes)
+        if budget is None:
+            budget = self.budgets.get(call, 0)
+        if budget > 0:
+            fixed = estimate_tokens(template.format(**fields, **{name: "" for name in texts}))
+            over = fixed + sum(sizes.values()) - budget
+            for section in sorted(sections, key=lambda s: s.priority):
+                if over <= 0:
+                    break
+                target = max(section.min_tokens, sizes[section.name] - over)
+                if target < sizes[section.name]:
+                    texts[section.name] = trim_to_tokens(texts[section.name], target, section.keep)
+                    over -= sizes[section.name] - estimate_tokens(texts[section.name])
+                    sizes[section.name] = estimate_tokens(texts[section.name])
+        prompt = template.format(**fields, **texts)
+        tokens = estimate_tokens(prompt)
+        trimmed = {name: (before[name], sizes[name]) for name in texts if sizes[name] < before[name]}
+        if trimmed:
+            detail = ", ".join(f"{name} {a}->{b}" for name, (a, b) in trimmed.items())
+            print(f"[prompt_budget] {call}: {tokens}/{budget} tokens ({detail})")
+        if not record:
+            return prompt
+        with self._lock:
+            row = self._row(call)
+            row["calls"] += 1
+            row["input_tokens"] += tokens
+            row["trimmed_tokens"] += sum(a - b for a, b in trimmed.values())
+        return prompt
+
+    def record_output(self, call: str, text: str, max_tokens: int | None = None) -> None:
+        with self._lock:
+            row = self._row(call)
+            row["output_tokens"] += estimate_tokens(text)
+            if max_tokens:
+                row["output_cap_tokens"] += int(max_tokens)
+
+    def record_usage(self, call: str, usage: dict | None) -> None:
+        """Add provider-reported usage (LangChain usage_metadata), including cached input tokens."""
+        if not usage:
+            return
+        cached = int(((usage.get("input_token_details") or {}).get("cache_read")) or 0)
+        with self._lock:
+            row = self._row(call)
+            row["reported_input_tokens"] += int(usage.get("input_tokens") or 0)
+            row["cached_input_tokens"] += cached
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            return {call: dict(row) for call, row in self._stats.items()}
+
+    def _row(self, call: str) -> dict[str, int]:
+        row = self._stats.get(call)
+        if row is None:
+            row = self._stats[call] = {
+                "calls": 0, "input_tokens": 0, "trimmed_tokens": 0, "output_tokens": 0, "output_cap_tokens": 0,
+                "reported_input_tokens": 0, "cached_input_tokens": 0,
+            }
+        return row
@@ -0,0 +1,103 @@
+"""Per-thread append-only archive of every scene, kept outside the graph state.
+
+The situation channel only keeps the last few scenes (SITUATION_WINDOW in app.py), so
+checkpoints stay the same size however long the story gets; the full text lives here.
+Scenes are numbered from 1 in the order the story told them. The open chapter is a plain
+list; close_chapter() (at milestone scenes) compacts it into one chapter record: the scene
+range, the running summary at that point and the scene texts as a single zlib blob.
+
+Writing scene n again (the thread was rewound) first drops scene n and everything after
+it, reopening closed chapters as needed, the same way TurnJournal treats rewound steps. A
+write that would leave a gap (the archive started mid-thread) is ignored.
+
+nbytes() is what the archive holds (scene text plus compressed chapters), so the session
+registry can count it towards its thread's memory.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import zlib
+from typing import Any
+
+
+class SceneArchive:
+    def __init__(self) -> None:
+        self._chapters: list[dict[str, Any]] = []  # {"first", "last", "summary", "blob"}
+        self._open: list[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._total_locked()
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the scenes and chapter records."""
+        with self._lock:
+            size = sum(len(text.encode("utf-8")) for text in self._open)
+            return size + sum(len(c["blob"]) + len(c["summary"].encode("utf-8")) for c in self._chapters)
+
+    def append(self, number: int, text: str) -> None:
+        with self._lock:
+            self._truncate_locked(number - 1)
+            if number != self._total_locked() + 1:
+                return
+            self._open.append(text)
+
+    def close_chapter(self, summary: str = "") -> dict[str, Any] | None:
+        """Compact the open scenes into a chapter record; returns its row (see chapters())."""
+        with self._lock:
+            if not self._open:
+                return None
+            last = self._total_locked()
+            chapter = {
+                "first": last - len(self._open) + 1,
+                "last": last,
+                "summary": summary,
+                "blob": zlib.compress(json.dumps(self._open).encode("utf-8")),
+            }
+            self._chapters.append(chapter)
+            self._open = []
+            return self._row(len(self._chapters) - 1, chapter)
+
+    def chapters(self) -> list[dict[str, Any]]:
+        """One row per closed chapter: number, scene range, summary and compressed size."""
+        with self._lock:
+            return [self._row(i, chapter) for i, chapter in enumerate(self._chapters)]
+
+    def scenes(self, first: int = 1, last: int | None = None) -> list[str]:
+        """Scene texts first..last (inclusive, default: through the newest scene)."""
+        with self._lock:
+            last = self._total_locked() if last is None else min(int(last), self._total_locked())
+            out: list[str] = []
+            for chapter in self._chapters:
+                if chapter["last"] >= first and chapter["first"] <= last:
+                    texts = json.loads(zlib.decompress(chapter["blob"]))
+                    lo, hi = max(first, chapter["first"]), min(last, chapter["last"])
+                    out.extend(texts[lo - chapter["first"] : hi - chapter["first"] + 1])
+            open_first = self._total_locked() - len(self._open) + 1
+            for number in range(max(first, open_first), last + 1):
+                out.append(self._open[number - open_first])
+            return out
+
+    def _total_locked(self) -> int:
+        return (self._chapters[-1]["last"] if self._chapters else 0) + len(self._open)
+
+    def _truncate_locked(self, keep: int) -> None:
+        while self._total_locked() > max(0, keep):
+            if not self._open:
+                # Rewound into a closed chapter: reopen it.
+                self._open = json.loads(zlib.decompress(self._chapters.pop()["blob"]))
+                continue
+            del self._open[max(0, len(self._open) - (self._total_locked() - keep)) :]
+
+    @staticmethod
+    def _row(index: int, chapter: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "chapter": index + 1,
+            "first": chapter["first"],
+            "last": chapter["last"],
+            "summary": chapter["summary"],
+            "bytes": len(chapter["blob"]),
+        }
@@ -0,0 +1,104 @@
+"""Stub chat model and environment shared by the check_*.py and bench_*.py scripts.
+
+Call stub_env() before importing app: the graph and its settings are read at import time.
+Then swap the models for a StubChat, e.g. `fable.llm = fable.llm2 = StubChat(reply=_reply)`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import tempfile
+import time
+from typing import Any, Callable
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Holds the scripts' chat images and image cache; removed when the process exits.
+RUNTIME_DIR: tempfile.TemporaryDirectory | None = None
+
+
+def stub_env(**overrides: str | None) -> None:
+    """Turn off the background work a script doesn't exercise and keep its files out of frontend/.
+
+    Intros come from the model (no pool, no prefetch), speculative Continue is off, images
+    are generated inline and the judge always asks the model. `overrides` set any other
+    variable; None leaves that variable as the environment has it.
+    """
+    global RUNTIME_DIR
+    os.environ.setdefault("GROQ_API_KEY", "stub")
+    settings: dict[str, str | None] = {
+        "INTRO_POOL_SIZE": "0",
+        "INTRO_PREFETCH": "0",
+        "SPECULATIVE_CONTINUE": "0",
+        "ASYNC_IMAGES": "0",
+        "JUDGER_FAST_PATH": "off",
+    }
+    settings.update(overrides)
+    for name, value in settings.items():
+        if value is not None:
+            os.environ[name] = value
+    if RUNTIME_DIR is None:
+        RUNTIME_DIR = tempfile.TemporaryDirectory(prefix="fable-stub-")
+    os.environ["RUNTIME_IMAGES_DIR"] = os.path.join(RUNTIME_DIR.name, "runtime_images")
+    os.environ["IMAGE_CACHE_DIR"] = os.path.join(RUNTIME_DIR.name, "image_cache")
+
+
+def prompt_text(messages: list) -> str:
+    return "\n".join(str(m.content) for m in messages)
+
+
+class StubChat(BaseChatModel):
+    """Chat model stub: `reply(prompt text)` returns the answer, or (latency_s, answer).
+
+    The latency (latency_s unless the reply gives one) is slept before answering, with
+    asyncio.sleep on the async paths so a waiting call holds no thread; streaming yields
+    the answer word by word over that time.
+    """
+
+    reply: Callable[[str], Any]
+    latency_s: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _answer(self, messages: list) -> tuple[float, str]:
+        out = self.reply(prompt_text(messages))
+        return out if isinstance(out, tuple) else (self.latency_s, out)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        latency, text = self._answer(messages)
+        if latency:
+            time.sleep(latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        latency, text = self._answer(messages)
+        if latency:
+            await asyncio.sleep(latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        latency, text = self._answer(messages)
+        words = _words(text)
+        for word in words:
+            if latency:
+                time.sleep(latency / len(words))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        latency, text = self._answer(messages)
+        words = _words(text)
+        for word in words:
+            if latency:
+                await asyncio.sleep(latency / len(words))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+
+def _words(text: str) -> list[str]:
+    # Each piece keeps its trailing space, so the chunks join back to exactly `text`.
+    return [word for word in re.split(r"(?<= )", text) if word] or [""]
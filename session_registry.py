@@ -0,0 +1,184 @@
+"""Bounded registry of per-thread session meta (what used to be the THREAD_META dict).
+
+Keys are hashed onto shards, each with its own lock and LRU order, so concurrent Gradio
+workers touching different threads don't contend. Each shard gets an equal slice of
+max_entries / max_bytes. Entry sizes are measured with deep_sizeof whenever an entry is
+put (handlers put their meta back after every turn), plus attached_size(key) for memory a
+key holds outside its entry (per-thread logs that go when the entry does), and entries idle
+for longer than ttl_s expire. Evicted or discarded entries are handed to the on_evict callbacks
+(key, value, reason) outside of any shard lock.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Iterator
+
+EvictCallback = Callable[[str, Any, str], None]
+
+
+def deep_sizeof(obj: Any, _seen: set[int] | None = None) -> int:
+    """Approximate bytes held by plain containers/strings; other objects count shallowly."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += deep_sizeof(k, seen) + deep_sizeof(v, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deep_sizeof(item, seen)
+    return size
+
+
+class _Shard:
+    __slots__ = ("lock", "entries", "bytes")
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # key -> [value, size, last_used]
+        self.entries: OrderedDict[str, list] = OrderedDict()
+        self.bytes = 0
+
+
+class SessionRegistry:
+    def __init__(
+        self,
+        *,
+        shards: int = 16,
+        max_entries: int = 1000,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_s: float = 6 * 3600,
+        size_of: Callable[[Any], int] = deep_sizeof,
+        attached_size: Callable[[str], int] | None = None,
+    ) -> None:
+        self._shards = [_Shard() for _ in range(max(1, int(shards)))]
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self.ttl_s = float(ttl_s)
+        self.size_of = size_of
+        self.attached_size = attached_size
+        self._callbacks: list[EvictCallback] = []
+        self._stats = {"evicted_lru": 0, "evicted_ttl": 0, "evicted_memory": 0, "discarded": 0}
+        self._stats_lock = threading.Lock()
+
+    def on_evict(self, callback: EvictCallback) -> EvictCallback:
+        self._callbacks.append(callback)
+        return callback
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[zlib.crc32((key or "").encode("utf-8")) % len(self._shards)]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the entry and mark it recently used; expired entries are evicted instead."""
+        shard = self._shard(key)
+        expired = None
+        with shard.lock:
+            slot = shard.entries.get(key)
+            if slot is None:
+                return default
+            if self.ttl_s > 0 and time.time() - slot[2] > self.ttl_s:
+                expired = self._remove_locked(shard, key)
+            else:
+                slot[2] = time.time()
+                shard.entries.move_to_end(key)
+                return slot[0]
+        self._notify([(key, expired, "ttl")])
+        return default
+
+    def put(self, key: str, value: Any) -> None:
+        """Insert or refresh an entry, re-measuring its size, then enforce the limits."""
+        size = self.size_of(value) + (self.attached_size(key) if self.attached_size is not None else 0)
+        shard = self._shard(key)
+        with shard.lock:
+            old = shard.entries.pop(key, None)
+            if old is not None:
+                shard.bytes -= old[1]
+            shard.entries[key] = [value, size, time.time()]
+            shard.bytes += size
+            victims = self._enforce_locked(shard, keep=key)
+        self._notify(victims)
+
+    def discard(self, key: str, reason: str = "discarded") -> Any:
+        """Remove an entry on purpose (e.g. back to menu); callbacks still run."""
+        shard = self._shard(key)
+        with shard.lock:
+            if key not in shard.entries:
+                return None
+            value = self._remove_locked(shard, key)
+        self._notify([(key, value, reason)])
+        return value
+
+    def sweep(self) -> int:
+        """Drop every expired entry; returns how many were evicted."""
+        victims = []
+        for shard in self._shards:
+            with shard.lock:
+                victims.extend(self._enforce_locked(shard, keep=None))
+        self._notify(victims)
+        return len(victims)
+
+    def __contains__(self, key: object) -> bool:
+        if not isinstance(key, str):
+            return False
+        shard = self._shard(key)
+        with shard.lock:
+            return key in shard.entries
+
+    def __len__(self) -> int:
+        return sum(len(s.entries) for s in self._shards)
+
+    def keys(self) -> Iterator[str]:
+        for shard in self._shards:
+            with shard.lock:
+                keys = list(shard.entries)
+            yield from keys
+
+    def stats(self) -> dict[str, int]:
+        with self._stats_lock:
+            out = dict(self._stats)
+        out["entries"] = len(self)
+        out["bytes"] = sum(s.bytes for s in self._shards)
+        return out
+
+    def _remove_locked(self, shard: _Shard, key: str) -> Any:
+        value, size, _ = shard.entries.pop(key)
+        shard.bytes -= size
+        return value
+
+    def _enforce_locked(self, shard: _Shard, keep: str | None) -> list[tuple[str, Any, str]]:
+        victims: list[tuple[str, Any, str]] = []
+        if self.ttl_s > 0:
+            cutoff = time.time() - self.ttl_s
+            for key in [k for k, slot in shard.entries.items() if slot[2] < cutoff and k != keep]:
+                victims.append((key, self._remove_locked(shard, key), "ttl"))
+        n = len(self._shards)
+        max_entries = max(1, self.max_entries // n)
+        max_bytes = self.max_bytes // n
+        # Oldest first; the entry that was just put is never its own victim.
+        for key in list(shard.entries):
+            over_count = len(shard.entries) > max_entries
+            over_bytes = bool(self.max_bytes) and shard.bytes > max_bytes
+            if not (over_count or over_bytes):
+                break
+            if key == keep:
+                continue
+            victims.append((key, self._remove_locked(shard, key), "lru" if over_count else "memory"))
+        return victims
+
+    def _notify(self, victims: list[tuple[str, Any, str]]) -> None:
+        for key, value, reason in victims:
+            with self._stats_lock:
+                stat = "discarded" if reason not in ("lru", "ttl", "memory") else f"evicted_{reason}"
+                self._stats[stat] += 1
+            for callback in self._callbacks:
+                try:
+                    callback(key, value, reason)
+                except Exception as e:
+                    print(f"[session_registry] eviction callback failed for {key}: {e}")
@@ -0,0 +1,54 @@
+"""Request-scoped memo of LangGraph state snapshots.
+
+One chat request reads the thread's state several times: is the pinned config still at an
+interrupt, which interrupt to resume, what is the newest checkpoint after the run, and the
+speculation started from it. Every app.get_state deserializes all channels, including the
+growing situation list and image bytes. StateSnapshots keeps each snapshot it reads under
+its checkpoint id (and the thread's newest one under the bare thread config as well) until
+invalidate(), which callers run after anything that writes checkpoints or pending writes
+(app.stream, update_state, clearing pending writes).
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+
+def _key(cfg: Any) -> tuple[str, str, str | None] | None:
+    configurable = cfg.get("configurable") if isinstance(cfg, dict) else None
+    if not isinstance(configurable, dict) or not configurable.get("thread_id"):
+        return None
+    checkpoint_id = configurable.get("checkpoint_id")
+    return (
+        str(configurable["thread_id"]),
+        str(configurable.get("checkpoint_ns") or ""),
+        str(checkpoint_id) if checkpoint_id else None,
+    )
+
+
+class StateSnapshots:
+    def __init__(self, graph: Any, *, enabled: bool = True) -> None:
+        self.graph = graph
+        self.enabled = enabled
+        self._snapshots: dict[tuple, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cfg: dict) -> Any:
+        """graph.get_state(cfg), served from memory when this request already read it."""
+        key = _key(cfg)
+        if self.enabled and key is not None and key in self._snapshots:
+            self.hits += 1
+            return self._snapshots[key]
+        snapshot = self.graph.get_state(cfg)
+        self.misses += 1
+        if self.enabled and key is not None:
+            self._snapshots[key] = snapshot
+            # A read of the newest checkpoint also answers reads of it by id.
+            own = _key(getattr(snapshot, "config", None))
+            if own is not None:
+                self._snapshots[own] = snapshot
+        return snapshot
+
+    def invalidate(self) -> None:
+        self._snapshots.clear()
@@ -0,0 +1,238 @@
+"""Branch tree of a thread's turns, so rewound-away turns stay reachable.
+
+Every node is the story right after a turn: the turn record, the player's action, the
+image it produced, the interrupt checkpoint config to resume from and whether the story
+had ended. The root is the opening. Rewinding moves the current pointer to the parent
+and keeps the child, so the next turn from there becomes a sibling branch. Switching
+to any node is a pointer move. All branches live in the same LangGraph thread, so they
+share the checkpoints of their common prefix, and resuming from an older checkpoint only
+writes new ones (copy-on-write).
+
+Each node keeps the chat history as a delta against its parent (how many of the
+parent's items it keeps, plus copies of the items after that), so history(node) is
+rebuilt from the stored outputs without touching the graph or a model.
+
+The current path is kept as a list as well, so at_turn(n) finds the node to jump back to
+for any depth with one index lookup.
+
+Bounded by max_nodes: the least recently visited leaf that is not on the current path
+goes first; if only the current path is left, the root moves down it.
+"""
+
+from __future__ import annotations
+
+import copy
+import itertools
+import sys
+from typing import Any
+
+
+class StoryNode:
+    __slots__ = ("id", "parent", "turn", "children", "record", "action", "image", "cfg", "ended", "keep", "tail", "visited")
+
+    def __init__(self, node_id: str, parent: str | None, *, record: dict | None, action: str | None, image: Any, cfg: Any, ended: bool) -> None:
+        self.id = node_id
+        self.parent = parent
+        self.turn = 0  # turns played since the opening
+        self.children: list[str] = []
+        self.record = record
+        self.action = action
+        self.image = image
+        self.cfg = cfg
+        self.ended = ended
+        self.keep = 0  # items of the parent's history this node starts with
+        self.tail: list[Any] = []  # items after those
+        self.visited = 0
+
+
+def _common_prefix(a: list[Any], b: list[Any]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class StoryTree:
+    def __init__(self, *, max_nodes: int = 200) -> None:
+        self.max_nodes = max(2, int(max_nodes))
+        self.nodes: dict[str, StoryNode] = {}
+        self.root: str | None = None
+        self.current: str | None = None
+        self._path: list[str] = []  # root .. current, so at_turn() is an index lookup
+        self._ids = itertools.count()
+        self._clock = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __sizeof__(self) -> int:
+        # Lets the session registry's deep_sizeof account for the stored histories.
+        size = object.__sizeof__(self)
+        for node in self.nodes.values():
+            size += 200 + sum(sys.getsizeof(str(item)) for item in node.tail)
+        return size
+
+    def start(self, *, cfg: Any, image: Any, history: list[Any]) -> str:
+        """Reset the tree to a single root node (the opening)."""
+        self.nodes.clear()
+        node = self._new(None, record=None, action=None, image=image, cfg=cfg, ended=False)
+        node.tail = copy.deepcopy(list(history or []))
+        self.root = self.current = node.id
+        self._path = [node.id]
+        return node.id
+
+    def advance(self, *, record: dict, action: str | None, image: Any, cfg: Any, ended: bool, history: list[Any]) -> str:
+        """Add the turn just played as a child of the current node and move onto it."""
+        if self.current is None:
+            raise RuntimeError("story tree has no root; call start() first")
+        parent = self.nodes[self.current]
+        node = self._new(parent.id, record=record, action=action, image=image, cfg=cfg, ended=ended)
+        node.turn = parent.turn + 1
+        parent.children.append(node.id)
+        self._set_history(node, history)
+        self.current = node.id
+        self._path.append(node.id)
+        self._evict()
+        return node.id
+
+    def remember_history(self, history: list[Any]) -> None:
+        """Store what the chat shows for the current node (e.g. after a late image arrived)."""
+        if self.current is None:
+            return
+        node = self.nodes[self.current]
+        if self.history(node.id) == list(history or []):
+            return
+        for child in node.children:
+            # Children are stored relative to this node's history; pin them first.
+            self._absolutize(self.nodes[child])
+        self._set_history(node, history)
+
+    def rewind(self) -> str | None:
+        """Move to the parent node, keeping the current one as a branch; return the parent id."""
+        node = self.nodes.get(self.current or "")
+        if node is None or node.parent is None:
+            return None
+        return self.switch(node.parent).id
+
+    def switch(self, node_id: str) -> StoryNode:
+        node = self.nodes[node_id]
+        path = self.path(node.id)
+        self.current = node.id
+        for n in path:
+            n.visited = next(self._clock)
+        self._path = [n.id for n in path]
+        return node
+
+    def at_turn(self, turn: int) -> StoryNode | None:
+        """The node on the current path right after `turn` (0: the opening), or None."""
+        if not self._path:
+            return None
+        index = int(turn) - self.nodes[self._path[0]].turn
+        return self.nodes[self._path[index]] if 0 <= index < len(self._path) else None
+
+    def redo_target(self) -> str | None:
+        """The most recently visited child of the current node (what a rewind left behind)."""
+        node = self.nodes.get(self.current or "")
+        if node is None or not node.children:
+            return None
+        return max(node.children, key=lambda cid: self.nodes[cid].visited)
+
+    def path(self, node_id: str | None = None) -> list[StoryNode]:
+        """Nodes from the root to node_id (default: the current node)."""
+        if node_id is None or node_id == self.current:
+            return [self.nodes[i] for i in self._path]
+        out: list[StoryNode] = []
+        node = self.nodes.get(node_id or self.current or "")
+        while node is not None:
+            out.append(node)
+            node = self.nodes.get(node.parent) if node.parent else None
+        out.reverse()
+        return out
+
+    def find(self, record: dict | None) -> StoryNode | None:
+        """The node created for a turn record (None: the root)."""
+        if record is None:
+            return self.nodes.get(self.root or "")
+        return next((n for n in self.nodes.values() if n.record is record), None)
+
+    def history(self, node_id: str | None = None) -> list[Any]:
+        items: list[Any] = []
+        for node in self.path(node_id):
+            items = items[: node.keep] + node.tail
+        return copy.deepcopy(items)
+
+    def branches(self) -> list[dict[str, Any]]:
+        """One row per leaf: id, depth, whether it is on the current path, and its last action."""
+        on_path = {n.id for n in self.path()}
+        rows = []
+        for node in self.nodes.values():
+            if node.children:
+                continue
+            rows.append({
+                "id": node.id,
+                "depth": len(self.path(node.id)) - 1,
+                "current": node.id in on_path,
+                "action": node.action,
+                "ended": node.ended,
+            })
+        return rows
+
+    def checkpoint_configs(self) -> list[Any]:
+        """Interrupt configs some node can resume from (for checkpoint pruning)."""
+        cfgs: list[Any] = []
+        for node in self.nodes.values():
+            cfgs.append(node.cfg)
+            if isinstance(node.record, dict):
+                cfgs.append(node.record.get("cfg_before"))
+        return [c for c in cfgs if c]
+
+    def _new(self, parent: str | None, **fields: Any) -> StoryNode:
+        node = StoryNode(f"n{next(self._ids)}", parent, **fields)
+        node.visited = next(self._clock)
+        self.nodes[node.id] = node
+        return node
+
+    def _set_history(self, node: StoryNode, history: list[Any]) -> None:
+        history = list(history or [])
+        base = self.history(node.parent) if node.parent else []
+        node.keep = _common_prefix(base, history)
+        node.tail = copy.deepcopy(history[node.keep:])
+
+    def _absolutize(self, node: StoryNode) -> None:
+        full = self.history(node.id)
+        node.keep, node.tail = 0, full
+
+    def _evict(self) -> None:
+        while len(self.nodes) > self.max_nodes:
+            on_path = {n.id for n in self.path()}
+            leaves = [n for n in self.nodes.values() if not n.children and n.id not in on_path]
+            if leaves:
+                self._remove(min(leaves, key=lambda n: n.visited))
+                continue
+            # Only the current path is left: drop the root and re-root one step down.
+            root = self.nodes[self.root or ""]
+            nxt = self.path()[1]
+            self._absolutize(nxt)
+            self._path.pop(0)
+            for child in list(root.children):
+                if child != nxt.id:
+                    self._remove_subtree(child)
+            del self.nodes[root.id]
+            nxt.parent = None
+            self.root = nxt.id
+
+    def _remove(self, node: StoryNode) -> None:
+        del self.nodes[node.id]
+        parent = self.nodes.get(node.parent or "")
+        if parent is not None:
+            parent.children.remove(node.id)
+
+    def _remove_subtree(self, node_id: str) -> None:
+        node = self.nodes.get(node_id)
+        if node is None:
+            return
+        for child in list(node.children):
+            self._remove_subtree(child)
+        self._remove(node)
@@ -0,0 +1,80 @@
+"""Per-thread journal of graph node outputs, for rebuilding a thread without model calls.
+
+Outputs are keyed by step: the length of the story's action log (your_action) when the node
+ran, together with the last action in it. The player's input and the judge's resolved
+action both extend the log, so a turn is two steps: the judge runs right after the input,
+the storyteller, image and bookkeeping nodes after the resolved action; the opening is
+step 0. The journal keeps what each node returned at each step (scene, adjudication
+Command, summary/bookkeeping update, image update with its blob hash). Recording a step
+again drops every later step (they were rewound away), and a different action there
+replaces the step itself.
+
+replay(step, action, node) hands back a copy of a recorded output only while the replayed
+actions match the recorded ones; past the end of the journal, or once an action differs,
+it returns None and the node runs live.
+
+nbytes() is the pickled size of the recorded outputs, so the session registry can count the
+journal towards its thread's memory.
+"""
+
+from __future__ import annotations
+
+import copy
+import pickle
+import sys
+import threading
+from typing import Any
+
+
+class TurnJournal:
+    def __init__(self) -> None:
+        self._steps: list[dict[str, Any]] = []  # {"action", "outputs": {node: output}, "bytes": {node: n}}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._steps)
+
+    def actions(self, node: str) -> list[str]:
+        """Actions of the steps where `node` ran, in order (for the judge: the player's inputs)."""
+        with self._lock:
+            return [step["action"] for step in self._steps if node in step["outputs"] and step["action"] is not None]
+
+    def record(self, step: int, action: str | None, node: str, output: Any) -> None:
+        with self._lock:
+            if step > len(self._steps):
+                return  # a gap (journal started mid-thread); nothing consistent to add to
+            # Only the newest step of a thread runs, so anything after `step` was rewound away.
+            del self._steps[step + 1:]
+            if step < len(self._steps) and self._steps[step]["action"] != action:
+                del self._steps[step:]
+            if step == len(self._steps):
+                self._steps.append({"action": action, "outputs": {}, "bytes": {}})
+            self._steps[step]["outputs"][node] = copy.deepcopy(output)
+            self._steps[step]["bytes"][node] = _pickled_size(output)
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the recorded outputs."""
+        with self._lock:
+            return sum(sum(step["bytes"].values()) for step in self._steps)
+
+    def replay(self, step: int, action: str | None, node: str) -> Any:
+        with self._lock:
+            if step >= len(self._steps) or self._steps[step]["action"] != action:
+                return None
+            if node not in self._steps[step]["outputs"]:
+                return None
+            return copy.deepcopy(self._steps[step]["outputs"][node])
+
+    def copy(self) -> "TurnJournal":
+        other = TurnJournal()
+        with self._lock:
+            other._steps = copy.deepcopy(self._steps)
+        return other
+
+
+def _pickled_size(output: Any) -> int:
+    try:
+        return len(pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(output)